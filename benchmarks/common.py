@@ -0,0 +1,149 @@
+'''
+Helpers shared by the benchmarks: running the stand-in broker in a process of its own,
+parsing the common command-line options, and writing the results as JSON.
+'''
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# run against the checkout the benchmarks are in, rather than whichever asynqp is installed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import asynqp  # noqa
+from asynqp.broker import Broker  # noqa
+from asynqp.exceptions import ConnectionClosedError  # noqa
+
+
+# big enough for any frame_max the benchmarks ask for; the client's request wins
+BROKER_FRAME_MAX = 2 ** 24
+
+
+def serve(pipe):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    broker = Broker(frame_max=BROKER_FRAME_MAX, loop=loop)
+    pipe.send(loop.run_until_complete(broker.start()))
+    loop.run_forever()
+
+
+class BrokerProcess(object):
+    """
+    Runs a stand-in broker in a child process, so that it doesn't share the
+    benchmark's event loop (or its CPU) with the client being measured.
+    """
+    def __enter__(self):
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(child,), daemon=True)
+        self.process.start()
+        if not parent.poll(10):
+            self.process.terminate()
+            raise RuntimeError("The broker didn't start")
+        return parent.recv()
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+
+def parse_args(description, add_arguments=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--broker', metavar='HOST:PORT',
+                        help='measure against this broker instead of starting a stand-in one')
+    parser.add_argument('--output', '-o', metavar='FILE',
+                        help='write the results to this file as JSON (default: standard output)')
+    parser.add_argument('--quick', action='store_true',
+                        help='send fewer messages, for a rough answer in a few seconds')
+    parser.add_argument('--repeat', type=int, default=1, metavar='N',
+                        help='run each scenario N times and report the median')
+    parser.add_argument('--only', action='append', default=[], metavar='KEY=VALUE',
+                        help='only run scenarios with this setting, such as workload=publish (may be repeated)')
+    if add_arguments is not None:
+        add_arguments(parser)
+    return parser.parse_args()
+
+
+def broker_address(args):
+    """A context manager whose value is the (host, port) of the broker to measure against."""
+    if args.broker is None:
+        return BrokerProcess()
+    host, _, port = args.broker.rpartition(':')
+    return Given((host or 'localhost', int(port)))
+
+
+class Given(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __enter__(self):
+        return self.value
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def selected(scenario, only):
+    for condition in only:
+        key, _, value = condition.partition('=')
+        if str(scenario.get(key)) != value:
+            return False
+    return True
+
+
+def make_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def ignore_closed_connections(loop, context):
+        if not isinstance(context.get('exception'), ConnectionClosedError):
+            loop.default_exception_handler(context)
+    loop.set_exception_handler(ignore_closed_connections)
+    return loop
+
+
+def median_run(runs, key):
+    """The run whose ``key`` is the median of all of the runs'."""
+    value = statistics.median_low([run[key] for run in runs])
+    return next(run for run in runs if run[key] == value)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(args):
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'broker': args.broker or 'stand-in',
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def write_results(args, benchmark, results):
+    document = {'benchmark': benchmark, 'environment': environment(args), 'results': results}
+    if args.output is None:
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def report(line):
+    # progress goes to stderr so that it doesn't get mixed up with the JSON
+    print(line, file=sys.stderr, flush=True)
@@ -0,0 +1,51 @@
+'''
+Compare two sets of benchmark results written by the other scripts in this directory::
+
+    python benchmarks/compare.py before.json after.json
+
+Scenarios are matched on their settings. For each one, the chosen measure
+(``messages_per_second`` for throughput results and ``p99`` for latency results by default;
+``--measure`` picks another) is printed from both files along with the change.
+'''
+import argparse
+import json
+
+
+MEASUREMENTS = {
+    'messages', 'seconds', 'messages_per_second', 'mb_per_second',
+    'received', 'achieved_rate', 'p50', 'p90', 'p99', 'p999', 'max', 'mean', 'uncorrected', 'by_size',
+}
+DEFAULT_MEASURES = {'throughput': 'messages_per_second', 'latency': 'p99'}
+
+
+def settings(result):
+    return tuple(sorted((k, v) for k, v in result.items() if k not in MEASUREMENTS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two sets of benchmark results.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--measure',
+                        help='the measurement to compare (default: messages_per_second, or p99 for latency results)')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    measure = args.measure or DEFAULT_MEASURES.get(before['benchmark'], 'messages_per_second')
+
+    print('{} -> {}'.format(before['environment'].get('revision'), after['environment'].get('revision')))
+    previous = {settings(r): r for r in before['results']}
+    for result in after['results']:
+        old = previous.get(settings(result))
+        if old is None or old.get(measure) is None or result.get(measure) is None:
+            continue
+        change = (result[measure] - old[measure]) / old[measure] * 100 if old[measure] else float('nan')
+        label = ' '.join('{}={}'.format(k, v) for k, v in settings(result) if v is not None)
+        print('{:<90} {:>14.2f} {:>14.2f} {:>+8.1f}%'.format(label, old[measure], result[measure], change))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+'''
+Measure the time from publishing a message to its delivery, at a fixed offered load.
+
+Messages are published on an open-loop schedule: the ``n``-th message is due ``n / rate`` seconds
+after the start, whether or not the earlier ones have got through. If the publisher falls behind,
+it sends the overdue messages as soon as it can. Each message carries the time it was due and the
+time it was actually sent in its headers, and the consumer (in the same process, so the clocks agree)
+records how long each took to arrive in an HDR-style :class:`asynqp.Histogram`.
+
+Latencies are measured from the time each message was due rather than the time it was sent.
+Otherwise, a stall in the publisher would hold back the messages which should have been sent
+during it and leave them out of the measurements, hiding exactly the delays we want to see
+(the "coordinated omission" problem). The latencies measured from the actual send times are
+reported too, under ``uncorrected``; a large gap between the two means the publisher couldn't keep up.
+
+Scenarios:
+
+``small``
+    100-byte messages on one channel
+``mixed``
+    100-byte messages with a 1 MiB message every hundredth one, on one channel,
+    so small messages queue behind large ones
+``mixed-channels``
+    the same messages, with the large ones on a channel of their own;
+    the channels still share the connection's socket
+``heavy-ack``
+    100-byte messages, with a second channel on the same connection pumping
+    small messages through as fast as it can and acking every one of them
+``many-channels``
+    100-byte messages spread across 64 channels, each with its own queue and consumer
+
+Latencies are in milliseconds. The first ``--warmup`` seconds of each scenario are left out.
+Like ``throughput.py``, this runs against a stand-in broker in a child process unless
+``--broker`` is given, and writes its results as JSON. ``benchmarks/compare.py --measure p99``
+compares two runs.
+'''
+import asyncio
+import collections
+import time
+import common
+from common import asynqp
+
+
+SMALL = 100
+LARGE = 2 ** 20
+PERCENTILES = [('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9)]
+
+SCENARIOS = collections.OrderedDict([
+    ('small', {'channels': 1, 'large_every': None, 'separate_large': False, 'background': False}),
+    ('mixed', {'channels': 1, 'large_every': 100, 'separate_large': False, 'background': False}),
+    ('mixed-channels', {'channels': 1, 'large_every': 100, 'separate_large': True, 'background': False}),
+    ('heavy-ack', {'channels': 1, 'large_every': None, 'separate_large': False, 'background': True}),
+    ('many-channels', {'channels': 64, 'large_every': None, 'separate_large': False, 'background': False}),
+])
+
+
+def add_arguments(parser):
+    parser.add_argument('--rate', type=float, default=1000, help='messages to publish per second (default: 1000)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to publish for in each scenario (default: 10)')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds at the start to leave out (default: 1)')
+    parser.add_argument('--prefetch', type=int, default=100, help='the prefetch count for each channel (default: 100)')
+
+
+class Recorder(object):
+    """Collects the latencies of the messages which arrive, by body size."""
+    def __init__(self, count, loop):
+        self.count = count
+        self.warmup_until = None
+        self.received = 0
+        self.corrected = collections.defaultdict(asynqp.Histogram)
+        self.uncorrected = collections.defaultdict(asynqp.Histogram)
+        self.done = asyncio.Future(loop=loop)
+
+    def callback(self, msg):
+        arrived = time.perf_counter()
+        msg.ack()
+        due, sent = msg.headers['due'], msg.headers['sent']
+        if due >= self.warmup_until:
+            size = len(msg.body)
+            self.corrected[size].record(arrived - due)
+            self.uncorrected[size].record(arrived - sent)
+        self.received += 1
+        if self.received == self.count and not self.done.done():
+            self.done.set_result(None)
+
+
+@asyncio.coroutine
+def run_scenario(address, name, settings, args, loop):
+    host, port = address
+    connection = yield from asynqp.connect(host, port, loop=loop)
+    try:
+        return (yield from measure(connection, name, settings, args, loop))
+    finally:
+        yield from connection.close()
+
+
+@asyncio.coroutine
+def measure(connection, name, settings, args, loop):
+    count = int(args.rate * args.duration)
+    channels = yield from connection.open_channels(settings['channels'] + settings['separate_large'])
+    recorder = Recorder(count, loop)
+    targets = []
+    for channel in channels:
+        yield from channel.set_qos(prefetch_count=args.prefetch)
+        queue = yield from channel.declare_queue(exclusive=True)
+        yield from queue.consume(recorder.callback)
+        targets.append((channel.default_exchange, queue.name))
+
+    background = None
+    stopping = asyncio.Future(loop=loop)
+    if settings['background']:
+        background = asyncio.async(pump(connection, stopping, loop), loop=loop)
+
+    small, large = b'x' * SMALL, b'x' * LARGE
+    large_every = settings['large_every']
+    start = time.perf_counter() + 0.1
+    recorder.warmup_until = start + args.warmup
+
+    def send(n, due):
+        body = large if large_every and n % large_every == large_every - 1 else small
+        if body is large and settings['separate_large']:
+            exchange, routing_key = targets[-1]
+        else:
+            exchange, routing_key = targets[n % settings['channels']]
+        exchange.publish(asynqp.Message(body, headers={'due': due, 'sent': time.perf_counter()}), routing_key, mandatory=False)
+
+    try:
+        yield from pace(connection, send, count, args.rate, start, loop)
+        finished = time.perf_counter()
+        try:
+            # give the stragglers a chance to arrive
+            yield from asyncio.wait_for(asyncio.shield(recorder.done, loop=loop), max(5, args.duration), loop=loop)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        stopping.set_result(None)
+        if background is not None:
+            yield from background
+
+    result = {'scenario': name, 'rate': args.rate, 'duration': args.duration, 'prefetch': args.prefetch,
+              'channels': len(channels), 'sent': count, 'received': recorder.received,
+              'achieved_rate': count / (finished - start)}
+    result.update(summarise(recorder.corrected.values()))
+    result['uncorrected'] = summarise(recorder.uncorrected.values())
+    if len(recorder.corrected) > 1:
+        result['by_size'] = {str(size): summarise([h]) for size, h in sorted(recorder.corrected.items())}
+    return result
+
+
+@asyncio.coroutine
+def pace(connection, send, count, rate, start, loop):
+    n = 0
+    while n < count:
+        due = start + n / rate
+        wait = due - time.perf_counter()
+        if wait > 0:
+            yield from asyncio.sleep(wait, loop=loop)
+        # send everything that has fallen due, including anything we're late with
+        now = time.perf_counter()
+        while n < count and start + n / rate <= now:
+            send(n, start + n / rate)
+            n += 1
+        yield from connection.protocol.drain()
+
+
+@asyncio.coroutine
+def pump(connection, stopping, loop):
+    # keep a stream of messages going round as fast as possible, acking each one
+    channel = yield from connection.open_channel()
+    yield from channel.set_qos(prefetch_count=1000)
+    queue = yield from channel.declare_queue(exclusive=True)
+    body = b'x' * SMALL
+    in_flight = asyncio.Semaphore(1000, loop=loop)
+
+    def callback(msg):
+        msg.ack()
+        in_flight.release()
+    yield from queue.consume(callback)
+    while not stopping.done():
+        yield from in_flight.acquire()
+        channel.default_exchange.publish(asynqp.Message(body), queue.name, mandatory=False)
+        yield from connection.protocol.drain()
+    # wait for everything to come back, so nothing's left in flight when the channel closes
+    for _ in range(1000):
+        yield from in_flight.acquire()
+    yield from channel.close()
+
+
+def summarise(histograms):
+    total = asynqp.Histogram()
+    for histogram in histograms:
+        total.merge(histogram)
+    if not total.count:
+        return {name: None for name, _ in PERCENTILES + [('max', None), ('mean', None)]}
+    summary = {name: total.percentile(percent) * 1000 for name, percent in PERCENTILES}
+    summary['max'] = total.max * 1000
+    summary['mean'] = total.mean * 1000
+    return summary
+
+
+def main():
+    args = common.parse_args('Measure publish-to-delivery latency at a fixed rate.', add_arguments)
+    if args.quick:
+        args.duration, args.warmup = 2, 0.5
+    loop = common.make_loop()
+    results = []
+    with common.broker_address(args) as address:
+        for name, settings in SCENARIOS.items():
+            if not common.selected(dict(settings, scenario=name), args.only):
+                continue
+            runs = [loop.run_until_complete(run_scenario(address, name, settings, args, loop)) for _ in range(args.repeat)]
+            result = common.median_run(runs, 'p99')
+            results.append(result)
+            common.report('{scenario:<16} {achieved_rate:>8.0f} msg/s  p50={p50:>8.3f}  p99={p99:>8.3f}  '
+                          'p99.9={p999:>8.3f}  max={max:>8.3f} ms  ({received}/{sent} received)'.format(**result))
+    loop.close()
+    common.write_results(args, 'latency', results)
+
+
+if __name__ == '__main__':
+    main()
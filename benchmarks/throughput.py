@@ -0,0 +1,213 @@
+'''
+Measure how many messages per second, and how many megabytes of message bodies per second,
+asynqp can push through a broker.
+
+By default a stand-in broker (:class:`asynqp.broker.Broker`) is started in a child process,
+so the numbers are reproducible on any machine and mostly reflect the client;
+use ``--broker HOST:PORT`` to measure against a real one instead.
+
+Workloads:
+
+``publish``
+    publish as fast as possible to a routing key with no queue behind it
+``publish-confirm``
+    the same, with publisher confirms, finishing when every message has been confirmed
+``consume``
+    consume messages which were put in the queues beforehand
+``roundtrip``
+    publish and consume at the same time, finishing when every message has arrived
+
+Each workload is run with a baseline setting (1 KiB bodies, 128 KiB frames, a prefetch
+count of 100, one channel and an ack for every message), and then with one setting at a time
+varied: the body size from 0 bytes to 16 MiB, ``frame_max``, the prefetch count, the number of
+channels, and the ack mode (``no_ack``, ``ack`` or ``coalesced``). Prefetch and ack mode don't
+apply to the publishing workloads.
+
+The results are written as JSON, one entry per scenario, along with the git revision
+and the Python version, so that runs on different commits can be compared::
+
+    python benchmarks/throughput.py -o before.json
+    git checkout my-branch
+    python benchmarks/throughput.py -o after.json
+    python benchmarks/compare.py before.json after.json
+
+``--only workload=consume`` (which may be repeated) restricts the run to matching scenarios.
+'''
+import asyncio
+import time
+import common
+from common import asynqp
+
+
+BASELINE = {'body_size': 1024, 'frame_max': 131072, 'prefetch': 100, 'channels': 1, 'ack_mode': 'ack'}
+VARIATIONS = {
+    'body_size': [0, 64, 1024, 16384, 131072, 1048576, 16777216],
+    'frame_max': [4096, 131072, 1048576],
+    'prefetch': [1, 10, 100, 1000],
+    'channels': [1, 4, 16],
+    'ack_mode': ['no_ack', 'ack', 'coalesced'],
+}
+PUBLISHING = ('publish', 'publish-confirm')
+WORKLOADS = PUBLISHING + ('consume', 'roundtrip')
+
+# each scenario sends up to this many messages, or this many bytes of bodies, whichever is fewer
+MAX_MESSAGES = 20000
+MAX_BYTES = 256 * 2 ** 20
+QUICK_MAX_MESSAGES = 2000
+QUICK_MAX_BYTES = 32 * 2 ** 20
+
+
+def scenarios():
+    seen = []
+    for workload in WORKLOADS:
+        for setting, values in sorted(VARIATIONS.items()):
+            for value in values:
+                scenario = dict(BASELINE, workload=workload)
+                scenario[setting] = value
+                if workload in PUBLISHING:
+                    scenario['prefetch'] = scenario['ack_mode'] = None
+                if scenario not in seen:
+                    seen.append(scenario)
+    return seen
+
+
+def message_count(scenario, quick):
+    max_messages, max_bytes = (QUICK_MAX_MESSAGES, QUICK_MAX_BYTES) if quick else (MAX_MESSAGES, MAX_BYTES)
+    count = min(max_messages, max_bytes // max(scenario['body_size'], 1))
+    # at least a few messages for each channel
+    return max(count, 4 * scenario['channels'])
+
+
+@asyncio.coroutine
+def run_scenario(address, scenario, count, loop):
+    host, port = address
+    connection = yield from asynqp.connect(host, port, frame_max=scenario['frame_max'], loop=loop)
+    try:
+        channels = yield from connection.open_channels(scenario['channels'])
+        per_channel = [count // len(channels) + (i < count % len(channels)) for i in range(len(channels))]
+        message = asynqp.Message(b'x' * scenario['body_size'])
+        workload = globals()[scenario['workload'].replace('-', '_')]
+        seconds = yield from workload(connection, channels, per_channel, message, scenario, loop)
+    finally:
+        yield from connection.close()
+    return seconds
+
+
+@asyncio.coroutine
+def publish_many(connection, exchange, routing_key, message, count):
+    for i in range(count):
+        exchange.publish(message, routing_key, mandatory=False)
+        if i % 64 == 63:
+            yield from connection.protocol.drain()
+
+
+@asyncio.coroutine
+def publish(connection, channels, per_channel, message, scenario, loop):
+    start = time.perf_counter()
+    yield from asyncio.gather(*[publish_many(connection, c.default_exchange, 'nowhere', message, n)
+                                for c, n in zip(channels, per_channel)], loop=loop)
+    # the broker handles each channel's frames in order, so once it has answered
+    # a basic.qos it has seen everything published before it
+    yield from asyncio.gather(*[c.set_qos(prefetch_count=0) for c in channels], loop=loop)
+    return time.perf_counter() - start
+
+
+@asyncio.coroutine
+def publish_confirm(connection, channels, per_channel, message, scenario, loop):
+    for channel in channels:
+        yield from channel.enable_confirms()
+    start = time.perf_counter()
+    yield from asyncio.gather(*[publish_many(connection, c.default_exchange, 'nowhere', message, n)
+                                for c, n in zip(channels, per_channel)], loop=loop)
+    yield from asyncio.gather(*[c.wait_for_confirms() for c in channels], loop=loop)
+    return time.perf_counter() - start
+
+
+@asyncio.coroutine
+def declare_queues(channels):
+    queues = []
+    for channel in channels:
+        queues.append((yield from channel.declare_queue(exclusive=True)))
+    return queues
+
+
+@asyncio.coroutine
+def start_consumers(channels, queues, per_channel, scenario, loop):
+    done = []
+    for channel, queue, count in zip(channels, queues, per_channel):
+        no_ack = scenario['ack_mode'] == 'no_ack'
+        yield from channel.set_qos(prefetch_count=scenario['prefetch'])
+        if scenario['ack_mode'] == 'coalesced':
+            channel.set_ack_coalescing(max_count=max(1, scenario['prefetch'] // 2))
+        finished = asyncio.Future(loop=loop)
+        done.append(finished)
+        yield from queue.consume(counter(count, finished, no_ack), no_ack=no_ack)
+    return done
+
+
+def counter(count, finished, no_ack):
+    remaining = [count]
+
+    def callback(msg):
+        if not no_ack:
+            msg.ack()
+        remaining[0] -= 1
+        if not remaining[0]:
+            finished.set_result(None)
+    return callback
+
+
+@asyncio.coroutine
+def consume(connection, channels, per_channel, message, scenario, loop):
+    queues = yield from declare_queues(channels)
+    yield from asyncio.gather(*[publish_many(connection, c.default_exchange, q.name, message, n)
+                                for c, q, n in zip(channels, queues, per_channel)], loop=loop)
+    yield from asyncio.gather(*[c.set_qos(prefetch_count=0) for c in channels], loop=loop)
+
+    start = time.perf_counter()
+    done = yield from start_consumers(channels, queues, per_channel, scenario, loop)
+    yield from asyncio.gather(*done, loop=loop)
+    return time.perf_counter() - start
+
+
+@asyncio.coroutine
+def roundtrip(connection, channels, per_channel, message, scenario, loop):
+    queues = yield from declare_queues(channels)
+    done = yield from start_consumers(channels, queues, per_channel, scenario, loop)
+
+    start = time.perf_counter()
+    yield from asyncio.gather(*[publish_many(connection, c.default_exchange, q.name, message, n)
+                                for c, q, n in zip(channels, queues, per_channel)], loop=loop)
+    yield from asyncio.gather(*done, loop=loop)
+    return time.perf_counter() - start
+
+
+def main():
+    args = common.parse_args('Measure message throughput.')
+    loop = common.make_loop()
+    results = []
+    with common.broker_address(args) as address:
+        for scenario in scenarios():
+            if not common.selected(scenario, args.only):
+                continue
+            count = message_count(scenario, args.quick)
+            runs = []
+            for _ in range(args.repeat):
+                seconds = loop.run_until_complete(run_scenario(address, scenario, count, loop))
+                runs.append({'seconds': seconds})
+            seconds = common.median_run(runs, 'seconds')['seconds']
+            result = dict(scenario,
+                          messages=count,
+                          seconds=seconds,
+                          messages_per_second=count / seconds,
+                          mb_per_second=count * scenario['body_size'] / seconds / 2 ** 20)
+            results.append(result)
+            common.report('{workload:<16} body={body_size:<9} frame_max={frame_max:<8} prefetch={prefetch!s:<5} '
+                          'channels={channels:<3} ack={ack_mode!s:<10} {messages_per_second:>10.0f} msg/s '
+                          '{mb_per_second:>9.2f} MiB/s'.format(**result))
+    loop.close()
+    common.write_results(args, 'throughput', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,25 @@
 import asyncio
-from .exceptions import AMQPError, UndeliverableMessage, Deleted
-from .message import Message, IncomingMessage
+from .exceptions import AMQPError, UndeliverableMessage, Deleted, ChannelClosedError
+from .message import Message, IncomingMessage, DetachedMessage
 from .connection import Connection
 from .channel import Channel
 from .exchange import Exchange
 from .queue import Queue, QueueBinding, Consumer
-
+from .fanin import FanIn
+from .pool import ChannelPool, ConnectionPool, PoolNode
+from .publisher import ShardedPublisher, PublisherShard
+from .prefetch import PrefetchTuner
+from .metrics import Metrics, InMemoryMetrics, Histogram
+from .tracing import Tracer, RingBufferTracer
 
 __all__ = [
-    "AMQPError", "UndeliverableMessage", "Deleted",
-    "Message", "IncomingMessage",
+    "AMQPError", "UndeliverableMessage", "Deleted", "ChannelClosedError",
+    "Message", "IncomingMessage", "DetachedMessage",
     "Connection", "Channel", "Exchange", "Queue", "QueueBinding", "Consumer",
-    "connect", "connect_and_open_channel"
+    "FanIn", "ChannelPool", "ConnectionPool", "PoolNode",
+    "ShardedPublisher", "PublisherShard", "PrefetchTuner",
+    "Metrics", "InMemoryMetrics", "Histogram", "Tracer", "RingBufferTracer",
+    "connect", "connect_and_open_channel", "connect_pool", "connect_sharded"
 ]
 
 
@@ -20,6 +28,9 @@ def connect(host='localhost',
             port=5672,
             username='guest', password='guest',
             virtual_host='/', *,
+            frame_max=None, channel_max=None, heartbeat=None,
+            tcp_nodelay=True, send_buffer_size=None, receive_buffer_size=None,
+            auto_reconnect=False, reconnect_delay=0.1, max_reconnect_delay=10,
             loop=None, **kwargs):
     """
     Connect to an AMQP server on the given host and port.
@@ -32,6 +43,32 @@ def connect(host='localhost',
     :param str username: the username to authenticate with.
     :param str password: the password to authenticate with.
     :param str virtual_host: the AMQP virtual host to connect to.
+    :keyword int frame_max: the largest frame, in bytes, we'd like to send or receive.
+        The smaller of this and the server's limit is used; 0 means no limit.
+        Larger frames mean fewer frames for big messages, smaller ones let other channels'
+        frames in sooner. By default the server's limit is used.
+    :keyword int channel_max: the most channels we'd like to open on the connection.
+        The smaller of this and the server's limit is used; 0 means no limit.
+        By default the server's limit is used.
+    :keyword int heartbeat: the heartbeat interval in seconds, or 0 to switch heartbeats off.
+        By default the server's suggestion is used.
+    :keyword bool tcp_nodelay: if True (the default), switch off Nagle's algorithm on TCP sockets,
+        so that small frames are sent straight away. ``None`` leaves the socket alone.
+    :keyword int send_buffer_size: if given, the size of the socket's send buffer (``SO_SNDBUF``).
+    :keyword int receive_buffer_size: if given, the size of the socket's receive buffer (``SO_RCVBUF``).
+    :keyword bool auto_reconnect: if True, reconnect when the connection is lost, and open every channel again
+        with the QoS settings, exchanges, queues, bindings and consumers which were set up on it.
+        Existing :class:`Channel`, :class:`Exchange`, :class:`Queue` and :class:`Consumer` objects
+        carry on working; a server-named queue gets a new name. While the connection is down,
+        operations which wait for the broker raise :class:`ConnectionError`, messages published
+        are lost (with publisher confirms, their futures fail with :class:`ConnectionError`),
+        and acking messages which were delivered before the connection was lost does nothing,
+        since the broker will deliver them again.
+        Reconnection stops when :meth:`Connection.close` is called, or if the broker closes the connection.
+    :keyword float reconnect_delay: the first reconnection attempt is made straight away.
+        After that, attempts are separated by a random delay of up to ``reconnect_delay`` seconds,
+        doubling after each failure.
+    :keyword float max_reconnect_delay: the most the delay between attempts can grow to.
 
     Further keyword arguments are passed on to :meth:`create_connection() <asyncio.BaseEventLoop.create_connection>`.
 
@@ -39,7 +76,12 @@ def connect(host='localhost',
     """
     from .protocol import AMQP
     from .routing import Dispatcher
-    from .connection import ConnectionInfo, open_connection
+    from . import spec
+    from .connection import ConnectionInfo, open_connection, set_socket_options
+    from .recovery import Recovery
+
+    if frame_max and frame_max < spec.FRAME_MIN_SIZE:
+        raise ValueError("frame_max must be at least {} bytes.".format(spec.FRAME_MIN_SIZE))
 
     loop = asyncio.get_event_loop() if loop is None else loop
 
@@ -47,10 +89,20 @@ def connect(host='localhost',
         kwargs['host'] = host
         kwargs['port'] = port
 
+    @asyncio.coroutine
+    def create_connection(protocol_factory):
+        transport, protocol = yield from loop.create_connection(protocol_factory, **kwargs)
+        set_socket_options(transport.get_extra_info('socket'), tcp_nodelay, send_buffer_size, receive_buffer_size)
+        return transport, protocol
+
     dispatcher = Dispatcher()
-    transport, protocol = yield from loop.create_connection(lambda: AMQP(dispatcher, loop), **kwargs)
+    transport, protocol = yield from create_connection(lambda: AMQP(dispatcher, loop))
 
-    connection = yield from open_connection(loop, transport, protocol, dispatcher, ConnectionInfo(username, password, virtual_host))
+    connection = yield from open_connection(loop, transport, protocol, dispatcher, ConnectionInfo(username, password, virtual_host),
+                                            frame_max=frame_max, channel_max=channel_max, heartbeat=heartbeat)
+    if auto_reconnect:
+        Recovery(connection, create_connection, delay=reconnect_delay, max_delay=max_reconnect_delay,
+                 frame_max=frame_max, channel_max=channel_max, heartbeat=heartbeat, loop=loop)
     return connection
 
 
@@ -77,3 +129,84 @@ def connect_and_open_channel(host='localhost',
     connection = yield from connect(host, port, username, password, virtual_host, loop=loop, **kwargs)
     channel = yield from connection.open_channel()
     return connection, channel
+
+
+@asyncio.coroutine
+def connect_pool(nodes,
+                 username='guest', password='guest',
+                 virtual_host='/', *,
+                 strategy='round_robin', max_rtt=None, retry_interval=5,
+                 loop=None, **kwargs):
+    """
+    Connect to several nodes of an AMQP cluster and spread published messages between them.
+    This function is a :ref:`coroutine <coroutine>`.
+
+    :param list nodes: the nodes to connect to. Each node is either a host name
+        (the broker is expected to listen on port 5672) or a ``(host, port)`` tuple.
+    :param str username: the username to authenticate with.
+    :param str password: the password to authenticate with.
+    :param str virtual_host: the AMQP virtual host to connect to.
+    :keyword str strategy: how to pick the node for each message:
+        ``'round_robin'``, ``'least_bytes'`` or ``'least_unconfirmed'``.
+    :keyword float max_rtt: take a node out of rotation when the time it takes to confirm messages
+        grows above this many seconds. By default nodes are never considered too slow.
+    :keyword float retry_interval: how long to wait before reconnecting to a lost node,
+        or trying a slow node again.
+
+    Further keyword arguments are passed on to :func:`connect` for each node.
+    Nodes which can't be reached are retried in the background,
+    as long as at least one of them could be.
+
+    :return: the :class:`ConnectionPool` object.
+    """
+    pool = ConnectionPool(nodes, strategy=strategy, max_rtt=max_rtt, retry_interval=retry_interval, loop=loop,
+                          username=username, password=password, virtual_host=virtual_host, **kwargs)
+    yield from pool.open()
+    return pool
+
+
+@asyncio.coroutine
+def connect_sharded(host='localhost',
+                    port=5672,
+                    username='guest', password='guest',
+                    virtual_host='/', *,
+                    shards=4, strategy='hash', confirms=False,
+                    loop=None, **kwargs):
+    """
+    Open several connections to an AMQP server and publish messages over all of them.
+    This function is a :ref:`coroutine <coroutine>`.
+
+    The first five parameters are the same as :func:`connect`.
+
+    :keyword int shards: the number of connections to open.
+    :keyword str strategy: how to pick the connection for each message:
+        ``'hash'`` keeps messages with the same routing key in order,
+        ``'round_robin'`` spreads them evenly.
+    :keyword bool confirms: if True, put each shard's channel into publisher-confirm mode.
+
+    Further keyword arguments are passed on to :func:`connect` for each connection.
+
+    :return: the :class:`ShardedPublisher` object.
+    """
+    from .publisher import open_shard, STRATEGIES
+
+    if shards < 1:
+        raise ValueError("A sharded publisher needs at least one shard.")
+    if strategy not in STRATEGIES:
+        raise ValueError("Unknown sharding strategy {!r}.".format(strategy))
+
+    loop = asyncio.get_event_loop() if loop is None else loop
+
+    def connect_shard():
+        return connect(host, port, username, password, virtual_host, loop=loop, **kwargs)
+
+    # schedule the tasks ourselves so that the shards are opened in order
+    tasks = [asyncio.async(open_shard(connect_shard, confirms), loop=loop) for _ in range(shards)]
+    results = yield from asyncio.gather(*tasks, loop=loop, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        for result in results:
+            if not isinstance(result, BaseException):
+                yield from result.connection.close()
+        raise errors[0]
+    return ShardedPublisher(results, strategy=strategy, loop=loop)
@@ -0,0 +1,280 @@
+import asyncio
+import bisect
+import collections
+
+
+ACK = 'ack'
+NACK_REQUEUE = 'nack-requeue'
+NACK_DISCARD = 'nack-discard'
+
+
+class Acknowledger(object):
+    """
+    Sends acknowledgements for the messages delivered on a channel.
+
+    By default every ack or nack is sent as soon as the application asks for it.
+    When coalescing is switched on, they are held back until ``max_count`` of them
+    have accumulated or ``max_delay`` seconds have passed. The run of settled delivery tags
+    at the bottom of the window is then settled with as few ``multiple=True`` acks and nacks
+    as possible - one for each stretch of consecutive messages with the same outcome.
+    Acks and nacks beyond a gap (a message which the application is still working on)
+    are sent individually.
+
+    Delivery tags are handed out by the broker in sequence for every message delivered on the channel.
+    A tag below the highest acked one can only be covered by a ``multiple=True`` ack
+    if we know it has been settled - acked, nacked, rejected, or delivered with ``no_ack`` -
+    so tags we know nothing about are always treated as outstanding.
+
+    When a channel is opened again after the connection has been recovered, the broker
+    numbers its deliveries from 1 again. The tags handed to the application carry on from
+    where they left off (the broker's tag plus ``offset``), so acks for messages delivered
+    on the old connection - which the broker has already requeued - can be recognised and dropped.
+    """
+    def __init__(self, loop, sender):
+        self.loop = loop
+        self.sender = sender
+        self.last_delivery_tag = 0
+        self.offset = 0
+
+        self.coalescing = False
+        self.max_count = None
+        self.max_delay = None
+        self.floor = 0  # every tag up to and including the floor has been settled with the broker
+        self.settled = IntervalSet()
+        self.pending = {}  # delivery tag -> outcome
+        self.flush_handle = None
+        self.tuner = None  # a PrefetchTuner which is told when messages arrive and are settled
+        self.metrics = None  # a Metrics collector, if the application has attached one
+        self.delivered_at = {}  # delivery tag -> when the message arrived, while there's a collector
+
+    def delivered(self, delivery_tag):
+        self.last_delivery_tag = delivery_tag + self.offset
+        if self.tuner is not None:
+            self.tuner.delivered(self.last_delivery_tag)
+        if self.metrics is not None:
+            self.delivered_at[self.last_delivery_tag] = self.loop.time()
+            self.metrics.message_delivered(self.sender.channel_id)
+        return self.last_delivery_tag
+
+    def coalesce(self, max_count, max_delay):
+        if max_count < 1:
+            raise ValueError("max_count must be a positive integer.")
+        if max_delay < 0:
+            raise ValueError("max_delay must not be negative.")
+
+        self.flush()
+        self.max_count = max_count
+        self.max_delay = max_delay
+        if not self.coalescing:
+            # we don't know which of the messages delivered so far are still outstanding,
+            # so acks for them will carry on being sent individually
+            self.coalescing = True
+            self.floor = self.last_delivery_tag
+
+    def ack(self, delivery_tag):
+        self.settle_later(delivery_tag, ACK)
+
+    def nack(self, delivery_tag, requeue):
+        self.settle_later(delivery_tag, NACK_REQUEUE if requeue else NACK_DISCARD)
+
+    def nack_all_up_to(self, delivery_tag, requeue):
+        # a multiple nack would swallow any acks we're holding on to
+        self.flush()
+        if self.tuner is not None:
+            self.tuner.settled_up_to(delivery_tag)
+        if self.metrics is not None:
+            for tag in [t for t in self.delivered_at if not delivery_tag or t <= delivery_tag]:
+                self.report(tag, NACK_DISCARD)
+        if delivery_tag and delivery_tag <= self.offset:
+            return
+        self.sender.send_BasicNack(delivery_tag - self.offset if delivery_tag else 0, True, requeue)
+        if self.coalescing:
+            up_to = delivery_tag if delivery_tag else self.last_delivery_tag
+            if up_to > self.floor:
+                self.settled.discard_up_to(up_to)
+                self.floor = up_to
+
+    def settle_later(self, delivery_tag, outcome):
+        if self.tuner is not None:
+            self.tuner.settled(delivery_tag)
+        if self.metrics is not None:
+            self.report(delivery_tag, outcome)
+        if not self.coalescing or delivery_tag <= self.floor:
+            self.send(delivery_tag, False, outcome)
+            return
+
+        self.settled.add(delivery_tag)
+        self.pending[delivery_tag] = outcome
+        if len(self.pending) >= self.max_count:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.max_delay, self.flush)
+
+    def reject(self, delivery_tag, requeue):
+        if self.tuner is not None:
+            self.tuner.settled(delivery_tag)
+        if self.metrics is not None:
+            self.report(delivery_tag, NACK_DISCARD)
+        if delivery_tag > self.offset:
+            self.sender.send_BasicReject(delivery_tag - self.offset, requeue)
+        self.settle(delivery_tag)
+
+    def settle(self, delivery_tag):
+        """Record that a message has been settled without an ack from us (eg, it was delivered with no_ack)"""
+        if self.tuner is not None:
+            self.tuner.forget(delivery_tag)
+        self.delivered_at.pop(delivery_tag, None)
+        if self.coalescing and delivery_tag > self.floor:
+            self.settled.add(delivery_tag)
+
+    def flush(self):
+        self.cancel_flush()
+        if not self.pending:
+            return
+
+        start, end = self.settled.first()
+        if start == self.floor + 1:
+            run = sorted(tag for tag in self.pending if tag <= end)
+            for first, last in self.split_by_outcome(run):
+                self.send(last, first != last, self.pending[last])
+            for tag in run:
+                del self.pending[tag]
+            self.settled.discard_up_to(end)
+            self.floor = end
+
+        for tag in sorted(self.pending):
+            self.send(tag, False, self.pending[tag])
+        self.pending.clear()
+
+    def split_by_outcome(self, run):
+        stretches = []
+        for tag in run:
+            if stretches and self.pending[stretches[-1][0]] == self.pending[tag]:
+                stretches[-1][1] = tag
+            else:
+                stretches.append([tag, tag])
+        return stretches
+
+    def send(self, delivery_tag, multiple, outcome):
+        if delivery_tag <= self.offset:
+            return  # delivered on a connection which has since been lost
+        delivery_tag -= self.offset
+        if outcome is ACK:
+            self.sender.send_BasicAck(delivery_tag, multiple)
+        else:
+            self.sender.send_BasicNack(delivery_tag, multiple, outcome is NACK_REQUEUE)
+
+    def discard(self):
+        """The channel has gone away, so there's nobody to send the pending acks and nacks to"""
+        self.cancel_flush()
+        self.pending.clear()
+        if self.tuner is not None:
+            self.tuner.forget()
+        self.delivered_at.clear()
+
+    def reset(self):
+        """The channel has been opened again on a new connection"""
+        self.discard()
+        self.offset = self.floor = self.last_delivery_tag
+        self.settled = IntervalSet()
+
+    def report(self, delivery_tag, outcome):
+        delivered_at = self.delivered_at.pop(delivery_tag, None)
+        latency = None if delivered_at is None else self.loop.time() - delivered_at
+        if outcome is ACK:
+            self.metrics.message_acked(self.sender.channel_id, latency)
+        else:
+            self.metrics.message_rejected(self.sender.channel_id, latency)
+
+    def cancel_flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+
+class PublisherConfirms(object):
+    """
+    Keeps track of the messages published on a channel in confirm mode.
+
+    Once the channel is in confirm mode, the broker numbers the messages published on it
+    from 1 and acks (or nacks) each sequence number when it has taken responsibility for the message.
+    A ``multiple=True`` ack confirms every sequence number up to and including its delivery tag.
+    Sequence numbers only go up, so the unconfirmed futures are kept in publishing order
+    and a multiple ack just pops them off the front.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.enabled = False
+        self.next_seq = 1
+        self.unconfirmed = collections.OrderedDict()
+
+    def published(self):
+        fut = asyncio.Future(loop=self.loop)
+        self.unconfirmed[self.next_seq] = fut
+        self.next_seq += 1
+        return fut
+
+    def confirm(self, delivery_tag, multiple, acked):
+        if multiple:
+            while self.unconfirmed:
+                seq = next(iter(self.unconfirmed))
+                if seq > delivery_tag:
+                    break
+                self.resolve(self.unconfirmed.pop(seq), acked)
+        else:
+            fut = self.unconfirmed.pop(delivery_tag, None)
+            if fut is not None:
+                self.resolve(fut, acked)
+
+    def resolve(self, fut, acked):
+        if not fut.done():
+            fut.set_result(acked)
+
+    def wait(self):
+        return asyncio.gather(*self.unconfirmed.values(), loop=self.loop)
+
+    def fail(self, exc):
+        for fut in self.unconfirmed.values():
+            if not fut.done():
+                fut.set_exception(exc)
+        self.unconfirmed.clear()
+
+
+class IntervalSet(object):
+    """A set of integers, stored as a sorted list of disjoint closed intervals"""
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __contains__(self, n):
+        i = bisect.bisect_right(self.starts, n) - 1
+        return i >= 0 and n <= self.ends[i]
+
+    def add(self, n):
+        i = bisect.bisect_right(self.starts, n)
+        if i > 0 and n <= self.ends[i - 1]:
+            return
+
+        joins_left = i > 0 and self.ends[i - 1] == n - 1
+        joins_right = i < len(self.starts) and self.starts[i] == n + 1
+        if joins_left and joins_right:
+            self.ends[i - 1] = self.ends[i]
+            del self.starts[i]
+            del self.ends[i]
+        elif joins_left:
+            self.ends[i - 1] = n
+        elif joins_right:
+            self.starts[i] = n
+        else:
+            self.starts.insert(i, n)
+            self.ends.insert(i, n)
+
+    def first(self):
+        return self.starts[0], self.ends[0]
+
+    def discard_up_to(self, n):
+        i = bisect.bisect_right(self.ends, n)
+        del self.starts[:i]
+        del self.ends[:i]
+        if self.starts and self.starts[0] <= n:
+            self.starts[0] = n + 1
@@ -134,6 +134,8 @@ class Timestamp(datetime.datetime):
             return super().__new__(cls, *args, **kwargs)
 
         value, = args
+        if isinstance(value, bytes):  # unpickling
+            return super().__new__(cls, value)
         if isinstance(value, datetime.datetime):
             return super().__new__(cls, value.year, value.month, value.day, value.hour, value.minute, value.second)
         raise TypeError("Could not construct a timestamp from value {}".format(value))
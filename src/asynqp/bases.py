@@ -22,3 +22,6 @@ class FrameHandler(object):
 
     def handle_ConnectionClosedPoisonPillFrame(self, frame):
         self.synchroniser.killall(ConnectionError)
+
+    def handle_ConnectionSuspendedPoisonPillFrame(self, frame):
+        self.synchroniser.killall(ConnectionError)
@@ -0,0 +1,713 @@
+import asyncio
+import collections
+import socket
+import struct
+import uuid
+from . import frames
+from . import spec
+
+
+PROTOCOL_HEADER = b'AMQP\x00\x00\x09\x01'
+NO_ROUTE = 312  # RabbitMQ's reply code for an unroutable mandatory message
+
+
+class Broker(object):
+    """
+    A stand-in for an AMQP 0-9-1 broker, which runs on the event loop in this process.
+
+    The broker is meant for tests and benchmarks which need to run the same way on any machine.
+    It speaks enough of the protocol for asynqp: the connection handshake, channels,
+    ``direct``, ``fanout`` and ``topic`` exchanges, queues and bindings, publishing,
+    consuming and ``basic.get``, acks, rejects and nacks, QoS, publisher confirms
+    and ``mandatory`` returns. It accepts any credentials and any virtual host.
+
+    It is not a message store: nothing is durable, and there are no TTLs, dead-letter exchanges,
+    priorities, exchange-to-exchange bindings or ``headers`` exchanges.
+    A ``basic.qos`` with ``global=True`` limits the whole channel, as RabbitMQ does;
+    otherwise the limit applies to each consumer started after it.
+
+    :param int frame_max: the largest frame the broker offers to send or receive.
+    :param int channel_max: the most channels the broker offers to open on a connection.
+    :param int heartbeat: the heartbeat interval the broker suggests, in seconds; 0 means no heartbeats.
+    :param loop: the event loop to run on.
+
+    .. attribute:: address
+
+        once the broker is listening, the ``(host, port)`` pair of its TCP socket, or the path of its Unix socket
+    """
+    def __init__(self, *, frame_max=131072, channel_max=2047, heartbeat=0, loop=None):
+        self.frame_max = frame_max
+        self.channel_max = channel_max
+        self.heartbeat = heartbeat
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.exchanges = {}
+        for name, type in [('', 'direct'), ('amq.direct', 'direct'), ('amq.fanout', 'fanout'), ('amq.topic', 'topic')]:
+            self.exchanges[name] = Exchange(name, type)
+        self.queues = {}
+        self.connections = set()
+        self.server = None
+        self.address = None
+
+    @asyncio.coroutine
+    def start(self, host='127.0.0.1', port=0):
+        """
+        Start listening for TCP connections.
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :param str host: the address to listen on.
+        :param int port: the port to listen on. By default the operating system picks a free one.
+
+        :return: the ``(host, port)`` pair the broker is listening on.
+        """
+        self.server = yield from self.loop.create_server(self.make_protocol, host, port)
+        self.address = self.server.sockets[0].getsockname()[:2]
+        return self.address
+
+    @asyncio.coroutine
+    def start_unix(self, path):
+        """
+        Start listening for connections on a Unix socket.
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :param str path: the path of the socket.
+
+        :return: the path.
+        """
+        self.server = yield from self.loop.create_unix_server(self.make_protocol, path)
+        self.address = path
+        return self.address
+
+    @asyncio.coroutine
+    def connect(self, **kwargs):
+        """
+        Connect to the broker with :func:`asynqp.connect() <connect>`, whichever kind of socket it is listening on.
+        This method is a :ref:`coroutine <coroutine>`.
+
+        Keyword arguments are passed on to :func:`asynqp.connect() <connect>`.
+
+        :return: the :class:`Connection` object.
+        """
+        from . import connect
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                yield from self.loop.sock_connect(sock, self.address)
+            except:
+                sock.close()
+                raise
+            return (yield from connect(sock=sock, loop=self.loop, **kwargs))
+        host, port = self.address
+        return (yield from connect(host, port, loop=self.loop, **kwargs))
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        Stop listening, and drop every connection.
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        if self.server is not None:
+            self.server.close()
+            yield from self.server.wait_closed()
+            self.server = None
+        for connection in list(self.connections):
+            connection.transport.close()
+
+    def make_protocol(self):
+        return ServerConnection(self)
+
+    def declare_queue(self, name, exclusive, auto_delete, owner):
+        if not name:
+            name = 'amq.gen-' + uuid.uuid4().hex
+        queue = Queue(self, name, exclusive, auto_delete, owner)
+        self.queues[name] = queue
+        self.exchanges[''].bind(queue, name)
+        return queue
+
+    def delete_queue(self, queue):
+        del self.queues[queue.name]
+        for exchange in self.exchanges.values():
+            exchange.unbind_all(queue)
+        for consumer in list(queue.consumers):
+            consumer.channel.consumers.pop(consumer.tag, None)
+        queue.consumers.clear()
+        count = len(queue.messages)
+        queue.messages.clear()
+        return count
+
+
+class Exchange(object):
+    def __init__(self, name, type):
+        self.name = name
+        self.type = type
+        self.bindings = collections.OrderedDict()  # (queue name, routing key) -> Queue
+
+    def bind(self, queue, routing_key):
+        self.bindings[queue.name, routing_key] = queue
+
+    def unbind(self, queue, routing_key):
+        self.bindings.pop((queue.name, routing_key), None)
+
+    def unbind_all(self, queue):
+        for key in [k for k in self.bindings if k[0] == queue.name]:
+            del self.bindings[key]
+
+    def route(self, routing_key):
+        if self.name == '':
+            queue = self.bindings.get((routing_key, routing_key))
+            return [queue] if queue is not None else []
+        queues = collections.OrderedDict()
+        for (name, binding_key), queue in self.bindings.items():
+            if self.type == 'fanout' or self.type == 'direct' and binding_key == routing_key \
+                    or self.type == 'topic' and topic_matches(binding_key.split('.'), routing_key.split('.')):
+                queues[name] = queue
+        return list(queues.values())
+
+
+def topic_matches(pattern, words):
+    # '*' matches exactly one word and '#' matches zero or more
+    if not pattern:
+        return not words
+    if pattern[0] == '#':
+        return any(topic_matches(pattern[1:], words[i:]) for i in range(len(words) + 1))
+    if not words:
+        return False
+    return (pattern[0] == '*' or pattern[0] == words[0]) and topic_matches(pattern[1:], words[1:])
+
+
+class Queue(object):
+    def __init__(self, broker, name, exclusive, auto_delete, owner):
+        self.broker = broker
+        self.name = name
+        self.exclusive = exclusive
+        self.auto_delete = auto_delete
+        self.owner = owner  # the ServerConnection, for exclusive queues
+        self.messages = collections.deque()
+        self.consumers = collections.deque()  # rotated so that consumers take turns
+
+    def enqueue(self, message):
+        self.messages.append(message)
+        self.dispatch()
+
+    def requeue(self, messages):
+        for message in reversed(messages):
+            message.redelivered = True
+            self.messages.appendleft(message)
+        self.dispatch()
+
+    def dispatch(self):
+        consumers = self.consumers
+        while self.messages and consumers:
+            for _ in range(len(consumers)):
+                consumer = consumers[0]
+                consumers.rotate(-1)
+                if consumer.ready():
+                    consumer.deliver(self, self.messages.popleft())
+                    break
+            else:
+                return
+
+
+class Message(object):
+    def __init__(self, exchange, routing_key, header, body):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.header = header  # the raw content header payload, which is passed on untouched
+        self.body = body
+        self.redelivered = False
+
+
+class Consumer(object):
+    def __init__(self, channel, queue, tag, no_ack, prefetch_count):
+        self.channel = channel
+        self.queue = queue
+        self.tag = tag
+        self.no_ack = no_ack
+        self.prefetch_count = prefetch_count
+        self.unacked = 0
+
+    def ready(self):
+        if self.channel.connection.write_paused:
+            return False
+        if self.no_ack:
+            return True
+        if self.prefetch_count and self.unacked >= self.prefetch_count:
+            return False
+        return self.channel.has_capacity()
+
+    def deliver(self, queue, message):
+        channel = self.channel
+        channel.delivery_tag += 1
+        if not self.no_ack:
+            self.unacked += 1
+            channel.unacked[channel.delivery_tag] = (queue, message, self)
+        method = spec.BasicDeliver(self.tag, channel.delivery_tag, message.redelivered, message.exchange, message.routing_key)
+        channel.send_content(method, message)
+
+
+class ServerChannel(object):
+    def __init__(self, connection, channel_id):
+        self.connection = connection
+        self.broker = connection.broker
+        self.id = channel_id
+        self.closing = False
+        self.consumers = {}  # tag -> Consumer
+        self.delivery_tag = 0
+        self.unacked = collections.OrderedDict()  # delivery tag -> (Queue, Message, Consumer or None)
+        self.prefetch_count = 0  # for the whole channel (basic.qos with global=True)
+        self.consumer_prefetch_count = 0  # for consumers started from now on
+        self.confirming = False
+        self.publish_seq = 0
+        self.confirm_handle = None
+        self.publishing = None  # (BasicPublish, header, body chunks, bytes to come) while a message is arriving
+
+    def has_capacity(self):
+        return not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def send(self, method):
+        self.connection.send_frame(frames.MethodFrame(self.id, method))
+
+    def send_content(self, method, message):
+        chunks = [frames.MethodFrame(self.id, method).serialise(),
+                  frames.ContentHeaderFrame(self.id, message.header).serialise()]
+        size = self.connection.frame_max - 8
+        body = message.body
+        for i in range(0, len(body), size):
+            chunks.append(frames.ContentBodyFrame(self.id, body[i:i + size]).serialise())
+        self.connection.write(b''.join(chunks))
+
+    def error(self, code, text, method):
+        # close the channel, and ignore everything but channel.close-ok until it is closed
+        class_id, method_id = method.method_type
+        self.send(spec.ChannelClose(code, text, class_id, method_id))
+        self.release()
+        self.closing = True
+
+    def release(self):
+        self.publishing = None
+        if self.confirm_handle is not None:
+            self.confirm_handle.cancel()
+            self.confirm_handle = None
+        for consumer in list(self.consumers.values()):
+            self.cancel_consumer(consumer)
+        self.settle(list(self.unacked), requeue=True)
+
+    def cancel_consumer(self, consumer):
+        self.consumers.pop(consumer.tag, None)
+        queue = consumer.queue
+        if consumer in queue.consumers:
+            queue.consumers.remove(consumer)
+            if queue.auto_delete and not queue.consumers and self.broker.queues.get(queue.name) is queue:
+                self.broker.delete_queue(queue)
+
+    def handle_content(self, frame_type, payload):
+        if self.publishing is None:
+            raise UnexpectedFrame("Content frame received without a basic.publish")
+        method, header, chunks, remaining = self.publishing
+        if frame_type == spec.FRAME_HEADER:
+            if header is not None:
+                raise UnexpectedFrame("Two content headers received for one message")
+            header = payload
+            remaining = struct.unpack('!Q', payload[4:12])[0]
+        else:
+            if header is None:
+                raise UnexpectedFrame("Content body received before its header")
+            chunks.append(payload)
+            remaining -= len(payload)
+        if remaining > 0:
+            self.publishing = (method, header, chunks, remaining)
+            return
+        self.publishing = None
+        self.publish(method, Message(str(method.exchange), str(method.routing_key), header, b''.join(chunks)))
+
+    def publish(self, method, message):
+        exchange = self.broker.exchanges.get(method.exchange)
+        if exchange is None:
+            self.error(spec.NOT_FOUND, "NOT_FOUND - no exchange '{}'".format(method.exchange), method)
+            return
+        queues = exchange.route(message.routing_key)
+        if not queues and method.mandatory:
+            self.send_content(spec.BasicReturn(NO_ROUTE, 'NO_ROUTE', message.exchange, message.routing_key), message)
+        for queue in queues:
+            queue.enqueue(message if len(queues) == 1 else Message(message.exchange, message.routing_key, message.header, message.body))
+        if self.confirming:
+            self.publish_seq += 1
+            # confirm everything published in this pass of the event loop in one go
+            if self.confirm_handle is None:
+                self.confirm_handle = self.broker.loop.call_soon(self.confirm)
+
+    def confirm(self):
+        self.confirm_handle = None
+        if not self.closing:
+            self.send(spec.BasicAck(self.publish_seq, True))
+
+    def settle(self, tags, requeue):
+        requeued = collections.OrderedDict()  # queue -> messages to put back, in delivery order
+        dispatch = collections.OrderedDict()
+        for tag in tags:
+            queue, message, consumer = self.unacked.pop(tag)
+            if consumer is not None:
+                consumer.unacked -= 1
+                dispatch[consumer.queue] = None
+            if requeue and self.broker.queues.get(queue.name) is queue:
+                requeued.setdefault(queue, []).append(message)
+        for queue, messages in requeued.items():
+            queue.requeue(messages)
+        # a channel-wide limit frees a slot for any of the channel's consumers
+        queues = [c.queue for c in self.consumers.values()] if self.prefetch_count else dispatch
+        for queue in queues:
+            queue.dispatch()
+
+    def tags_up_to(self, delivery_tag, multiple, method):
+        if multiple:
+            return [tag for tag in self.unacked if not delivery_tag or tag <= delivery_tag]
+        if delivery_tag not in self.unacked:
+            self.error(spec.PRECONDITION_FAILED, "PRECONDITION_FAILED - unknown delivery tag {}".format(delivery_tag), method)
+            return None
+        return [delivery_tag]
+
+    def get_queue(self, name, method):
+        queue = self.broker.queues.get(name)
+        if queue is None:
+            self.error(spec.NOT_FOUND, "NOT_FOUND - no queue '{}'".format(name), method)
+        elif queue.exclusive and queue.owner is not self.connection:
+            self.error(spec.RESOURCE_LOCKED, "RESOURCE_LOCKED - queue '{}' is exclusive to another connection".format(name), method)
+            return None
+        return queue
+
+    def handle(self, method):
+        name = type(method).__name__
+        if self.closing:
+            if name == 'ChannelClose':
+                self.send(spec.ChannelCloseOK())
+            if name in ('ChannelClose', 'ChannelCloseOK'):
+                self.connection.channels.pop(self.id, None)
+            return
+        try:
+            handler = getattr(self, 'handle_' + name)
+        except AttributeError:
+            self.connection.error(spec.NOT_IMPLEMENTED, "NOT_IMPLEMENTED - {} is not supported".format(name), method)
+            return
+        handler(method)
+
+    def handle_ChannelClose(self, method):
+        self.release()
+        self.send(spec.ChannelCloseOK())
+        self.connection.channels.pop(self.id, None)
+
+    def handle_ChannelFlow(self, method):
+        self.send(spec.ChannelFlowOK(method.active))
+
+    def handle_ExchangeDeclare(self, method):
+        name, type = str(method.exchange), str(method.type)
+        exchange = self.broker.exchanges.get(name)
+        if method.passive:
+            if exchange is None:
+                self.error(spec.NOT_FOUND, "NOT_FOUND - no exchange '{}'".format(name), method)
+                return
+        elif exchange is None:
+            if type not in ('direct', 'fanout', 'topic'):
+                self.connection.error(spec.COMMAND_INVALID, "COMMAND_INVALID - unknown exchange type '{}'".format(type), method)
+                return
+            if name.startswith('amq.'):
+                self.error(spec.ACCESS_REFUSED, "ACCESS_REFUSED - exchange name '{}' is reserved".format(name), method)
+                return
+            self.broker.exchanges[name] = Exchange(name, type)
+        elif exchange.type != type:
+            self.error(spec.PRECONDITION_FAILED, "PRECONDITION_FAILED - inequivalent arg 'type' for exchange '{}'".format(name), method)
+            return
+        if not method.no_wait:
+            self.send(spec.ExchangeDeclareOK())
+
+    def handle_ExchangeDelete(self, method):
+        name = str(method.exchange)
+        exchange = self.broker.exchanges.get(name)
+        if exchange is not None:
+            if not name or name.startswith('amq.'):
+                self.error(spec.ACCESS_REFUSED, "ACCESS_REFUSED - exchange '{}' can't be deleted".format(name), method)
+                return
+            if method.if_unused and exchange.bindings:
+                self.error(spec.PRECONDITION_FAILED, "PRECONDITION_FAILED - exchange '{}' in use".format(name), method)
+                return
+            del self.broker.exchanges[name]
+        if not method.no_wait:
+            self.send(spec.ExchangeDeleteOK())
+
+    def handle_QueueDeclare(self, method):
+        name = str(method.queue)
+        queue = self.broker.queues.get(name) if name else None
+        if method.passive or queue is not None:
+            queue = self.get_queue(name, method)
+            if queue is None:
+                return
+        else:
+            queue = self.broker.declare_queue(name, bool(method.exclusive), bool(method.auto_delete), self.connection)
+            if queue.exclusive:
+                self.connection.exclusive_queues.append(queue)
+        if not method.no_wait:
+            self.send(spec.QueueDeclareOK(queue.name, len(queue.messages), len(queue.consumers)))
+
+    def handle_QueueBind(self, method):
+        queue = self.get_queue(str(method.queue), method)
+        if queue is None:
+            return
+        exchange = self.broker.exchanges.get(method.exchange)
+        if exchange is None:
+            self.error(spec.NOT_FOUND, "NOT_FOUND - no exchange '{}'".format(method.exchange), method)
+            return
+        if not exchange.name:
+            self.error(spec.ACCESS_REFUSED, "ACCESS_REFUSED - queues can't be bound to the default exchange", method)
+            return
+        exchange.bind(queue, str(method.routing_key))
+        if not method.no_wait:
+            self.send(spec.QueueBindOK())
+
+    def handle_QueueUnbind(self, method):
+        queue = self.get_queue(str(method.queue), method)
+        if queue is None:
+            return
+        exchange = self.broker.exchanges.get(method.exchange)
+        if exchange is not None:
+            exchange.unbind(queue, str(method.routing_key))
+        self.send(spec.QueueUnbindOK())
+
+    def handle_QueuePurge(self, method):
+        queue = self.get_queue(str(method.queue), method)
+        if queue is None:
+            return
+        count = len(queue.messages)
+        queue.messages.clear()
+        if not method.no_wait:
+            self.send(spec.QueuePurgeOK(count))
+
+    def handle_QueueDelete(self, method):
+        queue = self.broker.queues.get(method.queue)
+        count = 0
+        if queue is not None:
+            if method.if_unused and queue.consumers:
+                self.error(spec.PRECONDITION_FAILED, "PRECONDITION_FAILED - queue '{}' in use".format(queue.name), method)
+                return
+            if method.if_empty and queue.messages:
+                self.error(spec.PRECONDITION_FAILED, "PRECONDITION_FAILED - queue '{}' not empty".format(queue.name), method)
+                return
+            count = self.broker.delete_queue(queue)
+        if not method.no_wait:
+            self.send(spec.QueueDeleteOK(count))
+
+    def handle_BasicQos(self, method):
+        if method.fields['global']:
+            self.prefetch_count = method.prefetch_count
+            for consumer in list(self.consumers.values()):
+                consumer.queue.dispatch()
+        else:
+            self.consumer_prefetch_count = method.prefetch_count
+        self.send(spec.BasicQosOK())
+
+    def handle_BasicConsume(self, method):
+        queue = self.get_queue(str(method.queue), method)
+        if queue is None:
+            return
+        tag = str(method.consumer_tag) or 'amq.ctag-' + uuid.uuid4().hex
+        if tag in self.consumers:
+            self.connection.error(spec.NOT_ALLOWED, "NOT_ALLOWED - consumer tag '{}' is in use".format(tag), method)
+            return
+        consumer = Consumer(self, queue, tag, bool(method.no_ack), self.consumer_prefetch_count)
+        self.consumers[tag] = consumer
+        if not method.no_wait:
+            self.send(spec.BasicConsumeOK(tag))
+        queue.consumers.append(consumer)
+        queue.dispatch()
+
+    def handle_BasicCancel(self, method):
+        consumer = self.consumers.get(method.consumer_tag)
+        if consumer is not None:
+            self.cancel_consumer(consumer)
+        if not method.no_wait:
+            self.send(spec.BasicCancelOK(method.consumer_tag))
+
+    def handle_BasicPublish(self, method):
+        if self.publishing is not None:
+            raise UnexpectedFrame("basic.publish received in the middle of a message")
+        self.publishing = (method, None, [], 0)
+
+    def handle_BasicGet(self, method):
+        queue = self.get_queue(str(method.queue), method)
+        if queue is None:
+            return
+        if not queue.messages:
+            self.send(spec.BasicGetEmpty(''))
+            return
+        message = queue.messages.popleft()
+        self.delivery_tag += 1
+        if not method.no_ack:
+            self.unacked[self.delivery_tag] = (queue, message, None)
+        reply = spec.BasicGetOK(self.delivery_tag, message.redelivered, message.exchange, message.routing_key, len(queue.messages))
+        self.send_content(reply, message)
+
+    def handle_BasicAck(self, method):
+        tags = self.tags_up_to(method.delivery_tag, method.multiple, method)
+        if tags is not None:
+            self.settle(tags, requeue=False)
+
+    def handle_BasicReject(self, method):
+        tags = self.tags_up_to(method.delivery_tag, False, method)
+        if tags is not None:
+            self.settle(tags, requeue=bool(method.requeue))
+
+    def handle_BasicNack(self, method):
+        tags = self.tags_up_to(method.delivery_tag, method.multiple, method)
+        if tags is not None:
+            self.settle(tags, requeue=bool(method.requeue))
+
+    def handle_BasicRecover(self, method):
+        self.settle(list(self.unacked), requeue=True)
+        self.send(spec.BasicRecoverOK())
+
+    def handle_ConfirmSelect(self, method):
+        self.confirming = True
+        if not method.nowait:
+            self.send(spec.ConfirmSelectOK())
+
+
+class UnexpectedFrame(Exception):
+    pass
+
+
+class ServerConnection(asyncio.Protocol):
+    def __init__(self, broker):
+        self.broker = broker
+        self.transport = None
+        self.buffer = bytearray()
+        self.header_received = False
+        self.frame_max = broker.frame_max
+        self.channel_max = broker.channel_max
+        self.channels = {}  # id -> ServerChannel
+        self.exclusive_queues = []
+        self.write_paused = False
+        self.closing = False  # we've sent connection.close
+        self.closed = False
+        self.heartbeat_handle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.broker.connections.add(self)
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.broker.connections.discard(self)
+        if self.heartbeat_handle is not None:
+            self.heartbeat_handle.cancel()
+        for channel in list(self.channels.values()):
+            channel.release()
+        self.channels.clear()
+        for queue in self.exclusive_queues:
+            if self.broker.queues.get(queue.name) is queue:
+                self.broker.delete_queue(queue)
+
+    def pause_writing(self):
+        self.write_paused = True
+
+    def resume_writing(self):
+        self.write_paused = False
+        for channel in list(self.channels.values()):
+            for consumer in list(channel.consumers.values()):
+                consumer.queue.dispatch()
+
+    def close(self):
+        self.closed = True
+        self.transport.close()
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def send_frame(self, frame):
+        self.transport.write(frame.serialise())
+
+    def send(self, channel_id, method):
+        self.send_frame(frames.MethodFrame(channel_id, method))
+
+    def error(self, code, text, method):
+        class_id, method_id = method.method_type if method is not None else (0, 0)
+        self.send(0, spec.ConnectionClose(code, text, class_id, method_id))
+        self.closing = True
+
+    def data_received(self, data):
+        buffer = self.buffer
+        buffer.extend(data)
+        if not self.header_received:
+            if len(buffer) < len(PROTOCOL_HEADER):
+                return
+            if buffer[:len(PROTOCOL_HEADER)] != PROTOCOL_HEADER:
+                self.transport.write(PROTOCOL_HEADER)
+                self.close()
+                return
+            del buffer[:len(PROTOCOL_HEADER)]
+            self.header_received = True
+            self.send(0, spec.ConnectionStart(0, 9, {'product': 'asynqp.broker'}, 'PLAIN AMQPLAIN', 'en_US'))
+
+        while len(buffer) >= 7:
+            frame_type, channel_id, size = struct.unpack_from('!BHL', buffer)
+            if len(buffer) < size + 8:
+                return
+            if buffer[7 + size] != spec.FRAME_END:
+                self.close()
+                return
+            payload = bytes(buffer[7:7 + size])
+            del buffer[:8 + size]
+            try:
+                self.handle(frame_type, channel_id, payload)
+            except UnexpectedFrame as e:
+                self.error(spec.UNEXPECTED_FRAME, 'UNEXPECTED_FRAME - ' + str(e), None)
+            if self.closed:
+                return
+
+    def handle(self, frame_type, channel_id, payload):
+        if frame_type == spec.FRAME_HEARTBEAT:
+            return
+        if frame_type == spec.FRAME_METHOD:
+            method = spec.read_method(payload)
+            if channel_id == 0:
+                self.handle_connection_method(method)
+                return
+            if self.closing:
+                return
+            channel = self.channels.get(channel_id)
+            if channel is None:
+                if isinstance(method, spec.ChannelOpen):
+                    self.channels[channel_id] = ServerChannel(self, channel_id)
+                    self.send(channel_id, spec.ChannelOpenOK(''))
+                elif not isinstance(method, spec.ChannelCloseOK):
+                    self.error(spec.CHANNEL_ERROR, "CHANNEL_ERROR - channel {} is not open".format(channel_id), method)
+                return
+            channel.handle(method)
+            return
+        if self.closing:
+            return
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            raise UnexpectedFrame("Content frame received on channel {}, which is not open".format(channel_id))
+        if not channel.closing:
+            channel.handle_content(frame_type, payload)
+
+    def handle_connection_method(self, method):
+        if isinstance(method, spec.ConnectionStartOK):
+            self.send(0, spec.ConnectionTune(self.channel_max, self.frame_max, self.broker.heartbeat))
+        elif isinstance(method, spec.ConnectionTuneOK):
+            self.frame_max = method.frame_max or self.frame_max
+            self.channel_max = method.channel_max or self.channel_max
+            if method.heartbeat:
+                self.send_heartbeat(method.heartbeat)
+        elif isinstance(method, spec.ConnectionOpen):
+            self.send(0, spec.ConnectionOpenOK(''))
+        elif isinstance(method, spec.ConnectionClose):
+            self.send(0, spec.ConnectionCloseOK())
+            self.close()
+        elif isinstance(method, spec.ConnectionCloseOK):
+            self.close()
+
+    def send_heartbeat(self, interval):
+        self.send_frame(frames.HeartbeatFrame())
+        self.heartbeat_handle = self.broker.loop.call_later(interval, self.send_heartbeat, interval)
@@ -0,0 +1,171 @@
+import asyncio
+import collections
+from .message import settle
+
+
+class LimitedRunner(object):
+    """
+    Runs a consumer's callback for each delivery, with no more than ``limit()`` deliveries
+    in progress at once. The rest wait in a backlog in the order they arrived.
+    A limit of 0 or ``None`` means there is no limit.
+    """
+    def __init__(self, loop, callback, limit, no_ack, auto_ack):
+        self.loop = loop
+        self.callback = callback
+        self.limit = limit
+        self.no_ack = no_ack
+        self.auto_ack = auto_ack and not no_ack
+        self.running = 0
+        self.backlog = collections.deque()
+        self.in_flight = set()  # the futures for the deliveries being handled
+        self.metrics = None  # a Metrics collector, if the application has attached one
+        self.tag = None  # the consumer tag, for the metrics
+
+    def deliver(self, msg):
+        if self.full():
+            self.backlog.append(msg)
+        else:
+            self.run(msg)
+
+    def full(self):
+        limit = self.limit()
+        return bool(limit) and self.running >= limit
+
+    def run(self, msg, on_finished=None):
+        # on_finished is called when the delivery's slot is freed, before anything in the backlog takes it
+        self.running += 1
+        started = None if self.metrics is None else self.loop.time()
+        fut = self.start(msg)
+        self.in_flight.add(fut)
+        fut.add_done_callback(lambda fut: self.finished(msg, fut, started, on_finished))
+
+    def finished(self, msg, fut, started=None, on_finished=None):
+        self.running -= 1
+        self.in_flight.discard(fut)
+        self.timed(msg, started)
+        self.complete(msg, fut)
+        if on_finished is not None:
+            on_finished()
+        while self.backlog and not self.full():
+            self.run(self.backlog.popleft())
+
+    @asyncio.coroutine
+    def drain(self):
+        # wait until every delivery so far, including those in the backlog, has been handled
+        while self.in_flight:
+            yield from asyncio.wait(list(self.in_flight), loop=self.loop)
+
+    def watch(self, metrics, tag):
+        self.metrics = metrics
+        self.tag = tag
+
+    def timed(self, msg, started):
+        if started is not None and self.metrics is not None:
+            self.metrics.callback_finished(self.tag, self.loop.time() - started)
+
+    def start(self, msg):
+        raise NotImplementedError
+
+    def complete(self, msg, fut):
+        raise NotImplementedError
+
+    def failed(self, msg, exc):
+        self.loop.call_exception_handler({
+            'message': 'Exception in consumer callback',
+            'exception': exc,
+        })
+        if self.auto_ack and not msg.settled:
+            msg.reject(requeue=False)
+
+
+class ExecutorRunner(LimitedRunner):
+    """
+    Runs the callback in a :class:`concurrent.futures.Executor`, passing it a :class:`DetachedMessage`.
+    The message is settled back on the event loop once the callback has returned.
+    """
+    def __init__(self, loop, callback, limit, no_ack, executor):
+        super().__init__(loop, callback, limit, no_ack, True)
+        self.executor = executor
+
+    def start(self, msg):
+        return self.loop.run_in_executor(self.executor, call_detached, self.callback, msg.detach())
+
+    def complete(self, msg, fut):
+        if fut.cancelled():
+            return
+        exc = fut.exception()
+        if exc is not None:
+            self.failed(msg, exc)
+        elif self.auto_ack:
+            settle(msg, fut.result() or ('ack', False))
+
+
+class CoroutineRunner(LimitedRunner):
+    """
+    Runs the callback, which is a coroutine function, as a task for each delivery.
+    If ``auto_ack`` is set, the message is acked when the task finishes
+    and rejected if it fails, unless the callback settled the message itself.
+    """
+    def start(self, msg):
+        return asyncio.async(self.callback(msg), loop=self.loop)
+
+    def complete(self, msg, fut):
+        if fut.cancelled():
+            return
+        exc = fut.exception()
+        if exc is not None:
+            self.failed(msg, exc)
+        elif self.auto_ack and not msg.settled:
+            msg.ack()
+
+
+def call_detached(callback, msg):
+    # this runs in the executor, so the outcome has to travel back to the loop as the result
+    callback(msg)
+    return msg.outcome
+
+
+class KeyedRunner(object):
+    """
+    Wraps another runner so that deliveries with the same key are handled one at a time,
+    in the order they arrived, while deliveries with different keys run concurrently
+    up to the wrapped runner's limit. Keys take turns for the free slots.
+    """
+    def __init__(self, runner, key):
+        self.runner = runner
+        self.key = key
+        self.lanes = {}  # key -> the deliveries waiting behind the one in progress
+        self.ready = collections.deque()  # keys whose next delivery is only waiting for a free slot
+
+    def watch(self, metrics, tag):
+        self.runner.watch(metrics, tag)
+
+    @asyncio.coroutine
+    def drain(self):
+        # a lane's next delivery is started as soon as the one before it finishes
+        while self.lanes:
+            yield from self.runner.drain()
+
+    def deliver(self, msg):
+        key = self.key(msg)
+        lane = self.lanes.get(key)
+        if lane is not None:
+            lane.append(msg)
+            return
+        self.lanes[key] = collections.deque([msg])
+        if self.runner.full():
+            self.ready.append(key)
+        else:
+            self.run_next(key)
+
+    def run_next(self, key):
+        # the wrapped runner's own backlog is never used; the deliveries wait in their lanes instead
+        self.runner.run(self.lanes[key].popleft(), lambda: self.finished(key))
+
+    def finished(self, key):
+        if self.lanes[key]:
+            self.ready.append(key)
+        else:
+            del self.lanes[key]
+        while self.ready and not self.runner.full():
+            self.run_next(self.ready.popleft())
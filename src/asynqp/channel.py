@@ -1,5 +1,6 @@
 import asyncio
 import re
+from . import acks
 from . import bases
 from . import frames
 from . import spec
@@ -7,7 +8,9 @@ from . import queue
 from . import exchange
 from . import message
 from . import routing
-from .exceptions import UndeliverableMessage
+from . import recovery
+from . import prefetch
+from .exceptions import AMQPError, UndeliverableMessage, ChannelClosedError
 
 
 VALID_QUEUE_NAME_RE = re.compile(r'^(?!amq\.)(\w|[-.:])*$', flags=re.A)
@@ -27,17 +30,29 @@ class Channel(object):
     .. attribute::id
 
         the numerical ID of the channel
+
+    .. attribute:: closed
+
+        a :class:`~asyncio.Future` which is done when the channel has been closed,
+        whether by the application, by the broker, or because the connection was lost.
     """
-    def __init__(self, id, synchroniser, sender, basic_return_consumer, queue_factory, reader):
+    def __init__(self, id, synchroniser, sender, basic_return_consumer, queue_factory, reader, acker, confirms, declarations, closed, loop):
         self.id = id
         self.synchroniser = synchroniser
         self.sender = sender
         self.basic_return_consumer = basic_return_consumer
         self.queue_factory = queue_factory
         self.reader = reader
+        self.acker = acker
+        self.confirms = confirms
+        self.declarations = declarations
+        self.closed = closed
+        self.loop = loop
+        self.declared = {}  # declaration cache key -> the Exchange or Queue object we handed out on this channel
+        self.default_exchange = exchange.Exchange(self.reader, self.synchroniser, self.sender, self.confirms, '', 'direct', True, False, False)
 
     @asyncio.coroutine
-    def declare_exchange(self, name, type, *, durable=True, auto_delete=False, internal=False):
+    def declare_exchange(self, name, type, *, durable=True, auto_delete=False, internal=False, arguments=None, nowait=False):
         """
         Declare an :class:`Exchange` on the broker. If the exchange does not exist, it will be created.
 
@@ -48,25 +63,37 @@ class Channel(object):
         :keyword bool durable: If true, the exchange will be re-created when the server restarts.
         :keyword bool auto_delete: If true, the exchange will be deleted when the last queue is un-bound from it.
         :keyword bool internal: If true, the exchange cannot be published to directly; it can only be bound to other exchanges.
+        :keyword dict arguments: extra arguments for the declaration (for example, ``{'alternate-exchange': 'my.other.exchange'}``).
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            If the declaration fails, the server will close the channel.
 
         :return: the new :class:`Exchange` object.
         """
         if name == '':
-            return exchange.Exchange(self.reader, self.synchroniser, self.sender, name, 'direct', True, False, False)
-
-        if not VALID_EXCHANGE_NAME_RE.match(name):
-            raise ValueError("Invalid exchange name.\n"
-                             "Valid names consist of letters, digits, hyphen, underscore, period, or colon, "
-                             "and do not begin with 'amq.'")
-
-        self.sender.send_ExchangeDeclare(name, type, durable, auto_delete, internal)
-        yield from self.synchroniser.await(spec.ExchangeDeclareOK)
-        ex = exchange.Exchange(self.reader, self.synchroniser, self.sender, name, type, durable, auto_delete, internal)
-        self.reader.ready()
+            return self.default_exchange
+
+        validate_exchange_name(name)
+
+        key = exchange_key(name, type, durable, auto_delete, internal, arguments)
+        if key in self.declarations:
+            ex = self.cached(key, lambda: self.create_exchange(name, type, durable, auto_delete, internal, arguments))
+            if self.sender.topology is not None:
+                self.sender.topology.exchange_declared(ex)
+            return ex
+
+        self.sender.send_ExchangeDeclare(name, type, durable, auto_delete, internal, nowait, arguments)
+        if not nowait:
+            yield from self.synchroniser.await(spec.ExchangeDeclareOK)
+        ex = self.create_exchange(name, type, durable, auto_delete, internal, arguments)
+        self.remember(key, ex)
+        if self.sender.topology is not None:
+            self.sender.topology.exchange_declared(ex)
+        if not nowait:
+            self.reader.ready()
         return ex
 
     @asyncio.coroutine
-    def declare_queue(self, name='', *, durable=True, exclusive=False, auto_delete=False):
+    def declare_queue(self, name='', *, durable=True, exclusive=False, auto_delete=False, arguments=None, nowait=False):
         """
         Declare a queue on the broker. If the queue does not exist, it will be created.
 
@@ -83,11 +110,154 @@ class Channel(object):
         :keyword bool auto_delete: If true, the queue will be deleted when the last consumer is cancelled.
             If there were never any conusmers, the queue won't be deleted.
 
+        :keyword dict arguments: extra arguments for the declaration (for example, ``{'x-message-ttl': 60000}``).
+
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            If the declaration fails, the server will close the channel.
+            You must supply a name when using ``nowait``.
+
         :return: The new :class:`Queue` object.
         """
-        q = yield from self.queue_factory.declare(name, durable, exclusive, auto_delete)
+        key = queue_key(name, durable, exclusive, auto_delete, arguments)
+        if key in self.declarations:
+            q = self.cached(key, lambda: self.queue_factory.create(name, durable, exclusive, auto_delete, arguments))
+            if self.sender.topology is not None:
+                self.sender.topology.queue_declared(q, False)
+            return q
+
+        q = yield from self.queue_factory.declare(name, durable, exclusive, auto_delete, nowait, arguments)
+        self.remember(key, q)
+        if self.sender.topology is not None:
+            self.sender.topology.queue_declared(q, not name)
         return q
 
+    @asyncio.coroutine
+    def apply_topology(self, topology):
+        """
+        Declare a set of exchanges, queues and bindings in one go.
+
+        Every declaration is sent to the broker straight away, without waiting for
+        the reply to the previous one, and the replies are then collected in order,
+        so the whole topology costs roughly one round trip.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :param dict topology: a dictionary with up to three keys -
+            ``'exchanges'``, ``'queues'`` and ``'bindings'`` - each of which is a list of dictionaries.
+            Exchanges and queues are described by the arguments to :meth:`declare_exchange`
+            and :meth:`declare_queue`; bindings have ``'queue'``, ``'exchange'`` and ``'routing_key'``
+            keys naming a queue and an exchange from the same topology, and optional ``'arguments'``.
+            For example::
+
+                yield from channel.apply_topology({
+                    'exchanges': [{'name': 'orders', 'type': 'topic'}],
+                    'queues': [{'name': 'orders.eu', 'arguments': {'x-message-ttl': 60000}}],
+                    'bindings': [{'queue': 'orders.eu', 'exchange': 'orders', 'routing_key': 'eu.#'}]
+                })
+
+            Queues must be given a name. Server-named queues should be declared using :meth:`declare_queue`.
+
+        :return: a dictionary mapping each exchange and queue name to the new :class:`Exchange`
+            or :class:`Queue` object, and each ``(queue_name, exchange_name, routing_key)`` triple
+            to the new :class:`QueueBinding` object.
+            If a declaration fails, the server will close the channel and no objects are returned.
+        """
+        Queue, QueueBinding, Exchange = queue.Queue, queue.QueueBinding, exchange.Exchange  # the bindings' keys shadow the modules
+        declared = {}
+        steps = []  # (send, expected reply) in the order the methods will be sent
+
+        def add(key, obj):
+            if key in declared:
+                raise ValueError("{!r} appears more than once in the topology".format(key))
+            declared[key] = obj
+
+        def exchange_step(name, type='direct', *, durable=True, auto_delete=False, internal=False, arguments=None):
+            if name == '':
+                add(name, self.default_exchange)
+                return
+            validate_exchange_name(name)
+            key = exchange_key(name, type, durable, auto_delete, internal, arguments)
+            if key in self.declarations:
+                add(name, self.cached(key, lambda: self.create_exchange(name, type, durable, auto_delete, internal, arguments)))
+                return
+            add(name, self.create_exchange(name, type, durable, auto_delete, internal, arguments))
+            steps.append((lambda: self.sender.send_ExchangeDeclare(name, type, durable, auto_delete, internal, False, arguments),
+                          spec.ExchangeDeclareOK, key))
+
+        def queue_step(name, *, durable=True, exclusive=False, auto_delete=False, arguments=None):
+            queue.validate_queue_name(name)
+            if not name:
+                raise ValueError("Queues in a topology must be given a name.")
+            key = queue_key(name, durable, exclusive, auto_delete, arguments)
+            if key in self.declarations:
+                add(name, self.cached(key, lambda: self.queue_factory.create(name, durable, exclusive, auto_delete, arguments)))
+                return
+            add(name, self.queue_factory.create(name, durable, exclusive, auto_delete, arguments))
+            steps.append((lambda: self.sender.send_QueueDeclare(name, durable, exclusive, auto_delete, False, arguments),
+                          spec.QueueDeclareOK, key))
+
+        def binding_step(queue, exchange, routing_key, *, arguments=None):
+            q = declared.get(queue)
+            ex = declared.get(exchange)
+            if not isinstance(q, Queue) or not isinstance(ex, Exchange):
+                raise ValueError("Binding from {!r} to {!r} refers to a queue or exchange "
+                                 "which isn't in the topology".format(queue, exchange))
+            add((queue, exchange, routing_key),
+                QueueBinding(self.reader, self.sender, self.synchroniser, q, ex, routing_key, arguments))
+            steps.append((lambda: self.sender.send_QueueBind(queue, exchange, routing_key, False, arguments),
+                          spec.QueueBindOK, None))
+
+        # check the whole topology before sending anything,
+        # so that a mistake doesn't leave replies on the wire which nobody is waiting for
+        for kwargs in topology.get('exchanges', ()):
+            exchange_step(**kwargs)
+        for kwargs in topology.get('queues', ()):
+            queue_step(**kwargs)
+        for kwargs in topology.get('bindings', ()):
+            binding_step(**kwargs)
+
+        futures = []
+        for send, reply, _ in steps:
+            send()
+            futures.append(self.synchroniser.await(reply))
+
+        try:
+            for fut, (_, _, key) in zip(futures, steps):
+                yield from fut
+                if key is not None:
+                    self.remember(key, declared[key[1]])
+                self.reader.ready()
+        finally:
+            # if the channel got closed, the replies we didn't get round to have all failed too
+            for fut in futures:
+                if fut.done() and not fut.cancelled():
+                    fut.exception()
+
+        topology = self.sender.topology
+        if topology is not None:
+            for obj in declared.values():
+                if isinstance(obj, Exchange):
+                    topology.exchange_declared(obj)
+                elif isinstance(obj, Queue):
+                    topology.queue_declared(obj, False)
+                else:
+                    topology.bound(obj)
+        return declared
+
+    def create_exchange(self, name, type, durable, auto_delete, internal, arguments):
+        return exchange.Exchange(self.reader, self.synchroniser, self.sender, self.confirms, name, type, durable, auto_delete, internal, arguments)
+
+    def cached(self, key, create):
+        obj = self.declared.get(key)
+        if obj is None or getattr(obj, 'deleted', False):
+            # declared on another channel, or deleted and declared again since
+            obj = self.declared[key] = create()
+        return obj
+
+    def remember(self, key, obj):
+        if self.declarations.add(key):
+            self.declared[key] = obj
+
     @asyncio.coroutine
     def close(self):
         """
@@ -95,9 +265,23 @@ class Channel(object):
 
         This method is a :ref:`coroutine <coroutine>`.
         """
+        self.acker.flush()
         self.sender.send_Close(0, 'Channel closed by application', 0, 0)
         yield from self.synchroniser.await(spec.ChannelCloseOK)
         # don't call self.reader.ready - stop reading frames from the q
+        if not self.closed.done():  # the connection's being recovered, so nobody replied
+            self.closed.set_result(None)
+
+    @asyncio.coroutine
+    def cancel_consumers(self):
+        """
+        Cancel every :class:`Consumer` on the channel, so that no more messages are delivered to it.
+        The cancellations are all sent before waiting for the replies.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        consumers = [c for c in self.queue_factory.consumers.consumers.values() if isinstance(c, queue.Consumer)]
+        yield from asyncio.gather(*[c.cancel() for c in consumers], loop=self.loop)
 
     @asyncio.coroutine
     def set_qos(self, prefetch_size=0, prefetch_count=0, apply_globally=False):
@@ -127,8 +311,102 @@ class Channel(object):
         """
         self.sender.send_BasicQos(prefetch_size, prefetch_count, apply_globally)
         yield from self.synchroniser.await(spec.BasicQosOK)
+        self.queue_factory.consumers.prefetch_count = prefetch_count
+        if self.sender.topology is not None:
+            self.sender.topology.qos = (prefetch_size, prefetch_count, apply_globally)
         self.reader.ready()
 
+    def autotune_prefetch(self, *, min_count=1, max_count=1000, interval=1):
+        """
+        Keep adjusting the channel's prefetch count, within the given bounds,
+        to keep its consumers busy without leaving messages waiting in the client.
+        See :class:`PrefetchTuner` for how the count is chosen.
+
+        The tuner takes over from :meth:`set_qos`, using a limit which applies to the whole channel.
+
+        :keyword int min_count: the smallest prefetch count to set.
+        :keyword int max_count: the largest prefetch count to set.
+        :keyword float interval: how often, in seconds, to measure and adjust.
+
+        :return: the running :class:`PrefetchTuner`. Call its :meth:`~PrefetchTuner.stop` method to stop tuning.
+        """
+        if self.acker.tuner is not None:
+            self.acker.tuner.stop()
+        tuner = prefetch.PrefetchTuner(self, min_count=min_count, max_count=max_count, interval=interval, loop=self.loop)
+        tuner.start()
+        return tuner
+
+    @asyncio.coroutine
+    def enable_confirms(self):
+        """
+        Put the channel into publisher-confirm mode (a RabbitMQ extension to AMQP).
+
+        Once confirms are enabled, :meth:`Exchange.publish() <Exchange.publish>` returns a
+        :class:`~asyncio.Future` for each message, which will be resolved when the broker
+        acknowledges the message. Many messages can be in flight at once; use
+        :meth:`wait_for_confirms` to wait for all of them.
+        Messages published while waiting for the broker to reply are confirmed too.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        if self.confirms.enabled:
+            return
+        self.sender.send_ConfirmSelect()
+        # the broker numbers every message published after the confirm.select,
+        # whether or not we've had its reply yet
+        self.confirms.enabled = True
+        yield from self.synchroniser.await(spec.ConfirmSelectOK)
+        self.reader.ready()
+
+    @asyncio.coroutine
+    def wait_for_confirms(self):
+        """
+        Wait until the broker has acked or nacked every message published so far on this channel.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :return: ``True`` if all of the messages were acked, ``False`` if any were nacked.
+        """
+        results = yield from self.confirms.wait()
+        return all(results)
+
+    def set_ack_coalescing(self, max_count=100, max_delay=0.05):
+        """
+        Coalesce the acknowledgements for messages delivered on this channel.
+
+        Calls to :meth:`IncomingMessage.ack() <IncomingMessage.ack>` and
+        :meth:`IncomingMessage.nack() <IncomingMessage.nack>` are buffered until
+        ``max_count`` of them have accumulated or ``max_delay`` seconds have passed since the first one.
+        The buffered acks are then sent as a single ``multiple=True`` ack covering every message
+        up to the highest contiguous acknowledged delivery tag (or one ``multiple=True`` ack or nack
+        for each stretch of messages with the same outcome), followed by individual acks for
+        messages that were acknowledged out of order. Buffered acks are flushed when the channel is closed.
+
+        ``max_count`` should be smaller than the prefetch count set by :meth:`set_qos`,
+        otherwise the broker will stop delivering messages until ``max_delay`` has passed.
+
+        Acks for messages which were delivered before this method was called are sent individually.
+        Calling it again changes the limits.
+
+        :param int max_count: The number of acks which will cause the buffer to be flushed.
+        :param float max_delay: The maximum number of seconds an ack will be held back.
+        """
+        self.acker.coalesce(max_count, max_delay)
+
+    def nack_all_up_to(self, delivery_tag, *, requeue=True):
+        """
+        Reject every unacknowledged message delivered on this channel,
+        up to and including the message with the given delivery tag, using a single ``basic.nack``.
+
+        ``basic.nack`` is a RabbitMQ extension to AMQP.
+
+        :param int delivery_tag: the delivery tag of the last message to reject.
+            A delivery tag of ``0`` rejects every unacknowledged message on the channel.
+        :keyword bool requeue: if true, the broker will attempt to requeue the
+            messages and deliver them to an alternate consumer.
+        """
+        self.acker.nack_all_up_to(delivery_tag, requeue)
+
     def set_return_handler(self, handler):
         """
         Set ``handler`` as the callback function for undeliverable messages
@@ -144,45 +422,182 @@ class Channel(object):
         self.basic_return_consumer.set_callback(handler)
 
 
+def validate_exchange_name(name):
+    if not VALID_EXCHANGE_NAME_RE.match(name):
+        raise ValueError("Invalid exchange name.\n"
+                         "Valid names consist of letters, digits, hyphen, underscore, period, or colon, "
+                         "and do not begin with 'amq.'")
+
+
+def exchange_key(name, type, durable, auto_delete, internal, arguments):
+    return ('exchange', name, auto_delete, type, durable, internal, freeze(arguments))
+
+
+def queue_key(name, durable, exclusive, auto_delete, arguments):
+    return ('queue', name, auto_delete, durable, exclusive, freeze(arguments))
+
+
+def freeze(arguments):
+    if isinstance(arguments, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in arguments.items()))
+    return arguments or ()
+
+
+class DeclarationCache(object):
+    """
+    Remembers the exchanges and queues which have been declared on a connection,
+    and the arguments they were declared with, so that declaring them again
+    doesn't cost a round trip to the broker.
+
+    Anything the broker might delete behind our back - server-named and auto-delete
+    queues and exchanges - is never cached. An entry is forgotten as soon as a delete
+    for its name is sent, and the whole cache is cleared when the broker closes a channel
+    (we might have been told that a declaration didn't match what's on the broker)
+    or the connection is lost.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.declared = {}  # (kind, name) -> key
+
+    def __contains__(self, key):
+        return self.enabled and self.declared.get(key[:2]) == key
+
+    def add(self, key):
+        kind, name, auto_delete = key[:3]
+        if not self.enabled or not name or auto_delete:
+            return False
+        self.declared[key[:2]] = key
+        return True
+
+    def forget(self, kind, name):
+        self.declared.pop((kind, name), None)
+
+    def clear(self):
+        self.declared.clear()
+
+
+class ChannelIdAllocator(object):
+    """
+    Hands out channel ids, lowest first, reusing the ids of channels which have been closed.
+    The ids in use are the set bits of an integer, so finding a free one is a couple of big-integer operations.
+    """
+    def __init__(self):
+        self.used = 1  # bit 0 is channel 0, which belongs to the connection
+
+    def allocate(self, channel_max):
+        lowest_free_bit = ~self.used & (self.used + 1)
+        channel_id = lowest_free_bit.bit_length() - 1
+        if channel_id > channel_max:
+            raise AMQPError("All {} channels allowed on the connection are in use".format(channel_max))
+        self.used |= lowest_free_bit
+        return channel_id
+
+    def free(self, channel_id):
+        self.used &= ~(1 << channel_id)
+
+
 class ChannelFactory(object):
-    def __init__(self, loop, protocol, dispatcher, connection_info):
+    def __init__(self, loop, protocol, dispatcher, connection_info, declarations):
         self.loop = loop
         self.protocol = protocol
         self.dispatcher = dispatcher
         self.connection_info = connection_info
-        self.next_channel_id = 1
+        self.declarations = declarations
+        self.channel_ids = ChannelIdAllocator()
+        self.channels = {}  # id -> the open Channel
+        self.metrics = None  # a Metrics collector, if the application has attached one
+        self.topologies = False  # whether channels remember what's declared on them, so they can be recovered
 
     @asyncio.coroutine
     def open(self):
+        channel_id = self.channel_ids.allocate(self.connection_info.channel_max)
         synchroniser = routing.Synchroniser()
 
-        sender = ChannelMethodSender(self.next_channel_id, self.protocol, self.connection_info)
+        topology = recovery.Topology() if self.topologies else None
+        sender = ChannelMethodSender(channel_id, self.protocol, self.connection_info, self.declarations, topology)
+        acker = acks.Acknowledger(self.loop, sender)
+        confirms = acks.PublisherConfirms(self.loop)
         basic_return_consumer = BasicReturnConsumer()
         consumers = queue.Consumers(self.loop)
         consumers.add_consumer(basic_return_consumer)
 
-        handler = ChannelFrameHandler(synchroniser, sender)
+        closed = asyncio.Future(loop=self.loop)
+        handler = ChannelFrameHandler(synchroniser, sender, acker, confirms, self.declarations, closed)
         reader, writer = routing.create_reader_and_writer(handler)
-        handler.message_receiver = MessageReceiver(synchroniser, sender, consumers, reader)
+        handler.reader = reader
+        handler.message_receiver = MessageReceiver(synchroniser, acker, consumers, reader)
 
         queue_factory = queue.QueueFactory(sender, synchroniser, reader, consumers)
-        channel = Channel(self.next_channel_id, synchroniser, sender, basic_return_consumer, queue_factory, reader)
+        channel = Channel(channel_id, synchroniser, sender, basic_return_consumer, queue_factory, reader, acker, confirms, self.declarations, closed, self.loop)
+        if self.metrics is not None:
+            self.watch(channel, self.metrics)
 
-        self.dispatcher.add_writer(self.next_channel_id, writer)
+        self.dispatcher.add_writer(channel_id, writer)
+        sender.send_ChannelOpen()
+        reader.ready()
+        opened = synchroniser.await(spec.ChannelOpenOK)
         try:
-            sender.send_ChannelOpen()
-            reader.ready()
-            yield from synchroniser.await(spec.ChannelOpenOK)
+            yield from opened
+        except asyncio.CancelledError:
+            # the broker opens the channel anyway, so its id can't be reused until it's been closed again.
+            # nothing else can be waiting on the new channel, so wait for the reply in the cancelled future's place
+            if opened.cancelled():
+                synchroniser.forget(opened)
+                opened = synchroniser.await(spec.ChannelOpenOK)
+            asyncio.async(self.abandon(channel, opened), loop=self.loop)
+            raise
         except:
-            self.dispatcher.remove_writer(self.next_channel_id)
+            self.reclaim(channel_id)
             raise
 
-        self.next_channel_id += 1
+        closed.add_done_callback(lambda fut: self.reclaim(channel_id))
+        self.channels[channel_id] = channel
         reader.ready()
         return channel
 
+    @asyncio.coroutine
+    def abandon(self, channel, opened):
+        try:
+            yield from opened
+            channel.reader.ready()
+            yield from channel.close()
+        except ConnectionError:
+            pass  # the channel or the connection was closed, so nothing more will arrive on it
+        finally:
+            self.reclaim(channel.id)
+
+    def keep_topologies(self):
+        self.topologies = True
+        for channel in self.channels.values():
+            if channel.sender.topology is None:
+                channel.sender.topology = recovery.Topology()
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+        for channel in self.channels.values():
+            self.watch(channel, metrics)
+
+    def watch(self, channel, metrics):
+        channel.synchroniser.metrics = metrics
+        channel.acker.metrics = metrics
+        channel.queue_factory.consumers.set_metrics(metrics)
+
+    def reclaim(self, channel_id):
+        # once the channel's closed, nothing else should arrive on it,
+        # so the dispatcher can let go of its queue and the id can be reused
+        self.dispatcher.remove_writer(channel_id)
+        self.channel_ids.free(channel_id)
+        self.channels.pop(channel_id, None)
+
 
 class ChannelFrameHandler(bases.FrameHandler):
+    def __init__(self, synchroniser, sender, acker, confirms, declarations, closed):
+        super().__init__(synchroniser, sender)
+        self.acker = acker
+        self.confirms = confirms
+        self.declarations = declarations
+        self.closed = closed
+
     def handle_ChannelOpenOK(self, frame):
         self.synchroniser.notify(spec.ChannelOpenOK)
 
@@ -208,7 +623,7 @@ class ChannelFrameHandler(bases.FrameHandler):
         self.synchroniser.notify(spec.QueueDeleteOK)
 
     def handle_BasicGetEmpty(self, frame):
-        self.synchroniser.notify(spec.BasicGetEmpty, False)
+        self.synchroniser.notify(spec.BasicGetEmpty, None)
 
     def handle_BasicGetOK(self, frame):
         asyncio.async(self.message_receiver.receive_getOK(frame))
@@ -229,34 +644,81 @@ class ChannelFrameHandler(bases.FrameHandler):
         asyncio.async(self.message_receiver.receive_body(frame))
 
     def handle_ChannelClose(self, frame):
+        exc = ChannelClosedError(frame.payload.reply_code, frame.payload.reply_text)
+        self.declarations.clear()
+        self.acker.discard()
+        self.confirms.fail(exc)
         self.sender.send_CloseOK()
-        self.synchroniser.killall(ConnectionError)
+        self.synchroniser.killall(exc)
+        self.set_closed()
+
+    def handle_ConnectionClosedPoisonPillFrame(self, frame):
+        self.declarations.clear()
+        self.acker.discard()
+        self.confirms.fail(ConnectionError)
+        super().handle_ConnectionClosedPoisonPillFrame(frame)
+        self.set_closed()
+
+    def handle_ConnectionSuspendedPoisonPillFrame(self, frame):
+        # the channel will be opened again on the new connection, so it stays open,
+        # but nothing which was waiting for a reply is going to get one
+        self.acker.discard()
+        self.confirms.fail(ConnectionError)
+        super().handle_ConnectionSuspendedPoisonPillFrame(frame)
+        self.reader.ready()
+
+    def handle_ConnectionResumedFrame(self, frame):
+        self.synchroniser.reset()
+        self.reader.ready()
+        frame.handled.set_result(None)
 
     def handle_ChannelCloseOK(self, frame):
+        exc = ChannelClosedError(0, 'Channel closed by application')
         self.synchroniser.notify(spec.ChannelCloseOK)
+        self.confirms.fail(exc)
+        self.synchroniser.killall(exc)
+        self.set_closed()
+
+    def set_closed(self):
+        if not self.closed.done():
+            self.closed.set_result(None)
 
     def handle_BasicQosOK(self, frame):
         self.synchroniser.notify(spec.BasicQosOK)
 
+    def handle_ConfirmSelectOK(self, frame):
+        self.synchroniser.notify(spec.ConfirmSelectOK)
+
+    def handle_BasicAck(self, frame):
+        self.confirms.confirm(frame.payload.delivery_tag, frame.payload.multiple, True)
+        self.reader.ready()
+
+    def handle_BasicNack(self, frame):
+        self.confirms.confirm(frame.payload.delivery_tag, frame.payload.multiple, False)
+        self.reader.ready()
+
     def handle_BasicReturn(self, frame):
         asyncio.async(self.message_receiver.receive_return(frame))
 
 
 class MessageReceiver(object):
-    def __init__(self, synchroniser, sender, consumers, reader):
+    def __init__(self, synchroniser, acker, consumers, reader):
         self.synchroniser = synchroniser
-        self.sender = sender
+        self.acker = acker
         self.consumers = consumers
         self.reader = reader
         self.message_builder = None
 
+    # The header and body frames of a message are handled here, as they arrive,
+    # and the synchroniser is only told about a basic.get-ok when the whole message is in.
+    # So every reply which a coroutine is awaiting arrives as a single notification,
+    # and several operations can be outstanding on a channel at once.
     @asyncio.coroutine
     def receive_getOK(self, frame):
-        self.synchroniser.notify(spec.BasicGetOK, True)
         payload = frame.payload
         self.message_builder = message.MessageBuilder(
-            self.sender,
-            payload.delivery_tag,
+            self.acker,
+            self.acker.delivered(payload.delivery_tag),
             payload.redelivered,
             payload.exchange,
             payload.routing_key
@@ -267,8 +729,8 @@ class MessageReceiver(object):
     def receive_deliver(self, frame):
         payload = frame.payload
         self.message_builder = message.MessageBuilder(
-            self.sender,
-            payload.delivery_tag,
+            self.acker,
+            self.acker.delivered(payload.delivery_tag),
             payload.redelivered,
             payload.exchange,
             payload.routing_key,
@@ -276,13 +738,11 @@ class MessageReceiver(object):
         )
         self.reader.ready()
 
-        yield from self.async_receive()
-
     @asyncio.coroutine
     def receive_return(self, frame):
         payload = frame.payload
         self.message_builder = message.MessageBuilder(
-            self.sender,
+            self.acker,
             '',
             '',
             payload.exchange,
@@ -291,73 +751,78 @@ class MessageReceiver(object):
         )
         self.reader.ready()
 
-        yield from self.async_receive()
-
-    @asyncio.coroutine
-    def async_receive(self):
-        yield from self.synchroniser.await(frames.ContentHeaderFrame)
-        tag, msg = yield from self.synchroniser.await(frames.ContentBodyFrame)
-
-        self.consumers.deliver(tag, msg)
-        self.reader.ready()
-
     @asyncio.coroutine
     def receive_header(self, frame):
-        self.synchroniser.notify(frames.ContentHeaderFrame)
         self.message_builder.set_header(frame.payload)
+        if self.message_builder.done():  # an empty message has no body frames
+            self.message_done()
+            return
         self.reader.ready()
 
     @asyncio.coroutine
     def receive_body(self, frame):
         self.message_builder.add_body_chunk(frame.payload)
         if self.message_builder.done():
-            msg = self.message_builder.build()
-            tag = self.message_builder.consumer_tag
-            self.synchroniser.notify(frames.ContentBodyFrame, (tag, msg))
-            self.message_builder = None
-            # don't call self.reader.ready() if the message is all here -
-            # get() or async_receive() will call
-            # it when they have finished processing the completed msg
+            self.message_done()
             return
         self.reader.ready()
 
+    def message_done(self):
+        msg = self.message_builder.build()
+        tag = self.message_builder.consumer_tag
+        self.message_builder = None
+        if tag is None:
+            # don't call self.reader.ready() -
+            # get() will call it when it has finished processing the completed msg
+            self.synchroniser.notify(spec.BasicGetOK, msg)
+            return
+        self.consumers.deliver(tag, msg)
+        self.reader.ready()
+
 
 # basically just a collection of aliases with some arguments hard coded for convenience
 class ChannelMethodSender(bases.Sender):
-    def __init__(self, channel_id, protocol, connection_info):
+    def __init__(self, channel_id, protocol, connection_info, declarations, topology):
         super().__init__(channel_id, protocol)
         self.connection_info = connection_info
+        self.declarations = declarations
+        self.topology = topology
 
     def send_ChannelOpen(self):
         self.send_method(spec.ChannelOpen(''))
 
-    def send_ExchangeDeclare(self, name, type, durable, auto_delete, internal):
-        self.send_method(spec.ExchangeDeclare(0, name, type, False, durable, auto_delete, internal, False, {}))
+    def send_ConfirmSelect(self):
+        self.send_method(spec.ConfirmSelect(False))
+
+    def send_ExchangeDeclare(self, name, type, durable, auto_delete, internal, nowait=False, arguments=None):
+        self.send_method(spec.ExchangeDeclare(0, name, type, False, durable, auto_delete, internal, nowait, arguments or {}))
 
-    def send_ExchangeDelete(self, name, if_unused):
-        self.send_method(spec.ExchangeDelete(0, name, if_unused, False))
+    def send_ExchangeDelete(self, name, if_unused, nowait=False):
+        self.declarations.forget('exchange', name)
+        self.send_method(spec.ExchangeDelete(0, name, if_unused, nowait))
 
-    def send_QueueDeclare(self, name, durable, exclusive, auto_delete):
-        self.send_method(spec.QueueDeclare(0, name, False, durable, exclusive, auto_delete, False, {}))
+    def send_QueueDeclare(self, name, durable, exclusive, auto_delete, nowait=False, arguments=None):
+        self.send_method(spec.QueueDeclare(0, name, False, durable, exclusive, auto_delete, nowait, arguments or {}))
 
-    def send_QueueBind(self, queue_name, exchange_name, routing_key):
-        self.send_method(spec.QueueBind(0, queue_name, exchange_name, routing_key, False, {}))
+    def send_QueueBind(self, queue_name, exchange_name, routing_key, nowait=False, arguments=None):
+        self.send_method(spec.QueueBind(0, queue_name, exchange_name, routing_key, nowait, arguments or {}))
 
-    def send_QueueUnbind(self, queue_name, exchange_name, routing_key):
-        self.send_method(spec.QueueUnbind(0, queue_name, exchange_name, routing_key, {}))
+    def send_QueueUnbind(self, queue_name, exchange_name, routing_key, arguments=None):
+        self.send_method(spec.QueueUnbind(0, queue_name, exchange_name, routing_key, arguments or {}))
 
     def send_QueuePurge(self, queue_name):
         self.send_method(spec.QueuePurge(0, queue_name, False))
 
-    def send_QueueDelete(self, queue_name, if_unused, if_empty):
-        self.send_method(spec.QueueDelete(0, queue_name, if_unused, if_empty, False))
+    def send_QueueDelete(self, queue_name, if_unused, if_empty, nowait=False):
+        self.declarations.forget('queue', queue_name)
+        self.send_method(spec.QueueDelete(0, queue_name, if_unused, if_empty, nowait))
 
     def send_BasicPublish(self, exchange_name, routing_key, mandatory, message):
         self.send_method(spec.BasicPublish(0, exchange_name, routing_key, mandatory, False))
         self.send_content(message)
 
-    def send_BasicConsume(self, queue_name, no_local, no_ack, exclusive):
-        self.send_method(spec.BasicConsume(0, queue_name, '', no_local, no_ack, exclusive, False, {}))
+    def send_BasicConsume(self, queue_name, no_local, no_ack, exclusive, consumer_tag='', nowait=False):
+        self.send_method(spec.BasicConsume(0, queue_name, consumer_tag, no_local, no_ack, exclusive, nowait, {}))
 
     def send_BasicCancel(self, consumer_tag):
         self.send_method(spec.BasicCancel(consumer_tag, False))
@@ -365,8 +830,11 @@ class ChannelMethodSender(bases.Sender):
     def send_BasicGet(self, queue_name, no_ack):
         self.send_method(spec.BasicGet(0, queue_name, no_ack))
 
-    def send_BasicAck(self, delivery_tag):
-        self.send_method(spec.BasicAck(delivery_tag, False))
+    def send_BasicAck(self, delivery_tag, multiple):
+        self.send_method(spec.BasicAck(delivery_tag, multiple))
+
+    def send_BasicNack(self, delivery_tag, multiple, requeue):
+        self.send_method(spec.BasicNack(delivery_tag, multiple, requeue))
 
     def send_BasicReject(self, delivery_tag, redeliver):
         self.send_method(spec.BasicReject(delivery_tag, redeliver))
@@ -392,6 +860,8 @@ class ChannelMethodSender(bases.Sender):
 
 class BasicReturnConsumer(object):
     tag = -1  # a 'real' tag is a string so there will never be a clash
+    no_ack = False  # returned messages don't get acked at all
+    runner = None
 
     def __init__(self):
         self.callback = self.default_behaviour
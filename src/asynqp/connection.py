@@ -1,6 +1,9 @@
 import asyncio
+import socket
 import sys
 from . import channel
+from . import pool
+from . import recovery
 from . import bases
 from . import spec
 from . import routing
@@ -40,12 +43,17 @@ class Connection(object):
         The :class:`~asyncio.Protocol` which is paired with the transport
     """
     def __init__(self, loop, transport, protocol, synchroniser, sender, dispatcher, connection_info):
+        self.loop = loop
         self.transport = transport
         self.protocol = protocol
         self.synchroniser = synchroniser
         self.sender = sender
-        self.channel_factory = channel.ChannelFactory(loop, protocol, dispatcher, connection_info)
+        self.dispatcher = dispatcher
+        self.declarations = channel.DeclarationCache()
+        self.channel_factory = channel.ChannelFactory(loop, protocol, dispatcher, connection_info, self.declarations)
         self.connection_info = connection_info
+        self.recovery = None
+        self.metrics = None
 
         # this is ugly. when the connection is closing, all methods other than ConnectionCloseOK
         # should be ignored. at the moment this behaviour is part of the dispatcher
@@ -60,12 +68,96 @@ class Connection(object):
         Open a new channel on this connection.
 
         This method is a :ref:`coroutine <coroutine>`.
+        Several calls to it can be in progress at once.
 
         :return: The new :class:`Channel` object.
         """
         channel = yield from self.channel_factory.open()
         return channel
 
+    @asyncio.coroutine
+    def open_channels(self, n):
+        """
+        Open ``n`` new channels on this connection.
+
+        All of the ``channel.open`` methods are sent before waiting for any of the replies,
+        so opening many channels takes about as long as opening one.
+        If any of the channels can't be opened, the ones which were opened are closed again.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :param int n: the number of channels to open.
+
+        :return: a list of the new :class:`Channel` objects.
+        """
+        # schedule the tasks ourselves so that they're started (and the ids handed out) in order
+        tasks = [asyncio.async(self.channel_factory.open(), loop=self.loop) for _ in range(n)]
+        results = yield from asyncio.gather(*tasks, loop=self.loop, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            for result in results:
+                if not isinstance(result, BaseException) and not result.closed.done():
+                    yield from result.close()
+            raise errors[0]
+        return results
+
+    def channel_pool(self, size=10):
+        """
+        Create a :class:`ChannelPool` which shares up to ``size`` channels on this connection
+        between concurrent tasks.
+
+        Channels are opened as they are needed, so creating the pool doesn't contact the broker.
+
+        :param int size: the maximum number of channels in the pool.
+
+        :return: the new :class:`ChannelPool` object.
+        """
+        return pool.ChannelPool(self, size, loop=self.loop)
+
+    def enable_declaration_cache(self):
+        """
+        Remember the exchanges and queues declared on this connection's channels.
+
+        Once the cache is enabled, declaring an exchange or queue with the same name
+        and arguments as an earlier declaration returns an :class:`Exchange` or :class:`Queue`
+        object straight away, without asking the broker. On the channel which made the
+        earlier declaration the same object is returned.
+
+        Server-named and ``auto_delete`` queues and exchanges are never cached.
+        The cache forgets an exchange or queue when it is deleted,
+        and is cleared when the broker closes a channel or the connection is lost.
+        """
+        self.declarations.enabled = True
+
+    def set_metrics(self, metrics):
+        """
+        Report measurements of this connection and its channels to a collector.
+
+        The collector is told about the frames and bytes sent and received on each channel,
+        the time taken to parse frames, the size of the write buffer,
+        the messages delivered, acked and rejected and the time they took to settle,
+        how long consumers' callbacks took, and how long each reply from the broker was waited for.
+        It carries on being used if the connection is recovered.
+
+        :param metrics: a :class:`Metrics` object, such as an :class:`InMemoryMetrics`,
+            or ``None`` to stop measuring.
+        """
+        self.metrics = metrics
+        self.protocol.metrics = metrics
+        self.synchroniser.metrics = metrics
+        self.channel_factory.set_metrics(metrics)
+
+    def set_tracer(self, tracer):
+        """
+        Tell a tracer about every frame received, dispatched to a channel, or sent on this connection.
+        The tracer carries on being used if the connection is recovered.
+
+        :param tracer: a :class:`Tracer` object, such as a :class:`RingBufferTracer`,
+            or ``None`` to stop tracing.
+        """
+        # the hooks look the tracer up on the class unless it's been set on the instance
+        self.protocol.tracer = self.dispatcher.tracer = tracer
+
     @asyncio.coroutine
     def close(self):
         """
@@ -74,16 +166,45 @@ class Connection(object):
         This method is a :ref:`coroutine <coroutine>`.
         """
         self.closing.set_result(True)
+        if self.recovery is not None:
+            self.recovery.cancel()
         self.sender.send_Close(0, 'Connection closed by application', 0, 0)
         yield from self.synchroniser.await(spec.ConnectionCloseOK)
 
+    @asyncio.coroutine
+    def resume(self, transport, protocol, *, frame_max=None, channel_max=None, heartbeat=None):
+        # carry on over a new connection to the broker, keeping the same channels
+        self.transport = transport
+        self.protocol = protocol
+        self.synchroniser = routing.Synchroniser()
+        self.sender = ConnectionMethodSender(protocol)
+        self.channel_factory.protocol = protocol
+        protocol.metrics = self.synchroniser.metrics = self.metrics
+        protocol.tracer = self.dispatcher.tracer
+        self.declarations.clear()
+        yield from handshake(self, frame_max, channel_max, heartbeat)
+
+        channels = list(self.channel_factory.channels.values())
+        tasks = [asyncio.async(recovery.resume_channel(c, self.dispatcher, protocol), loop=self.loop) for c in channels]
+        results = yield from asyncio.gather(*tasks, loop=self.loop, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+
 
 @asyncio.coroutine
-def open_connection(loop, transport, protocol, dispatcher, connection_info):
+def open_connection(loop, transport, protocol, dispatcher, connection_info, *, frame_max=None, channel_max=None, heartbeat=None):
     synchroniser = routing.Synchroniser()
-
     sender = ConnectionMethodSender(protocol)
     connection = Connection(loop, transport, protocol, synchroniser, sender, dispatcher, connection_info)
+    yield from handshake(connection, frame_max, channel_max, heartbeat)
+    return connection
+
+
+@asyncio.coroutine
+def handshake(connection, frame_max, channel_max, heartbeat):
+    synchroniser, sender, protocol = connection.synchroniser, connection.sender, connection.protocol
+    dispatcher, connection_info = connection.dispatcher, connection.connection_info
     handler = ConnectionFrameHandler(synchroniser, sender, protocol, connection)
 
     reader, writer = routing.create_reader_and_writer(handler)
@@ -105,10 +226,13 @@ def open_connection(loop, transport, protocol, dispatcher, connection_info):
         reader.ready()
 
         frame = yield from synchroniser.await(spec.ConnectionTune)
-        # just agree with whatever the server wants. Make this configurable in future
-        connection_info.frame_max = frame.payload.frame_max
-        heartbeat_interval = frame.payload.heartbeat
-        sender.send_TuneOK(frame.payload.channel_max, frame.payload.frame_max, heartbeat_interval)
+        tuned_frame_max = negotiate(frame_max, frame.payload.frame_max)
+        tuned_channel_max = negotiate(channel_max, frame.payload.channel_max)
+        # the server's heartbeat is only a proposal - the spec leaves the choice to the client
+        heartbeat_interval = frame.payload.heartbeat if heartbeat is None else heartbeat
+        connection_info.frame_max = tuned_frame_max
+        connection_info.channel_max = tuned_channel_max or 65535  # 0 means no limit
+        sender.send_TuneOK(tuned_channel_max, tuned_frame_max, heartbeat_interval)
 
         sender.send_Open(connection_info.virtual_host)
         protocol.start_heartbeat(heartbeat_interval)
@@ -119,7 +243,26 @@ def open_connection(loop, transport, protocol, dispatcher, connection_info):
     except:
         dispatcher.remove_writer(0)
         raise
-    return connection
+
+
+def negotiate(requested, offered):
+    # for frame_max and channel_max, 0 means 'no limit'
+    if requested is None:
+        return offered
+    if not requested or not offered:
+        return max(requested, offered)
+    return min(requested, offered)
+
+
+def set_socket_options(sock, tcp_nodelay, send_buffer_size, receive_buffer_size):
+    if sock is None:
+        return
+    if tcp_nodelay is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(tcp_nodelay))
+    if send_buffer_size is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
+    if receive_buffer_size is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer_size)
 
 
 class ConnectionFrameHandler(bases.FrameHandler):
@@ -2,6 +2,7 @@ __all__ = [
     "AMQPError",
     "ConnectionClosedError",
     "ConnectionLostError",
+    "ChannelClosedError",
     "UndeliverableMessage",
     "Deleted"
 ]
@@ -26,6 +27,16 @@ class ConnectionLostError(ConnectionClosedError):
     pass
 
 
+class ChannelClosedError(ConnectionError):
+    '''
+    Channel was closed by the amqp server, usually because of an error
+    (for example, a declaration made with ``nowait=True`` was refused).
+
+    The arguments are the reply code and reply text sent by the server.
+    '''
+    pass
+
+
 class UndeliverableMessage(ValueError):
     pass
 
@@ -21,28 +21,43 @@ class Exchange(object):
     .. attribute:: type
 
         the type of the exchange (usually one of ``'fanout'``, ``'direct'``, ``'topic'``, or ``'headers'``).
+
+    .. attribute:: arguments
+
+        the extra arguments the exchange was declared with.
     """
-    def __init__(self, reader, synchroniser, sender, name, type, durable, auto_delete, internal):
+    def __init__(self, reader, synchroniser, sender, confirms, name, type, durable, auto_delete, internal, arguments=None):
         self.reader = reader
         self.synchroniser = synchroniser
         self.sender = sender
+        self.confirms = confirms
         self.name = name
         self.type = type
         self.durable = durable
         self.auto_delete = auto_delete
         self.internal = internal
+        self.arguments = arguments or {}
 
     def publish(self, message, routing_key, *, mandatory=True):
         """
         Publish a message on the exchange, to be asynchronously delivered to queues.
 
+        If publisher confirms have been enabled on the channel using
+        :meth:`Channel.enable_confirms() <Channel.enable_confirms>`, a :class:`~asyncio.Future` is returned.
+        Its result will be set to ``True`` when the broker acks the message,
+        or ``False`` if the broker nacks it.
+
         :param asynqp.Message message: the message to send
         :param str routing_key: the routing key with which to publish the message
+
+        :return: a :class:`~asyncio.Future` if the channel is in confirm mode, otherwise ``None``.
         """
         self.sender.send_BasicPublish(self.name, routing_key, mandatory, message)
+        if self.confirms.enabled:
+            return self.confirms.published()
 
     @asyncio.coroutine
-    def delete(self, *, if_unused=True):
+    def delete(self, *, if_unused=True, nowait=False):
         """
         Delete the exchange.
 
@@ -50,7 +65,13 @@ class Exchange(object):
 
         :keyword bool if_unused: If true, the exchange will only be deleted if
             it has no queues bound to it.
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            If the deletion fails, the server will close the channel.
         """
-        self.sender.send_ExchangeDelete(self.name, if_unused)
+        self.sender.send_ExchangeDelete(self.name, if_unused, nowait)
+        if self.sender.topology is not None:
+            self.sender.topology.exchange_deleted(self.name)
+        if nowait:
+            return
         yield from self.synchroniser.await(spec.ExchangeDeleteOK)
         self.reader.ready()
@@ -0,0 +1,137 @@
+import asyncio
+import collections
+
+
+class FanIn(object):
+    """
+    Merge the deliveries from several queues into a single stream of messages.
+
+    Messages are buffered locally as they are delivered, and handed out by :meth:`get`
+    in proportion to the weight of the queue they came from, using a smooth weighted
+    round-robin. With weights of 5, 3 and 1, a worker that keeps up with the combined
+    rate receives messages from all three queues, while a worker that falls behind
+    takes five high-priority messages and three normal ones for every bulk message.
+
+    On Python 3.5 and later a FanIn is also an asynchronous iterator::
+
+        async for msg in fan_in:
+            ...
+
+    You should set a prefetch count using :meth:`Channel.set_qos() <Channel.set_qos>`,
+    otherwise the broker will deliver (and the fan-in will buffer) every message on the queues.
+
+    .. attribute:: consumers
+
+        the :class:`Consumer` objects which are feeding the fan-in
+    """
+    def __init__(self, *, loop=None):
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.consumers = []
+        self.closed = False
+        self._lanes = []
+        self._waiters = []
+
+    @asyncio.coroutine
+    def add_queue(self, queue, weight=1, *, no_local=False, no_ack=False, exclusive=False):
+        """
+        Start consuming from a queue, feeding its messages into the fan-in.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :param asynqp.Queue queue: the queue to consume from.
+        :param int weight: the relative share of :meth:`get` calls which this queue should receive
+            when several queues have messages waiting.
+
+        Keyword arguments are the same as :meth:`Queue.consume() <Queue.consume>`.
+
+        :return: The newly created :class:`Consumer` object.
+        """
+        if weight < 1:
+            raise ValueError("The weight must be a positive integer.")
+
+        lane = Lane(weight)
+        consumer = yield from queue.consume(lambda msg: self._buffer(lane, msg),
+                                            no_local=no_local, no_ack=no_ack, exclusive=exclusive)
+        self._lanes.append(lane)
+        self.consumers.append(consumer)
+        return consumer
+
+    @asyncio.coroutine
+    def get(self):
+        """
+        Wait for the next message.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :return: an :class:`~asynqp.message.IncomingMessage`,
+            or ``None`` if the fan-in has been cancelled and all its buffered messages were consumed.
+        """
+        while True:
+            lane = self._pick()
+            if lane is not None:
+                return lane.messages.popleft()
+            if self.closed:
+                return None
+            waiter = asyncio.Future(loop=self.loop)
+            self._waiters.append(waiter)
+            try:
+                yield from waiter
+            finally:
+                self._waiters.remove(waiter)
+
+    @asyncio.coroutine
+    def cancel(self):
+        """
+        Cancel all the consumers feeding the fan-in.
+        Messages which have already been buffered can still be retrieved using :meth:`get`.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        self.closed = True
+        for consumer in self.consumers:
+            if not consumer.cancelled:
+                yield from consumer.cancel()
+        self._wake()
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        msg = yield from self.get()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+    def _buffer(self, lane, msg):
+        lane.messages.append(msg)
+        self._wake()
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # smooth weighted round-robin, as used by nginx: every waiting lane accrues
+    # its weight, and the richest lane pays back the total when it is chosen
+    def _pick(self):
+        waiting = [lane for lane in self._lanes if lane.messages]
+        if not waiting:
+            return None
+
+        total = 0
+        best = None
+        for lane in waiting:
+            lane.current += lane.weight
+            total += lane.weight
+            if best is None or lane.current > best.current:
+                best = lane
+        best.current -= total
+        return best
+
+
+class Lane(object):
+    def __init__(self, weight):
+        self.weight = weight
+        self.current = 0
+        self.messages = collections.deque()
@@ -1,3 +1,4 @@
+import asyncio
 from io import BytesIO
 from . import spec
 from . import serialisation
@@ -72,3 +73,20 @@ class ConnectionClosedPoisonPillFrame(Frame):
 
     def __init__(self):
         pass
+
+
+class ConnectionSuspendedPoisonPillFrame(Frame):
+    # the connection was lost, but it's going to be recovered, so the channels should stay open
+    channel_id = 0
+    payload = b''
+
+    def __init__(self):
+        pass
+
+
+class ConnectionResumedFrame(Frame):
+    payload = b''
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.handled = asyncio.Future()  # done when every frame from the old connection has been handled
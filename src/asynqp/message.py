@@ -90,7 +90,8 @@ class Message(object):
 
     def __getattr__(self, name):
         try:
-            return self._properties[name]
+            # not self._properties, which would recurse while unpickling
+            return self.__dict__['_properties'][name]
         except KeyError as e:
             raise AttributeError from e
 
@@ -127,19 +128,25 @@ class IncomingMessage(Message):
     .. attribute::routing_key
 
         The routing key under which the message was originally published.
+
+    .. attribute::settled
+
+        True once the message has been acked, rejected or nacked.
     """
-    def __init__(self, *args, sender, delivery_tag, exchange_name, routing_key, **kwargs):
+    def __init__(self, *args, acker, delivery_tag, exchange_name, routing_key, **kwargs):
         super().__init__(*args, **kwargs)
-        self.sender = sender
+        self.acker = acker
         self.delivery_tag = delivery_tag
         self.exchange_name = exchange_name
         self.routing_key = routing_key
+        self.settled = False
 
     def ack(self):
         """
         Acknowledge the message.
         """
-        self.sender.send_BasicAck(self.delivery_tag)
+        self.settled = True
+        self.acker.ack(self.delivery_tag)
 
     def reject(self, *, requeue=True):
         """
@@ -148,7 +155,107 @@ class IncomingMessage(Message):
         :keyword bool redeliver: if true, the broker will attempt to requeue the
             message and deliver it to an alternate consumer.
         """
-        self.sender.send_BasicReject(self.delivery_tag, requeue)
+        self.settled = True
+        self.acker.reject(self.delivery_tag, requeue)
+
+    def nack(self, *, requeue=True):
+        """
+        Reject the message using ``basic.nack``, a RabbitMQ extension to AMQP.
+
+        Unlike :meth:`reject`, nacks take part in ack coalescing
+        (see :meth:`Channel.set_ack_coalescing() <Channel.set_ack_coalescing>`).
+        To reject a whole window of messages with one method, use
+        :meth:`Channel.nack_all_up_to() <Channel.nack_all_up_to>`.
+
+        :keyword bool requeue: if true, the broker will attempt to requeue the
+            message and deliver it to an alternate consumer.
+        """
+        self.settled = True
+        self.acker.nack(self.delivery_tag, requeue)
+
+    def detach(self):
+        """
+        Make a copy of the message which can be pickled and sent to another process.
+
+        :return: a :class:`DetachedMessage`.
+        """
+        return DetachedMessage(
+            self.body,
+            delivery_tag=self.delivery_tag,
+            exchange_name=self.exchange_name,
+            routing_key=self.routing_key,
+            **self._properties)
+
+
+class DetachedMessage(Message):
+    """
+    A copy of an :class:`IncomingMessage` which isn't tied to a channel,
+    and so can be handed to a thread or process pool.
+
+    Subclass of :class:`Message`.
+
+    Calling :meth:`ack`, :meth:`reject` or :meth:`nack` records the outcome in the message
+    instead of talking to the broker. Consumers which run their callbacks in an executor
+    (see :meth:`Queue.consume() <Queue.consume>`) send the outcome back to the event loop
+    along with the callback's result, and settle the original message accordingly.
+
+    .. attribute::delivery_tag
+
+        The *delivery tag* assigned to the original message by the AMQP broker.
+
+    .. attribute::exchange_name
+
+        The name of the exchange to which the message was originally published.
+
+    .. attribute::routing_key
+
+        The routing key under which the message was originally published.
+
+    .. attribute::outcome
+
+        ``None`` if the message hasn't been settled yet,
+        otherwise a tuple of ``('ack', False)``, ``('reject', requeue)`` or ``('nack', requeue)``.
+    """
+    def __init__(self, *args, delivery_tag, exchange_name, routing_key, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delivery_tag = delivery_tag
+        self.exchange_name = exchange_name
+        self.routing_key = routing_key
+        self.outcome = None
+
+    def ack(self):
+        """
+        Acknowledge the message once the callback has returned.
+        """
+        self.outcome = ('ack', False)
+
+    def reject(self, *, requeue=True):
+        """
+        Reject the message once the callback has returned.
+
+        :keyword bool requeue: if true, the broker will attempt to requeue the
+            message and deliver it to an alternate consumer.
+        """
+        self.outcome = ('reject', requeue)
+
+    def nack(self, *, requeue=True):
+        """
+        Reject the message using ``basic.nack`` once the callback has returned.
+
+        :keyword bool requeue: if true, the broker will attempt to requeue the
+            message and deliver it to an alternate consumer.
+        """
+        self.outcome = ('nack', requeue)
+
+
+def settle(message, outcome):
+    action, requeue = outcome
+    if action == 'ack':
+        message.ack()
+    elif action == 'reject':
+        message.reject(requeue=requeue)
+    else:
+        message.nack(requeue=requeue)
 
 
 def get_header_payload(message, class_id):
@@ -218,8 +325,8 @@ class ContentHeaderPayload(object):
 
 
 class MessageBuilder(object):
-    def __init__(self, sender, delivery_tag, redelivered, exchange_name, routing_key, consumer_tag=None):
-        self.sender = sender
+    def __init__(self, acker, delivery_tag, redelivered, exchange_name, routing_key, consumer_tag=None):
+        self.acker = acker
         self.delivery_tag = delivery_tag
         self.body = b''
         self.consumer_tag = consumer_tag
@@ -241,7 +348,7 @@ class MessageBuilder(object):
     def build(self):
         return IncomingMessage(
             self.body,
-            sender=self.sender,
+            acker=self.acker,
             delivery_tag=self.delivery_tag,
             exchange_name=self.exchange_name,
             routing_key=self.routing_key,
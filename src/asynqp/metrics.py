@@ -0,0 +1,224 @@
+import collections
+import math
+
+
+class Metrics(object):
+    """
+    Receives measurements from a :class:`Connection` and its channels.
+
+    Attach a collector with :meth:`Connection.set_metrics() <Connection.set_metrics>`.
+    Every method of this class does nothing; subclass it and override the ones you're interested in.
+    The methods are called on the event loop, in the middle of reading and writing frames,
+    so they should return quickly. Times are in seconds, sizes in bytes.
+
+    When no collector is attached, nothing is measured, so metrics cost nothing unless they are used.
+    """
+    def frame_received(self, channel_id, size):
+        """A frame of ``size`` bytes arrived for the channel ``channel_id`` (0 is the connection itself)."""
+
+    def frame_sent(self, channel_id, size):
+        """A frame of ``size`` bytes was written for the channel ``channel_id``."""
+
+    def frame_parsed(self, seconds):
+        """A frame took ``seconds`` to parse."""
+
+    def write_buffer_size(self, size):
+        """``size`` bytes were waiting in the transport's write buffer after a frame was written."""
+
+    def message_delivered(self, channel_id):
+        """A message was delivered to a consumer, or returned from ``basic.get``, on the channel ``channel_id``."""
+
+    def message_acked(self, channel_id, latency):
+        """
+        A message was acked. ``latency`` is the time since it was delivered,
+        or ``None`` if it was delivered before the collector was attached.
+        """
+
+    def message_rejected(self, channel_id, latency):
+        """A message was nacked or rejected. ``latency`` is as for :meth:`message_acked`."""
+
+    def callback_finished(self, consumer_tag, seconds):
+        """A consumer's callback took ``seconds`` to handle a message."""
+
+    def reply_received(self, method, seconds):
+        """
+        The broker's reply arrived ``seconds`` after we started waiting for it.
+        ``method`` is the class of the method we were waiting for, such as :class:`spec.QueueDeclareOK`.
+        """
+
+
+class InMemoryMetrics(Metrics):
+    """
+    A :class:`Metrics` collector which keeps its measurements in memory.
+
+    Counts go into :attr:`counters` and durations and sizes into :class:`Histograms <Histogram>`.
+    Both are keyed by a ``(name, key)`` pair: the key is the channel id for per-channel
+    measurements, the consumer tag for callback durations, the method's name for
+    reply times, and ``None`` for the rest.
+
+    ========================  ================  ============================================
+    Name                      Kind              Measures
+    ========================  ================  ============================================
+    ``frames_in``             counter           frames received
+    ``bytes_in``              counter           bytes received
+    ``frames_out``            counter           frames sent
+    ``bytes_out``             counter           bytes sent
+    ``delivered``             counter           messages delivered
+    ``acked``                 counter           messages acked
+    ``rejected``              counter           messages nacked or rejected
+    ``parse_time``            histogram         time taken to parse each frame
+    ``write_buffer``          histogram         size of the write buffer after each frame
+    ``ack_latency``           histogram         time from delivery to ack, nack or reject
+    ``callback_time``         histogram         time taken by consumer callbacks
+    ``reply_time``            histogram         time spent waiting for replies from the broker
+    ========================  ================  ============================================
+
+    .. attribute:: counters
+
+        a :class:`collections.Counter` of ``(name, key)`` pairs
+
+    .. attribute:: histograms
+
+        a dictionary mapping ``(name, key)`` pairs to :class:`Histogram` objects
+
+    :param int significant_bits: the precision of the histograms; see :class:`Histogram`.
+    """
+    def __init__(self, *, significant_bits=7):
+        self.significant_bits = significant_bits
+        self.counters = collections.Counter()
+        self.histograms = {}
+
+    def count(self, name, key=None):
+        """
+        The value of a counter. If ``key`` is ``None``, the counter's values for all keys are added together.
+        """
+        if key is not None:
+            return self.counters[name, key]
+        return sum(n for (counter, _), n in self.counters.items() if counter == name)
+
+    def histogram(self, name, key=None):
+        """
+        The :class:`Histogram` called ``name`` for ``key``.
+        An empty one is created if nothing has been recorded in it yet.
+        """
+        histogram = self.histograms.get((name, key))
+        if histogram is None:
+            histogram = self.histograms[name, key] = Histogram(significant_bits=self.significant_bits)
+        return histogram
+
+    def clear(self):
+        """Forget everything which has been measured so far."""
+        self.counters.clear()
+        self.histograms.clear()
+
+    def frame_received(self, channel_id, size):
+        self.counters['frames_in', channel_id] += 1
+        self.counters['bytes_in', channel_id] += size
+
+    def frame_sent(self, channel_id, size):
+        self.counters['frames_out', channel_id] += 1
+        self.counters['bytes_out', channel_id] += size
+
+    def frame_parsed(self, seconds):
+        self.histogram('parse_time').record(seconds)
+
+    def write_buffer_size(self, size):
+        self.histogram('write_buffer').record(size)
+
+    def message_delivered(self, channel_id):
+        self.counters['delivered', channel_id] += 1
+
+    def message_acked(self, channel_id, latency):
+        self.counters['acked', channel_id] += 1
+        if latency is not None:
+            self.histogram('ack_latency', channel_id).record(latency)
+
+    def message_rejected(self, channel_id, latency):
+        self.counters['rejected', channel_id] += 1
+        if latency is not None:
+            self.histogram('ack_latency', channel_id).record(latency)
+
+    def callback_finished(self, consumer_tag, seconds):
+        self.histogram('callback_time', consumer_tag).record(seconds)
+
+    def reply_received(self, method, seconds):
+        self.histogram('reply_time', method.__name__).record(seconds)
+
+
+class Histogram(object):
+    """
+    Records a distribution of non-negative numbers in a fixed amount of memory per order of magnitude.
+
+    As in an HDR histogram, values are counted in buckets whose width grows with the value:
+    each power of two is split into ``2 ** significant_bits`` equal buckets,
+    so any value is reported to within ``2 ** -significant_bits`` of itself
+    (within 1% for the default of 7) however large or small it is.
+    Zero has a bucket of its own.
+    """
+    def __init__(self, *, significant_bits=7):
+        self.sub_buckets = 2 ** significant_bits
+        self.buckets = collections.Counter()  # (exponent, sub-bucket) -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        """Record ``count`` occurrences of ``value``."""
+        if value < 0:
+            raise ValueError("Histograms can only record non-negative values.")
+        self.buckets[self.bucket(value)] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def bucket(self, value):
+        if value == 0:
+            return (None, 0)
+        mantissa, exponent = math.frexp(value)  # value == mantissa * 2 ** exponent, 0.5 <= mantissa < 1
+        return (exponent, int((mantissa - 0.5) * 2 * self.sub_buckets))
+
+    def value(self, bucket):
+        # the middle of the bucket
+        exponent, sub_bucket = bucket
+        if exponent is None:
+            return 0
+        return math.ldexp(0.5 + (sub_bucket + 0.5) / (2 * self.sub_buckets), exponent)
+
+    @property
+    def mean(self):
+        """The mean of the recorded values, or ``None`` if nothing has been recorded."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        The value below which ``percent`` percent of the recorded values fall,
+        or ``None`` if nothing has been recorded.
+        """
+        if not self.count:
+            return None
+        if not 0 <= percent <= 100:
+            raise ValueError("percent must be between 0 and 100.")
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for bucket in sorted(self.buckets, key=self.sort_key):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, max(self.min, self.value(bucket)))
+
+    def sort_key(self, bucket):
+        exponent, sub_bucket = bucket
+        return (float('-inf') if exponent is None else exponent, sub_bucket)
+
+    def merge(self, other):
+        """Add the values recorded in another histogram with the same precision to this one."""
+        if other.sub_buckets != self.sub_buckets:
+            raise ValueError("Only histograms with the same precision can be merged.")
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
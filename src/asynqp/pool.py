@@ -0,0 +1,418 @@
+import asyncio
+import collections
+from . import publisher
+
+
+class ChannelPool(object):
+    """
+    Share a fixed number of channels on a :class:`Connection` between many concurrent tasks.
+
+    A :class:`Channel` must not be used by more than one task at a time, and opening a channel
+    costs a round trip to the broker. A pool opens channels as they are first needed,
+    up to ``size`` of them, and hands them out one task at a time. Tasks which ask for a channel
+    while they are all in use wait until one is released.
+
+    If the broker closes a channel (because of an error, for example), it is dropped from the pool
+    when it is released, and a new channel is opened in its place the next time one is needed.
+
+    Channels are returned to the pool in whatever state they were left in, so tasks should
+    only make changes to a pooled channel (such as :meth:`Channel.set_qos` or
+    :meth:`Channel.set_return_handler`) which every user of the pool expects.
+
+    Channel pools are created using :meth:`Connection.channel_pool() <Connection.channel_pool>`.
+    A channel can be checked out of the pool with a ``with`` statement::
+
+        with (yield from pool) as channel:
+            exchange = yield from channel.declare_exchange('my.exchange', 'topic')
+            exchange.publish(msg, 'routing.key')
+
+    which is equivalent to::
+
+        channel = yield from pool.acquire()
+        try:
+            ...
+        finally:
+            pool.release(channel)
+
+    .. attribute:: size
+
+        the maximum number of channels in the pool
+
+    .. attribute:: closed
+
+        if True, the pool has been closed and no more channels can be acquired from it
+    """
+    def __init__(self, connection, size, *, loop=None):
+        if size < 1:
+            raise ValueError("The size of a channel pool must be a positive integer.")
+        self.connection = connection
+        self.size = size
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.closed = False
+        self._idle = collections.deque()
+        self._count = 0  # channels which are open, or being opened, and haven't been dropped
+        self._waiters = collections.deque()
+
+    @asyncio.coroutine
+    def acquire(self):
+        """
+        Check a channel out of the pool, opening a new one if the pool isn't full.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :return: a :class:`Channel` which the caller has to itself until it calls :meth:`release`.
+        """
+        while True:
+            if self.closed:
+                raise RuntimeError("The channel pool is closed.")
+
+            while self._idle:
+                channel = self._idle.popleft()
+                if not channel.closed.done():
+                    return channel
+                self._count -= 1
+
+            if self._count < self.size:
+                self._count += 1
+                try:
+                    return (yield from self.connection.open_channel())
+                except:
+                    self._count -= 1
+                    self._wake()
+                    raise
+
+            waiter = asyncio.Future(loop=self.loop)
+            self._waiters.append(waiter)
+            try:
+                yield from waiter
+            except:
+                # if we were woken up but aren't going to take the channel, pass the wakeup on
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(self, channel):
+        """
+        Return a channel to the pool.
+
+        :param asynqp.Channel channel: a channel which was checked out using :meth:`acquire`.
+        """
+        if channel.closed.done():
+            self._count -= 1
+        elif self.closed:
+            self._count -= 1
+            asyncio.async(channel.close(), loop=self.loop)
+        else:
+            self._idle.append(channel)
+        self._wake()
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        Close the pool. Idle channels are closed straight away,
+        and channels which are checked out are closed when they are released.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        self.closed = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+        idle = list(self._idle)
+        self._idle.clear()
+        self._count -= len(idle)
+        for channel in idle:
+            if not channel.closed.done():
+                yield from channel.close()
+
+    def __iter__(self):
+        channel = yield from self.acquire()
+        return Checkout(self, channel)
+
+    __await__ = __iter__
+
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+
+class Checkout(object):
+    def __init__(self, pool, channel):
+        self.pool = pool
+        self.channel = channel
+
+    def __enter__(self):
+        return self.channel
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.pool.release(self.channel)
+
+
+ROUND_ROBIN = 'round_robin'
+LEAST_BYTES = 'least_bytes'
+LEAST_UNCONFIRMED = 'least_unconfirmed'
+
+
+class ConnectionPool(object):
+    """
+    Publish messages across connections to several nodes of a broker cluster.
+
+    One connection carries every frame through a single socket, which limits how fast
+    one client can publish. A connection pool holds a connection to each node,
+    with a channel in confirm mode on each, and spreads publishes between the nodes
+    which are healthy. The node for each message is chosen according to ``strategy``:
+
+    * ``'round_robin'`` - take turns.
+    * ``'least_bytes'`` - pick the node with the least data waiting to be written to its socket.
+    * ``'least_unconfirmed'`` - pick the node with the fewest messages awaiting a publisher confirm.
+
+    Ties are broken by taking turns.
+
+    A node is taken out of rotation when its connection is lost, when it has stopped
+    sending heartbeats, or when the round trip time of its publisher confirms has grown above
+    ``max_rtt``. The pool tries to reconnect to lost nodes every ``retry_interval`` seconds,
+    and gives slow nodes another chance after the same interval.
+
+    Connection pools are created using :func:`asynqp.connect_pool() <connect_pool>`.
+
+    .. attribute:: nodes
+
+        a list of :class:`PoolNode` objects, one for each broker in the pool
+
+    .. attribute:: strategy
+
+        the name of the strategy used to pick a node for each message
+
+    .. attribute:: closed
+
+        if True, the pool has been closed and can't publish any more messages
+    """
+    def __init__(self, nodes, *, strategy=ROUND_ROBIN, max_rtt=None, retry_interval=5, loop=None, **kwargs):
+        if strategy not in (ROUND_ROBIN, LEAST_BYTES, LEAST_UNCONFIRMED):
+            raise ValueError("Unknown load balancing strategy {!r}.".format(strategy))
+        if not nodes:
+            raise ValueError("A connection pool needs at least one node.")
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.nodes = [PoolNode(*parse_node(node)) for node in nodes]
+        self.strategy = strategy
+        self.max_rtt = max_rtt
+        self.retry_interval = retry_interval
+        self.connect_kwargs = kwargs
+        self.closed = False
+        self._turn = 0
+        self._retries = {}  # node -> the TimerHandle for its next reconnection attempt
+
+    @asyncio.coroutine
+    def open(self):
+        """
+        Connect to all of the nodes at once.
+        Nodes which can't be reached are retried in the background.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :raise: the error from the first node if none of the nodes could be reached.
+        """
+        tasks = [asyncio.async(self.connect_node(node), loop=self.loop) for node in self.nodes]
+        results = yield from asyncio.gather(*tasks, loop=self.loop, return_exceptions=True)
+        if all(isinstance(r, BaseException) for r in results):
+            # nobody gets the pool back to close it, so stop it retrying in the background
+            self.closed = True
+            self.cancel_retries()
+            raise results[0]
+
+    @asyncio.coroutine
+    def connect_node(self, node):
+        from . import connect  # the package imports this module
+        if node.connection is not None:
+            # the broker may have closed just the channel; start afresh either way
+            node.connection.transport.close()
+        try:
+            connection = yield from connect(node.host, node.port, loop=self.loop, **self.connect_kwargs)
+            try:
+                channel = yield from connection.open_channel()
+                yield from channel.enable_confirms()
+            except:
+                connection.transport.close()
+                raise
+        except:
+            self.retry_later(node)
+            raise
+
+        node.attach(connection, channel)
+        channel.closed.add_done_callback(lambda fut: self.retry_later(node))
+
+    def retry_later(self, node):
+        if not self.closed:
+            self._retries[node] = self.loop.call_later(self.retry_interval, self.reconnect, node)
+
+    def cancel_retries(self):
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+
+    def reconnect(self, node):
+        self._retries.pop(node, None)
+        if not self.closed:
+            task = asyncio.async(self.connect_node(node), loop=self.loop)
+            task.add_done_callback(lambda fut: fut.exception())  # failures have been rescheduled
+
+    def is_healthy(self, node):
+        if not node.connected:
+            return False
+
+        now = self.loop.time()
+        monitor = node.connection.protocol.heartbeat_monitor
+        if monitor.last_received is not None and now - monitor.last_received > monitor.heartbeat_interval * 1.5:
+            return False
+
+        if self.max_rtt is not None and node.rtt is not None and node.rtt > self.max_rtt:
+            if node.slow_since is None:
+                node.slow_since = now
+            elif now - node.slow_since >= self.retry_interval:
+                node.rtt = node.slow_since = None  # give it another chance
+                return True
+            return False
+        return True
+
+    def healthy_nodes(self):
+        """
+        :return: a list of the nodes which are currently in rotation.
+        """
+        return [node for node in self.nodes if self.is_healthy(node)]
+
+    def choose(self):
+        healthy = self.healthy_nodes()
+        if not healthy:
+            raise ConnectionError("None of the nodes in the pool are available.")
+
+        start = self._turn % len(healthy)
+        self._turn += 1
+        candidates = healthy[start:] + healthy[:start]
+        if self.strategy == LEAST_BYTES:
+            return min(candidates, key=lambda node: node.outstanding_bytes)
+        if self.strategy == LEAST_UNCONFIRMED:
+            return min(candidates, key=lambda node: node.unconfirmed)
+        return candidates[0]
+
+    def publish(self, message, routing_key, *, exchange='', mandatory=True):
+        """
+        Publish a message on one of the nodes.
+
+        :param asynqp.Message message: the message to send
+        :param str routing_key: the routing key with which to publish the message
+        :keyword str exchange: the name of the exchange to publish the message to.
+            The exchange must exist on the broker.
+
+        :return: a :class:`~asyncio.Future` which will be resolved with ``True``
+            when the broker acks the message, or ``False`` if the broker nacks it.
+        """
+        if self.closed:
+            raise RuntimeError("The connection pool is closed.")
+        return self.choose().publish(message, routing_key, exchange, mandatory, self.loop.time)
+
+    @asyncio.coroutine
+    def wait_for_confirms(self):
+        """
+        Wait until every node has confirmed the messages published to it so far.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :return: ``True`` if all of the messages were acked, ``False`` if any were nacked.
+        """
+        results = []
+        for node in self.nodes:
+            if node.connected:
+                results.append((yield from node.channel.wait_for_confirms()))
+        return all(results)
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        Close the connections to all of the nodes.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        self.closed = True
+        self.cancel_retries()
+        for node in self.nodes:
+            if node.connected:
+                yield from node.connection.close()
+
+
+class PoolNode(object):
+    """
+    One broker in a :class:`ConnectionPool`.
+
+    .. attribute:: host
+
+        the host name of the broker
+
+    .. attribute:: port
+
+        the port the broker is listening on
+
+    .. attribute:: connection
+
+        the :class:`Connection` to the broker, or ``None`` if it hasn't been connected yet
+
+    .. attribute:: rtt
+
+        the smoothed time in seconds between publishing a message to the node and the broker confirming it,
+        or ``None`` if no messages have been confirmed yet
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+        self.channel = None
+        self.exchanges = {}
+        self.rtt = None
+        self.slow_since = None
+
+    def attach(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.exchanges = {'': channel.default_exchange}
+        self.rtt = self.slow_since = None
+
+    @property
+    def connected(self):
+        """``True`` if the node has an open connection."""
+        return self.channel is not None and not self.channel.closed.done()
+
+    @property
+    def outstanding_bytes(self):
+        """The number of bytes waiting to be written to the node's socket."""
+        return self.connection.transport.get_write_buffer_size()
+
+    @property
+    def unconfirmed(self):
+        """The number of messages waiting to be confirmed by the node."""
+        return len(self.channel.confirms.unconfirmed)
+
+    def publish(self, message, routing_key, exchange_name, mandatory, clock):
+        exchange = publisher.publishing_exchange(self.channel, self.exchanges, exchange_name)
+        sent_at = clock()
+        fut = exchange.publish(message, routing_key, mandatory=mandatory)
+        fut.add_done_callback(lambda fut: self.confirmed(fut, clock() - sent_at))
+        return fut
+
+    def confirmed(self, fut, rtt):
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+
+
+def parse_node(node):
+    if isinstance(node, str):
+        return node, 5672
+    host, port = node
+    return host, port
@@ -0,0 +1,126 @@
+import asyncio
+import math
+
+
+class PrefetchTuner(object):
+    """
+    Adjust a channel's prefetch count to suit how fast its messages are being handled.
+
+    Every ``interval`` seconds the tuner looks at the messages which were acked, nacked or
+    rejected during the interval. It measures the throughput, and the time between each message
+    arriving and being settled; the fastest tenth of those times is taken as the time it takes
+    to handle a message when it doesn't have to queue behind others. It also times
+    the ``basic.qos`` round trip to the broker. By Little's law, the pipeline stays full
+    with ``throughput * (handling time + round trip)`` messages outstanding; the tuner sets the
+    prefetch count to half as much again as that, within ``min_count`` and ``max_count``.
+
+    A prefetch count which is too small holds the throughput down, so the next measurement
+    asks for more, and the count grows until the consumers are busy. Once they are busy, more
+    messages only wait in the client, the throughput stops growing and so does the count.
+    The count is at most halved in one step. Intervals in which nothing was settled leave it alone.
+
+    The limit is set with ``apply_globally=True``, which RabbitMQ applies to the whole channel
+    straight away, shared between its consumers; a per-consumer limit would only affect
+    consumers started after it was set.
+
+    Tuners are created using :meth:`Channel.autotune_prefetch() <Channel.autotune_prefetch>`.
+
+    .. attribute:: prefetch_count
+
+        the prefetch count the tuner has settled on
+
+    .. attribute:: throughput
+
+        the number of messages settled per second during the last interval
+
+    .. attribute:: latency
+
+        the time in seconds to handle a message, as measured during the last interval
+
+    .. attribute:: rtt
+
+        the time in seconds the last ``basic.qos`` took to be confirmed by the broker
+    """
+    def __init__(self, channel, *, min_count=1, max_count=1000, interval=1, headroom=1.5, loop=None):
+        if min_count < 1 or max_count < min_count:
+            raise ValueError("The prefetch count bounds must satisfy 1 <= min_count <= max_count.")
+        if interval <= 0:
+            raise ValueError("The interval must be positive.")
+        self.channel = channel
+        self.min_count = min_count
+        self.max_count = max_count
+        self.interval = interval
+        self.headroom = headroom
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+
+        self.prefetch_count = self.clamp(channel.queue_factory.consumers.prefetch_count or min_count)
+        self.throughput = 0
+        self.latency = None
+        self.rtt = 0
+        self.applied = None  # the prefetch count the broker has confirmed
+        self.delivered_at = {}  # delivery tag -> when the message arrived
+        self.samples = []  # delivery-to-settlement times for this interval
+        self.task = None
+
+    def start(self):
+        self.channel.acker.tuner = self
+        self.task = asyncio.async(self.run(), loop=self.loop)
+        self.channel.closed.add_done_callback(lambda fut: self.stop())
+
+    def stop(self):
+        """Stop adjusting the prefetch count. It is left as it was last set."""
+        if self.channel.acker.tuner is self:
+            self.channel.acker.tuner = None
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def delivered(self, delivery_tag):
+        self.delivered_at[delivery_tag] = self.loop.time()
+
+    def settled(self, delivery_tag):
+        delivered_at = self.delivered_at.pop(delivery_tag, None)
+        if delivered_at is not None:
+            self.samples.append(self.loop.time() - delivered_at)
+
+    def forget(self, delivery_tag=None):
+        # the message didn't need an ack, or (with no tag) the channel's deliveries are being abandoned
+        if delivery_tag is None:
+            self.delivered_at.clear()
+        else:
+            self.delivered_at.pop(delivery_tag, None)
+
+    def settled_up_to(self, delivery_tag):
+        for tag in [t for t in self.delivered_at if not delivery_tag or t <= delivery_tag]:
+            self.settled(tag)
+
+    @asyncio.coroutine
+    def run(self):
+        while True:
+            try:
+                yield from self.adjust()
+            except ConnectionError:
+                if self.channel.closed.done():
+                    return
+                # the connection is being recovered, so try again next time
+            yield from asyncio.sleep(self.interval, loop=self.loop)
+
+    @asyncio.coroutine
+    def adjust(self):
+        samples, self.samples = sorted(self.samples), []
+        if samples:
+            self.throughput = len(samples) / self.interval
+            self.latency = samples[len(samples) // 10]
+            target = math.ceil(self.throughput * (self.latency + self.rtt) * self.headroom)
+            self.prefetch_count = self.clamp(max(target, self.prefetch_count // 2))
+        if self.prefetch_count != self.applied:
+            yield from self.apply(self.prefetch_count)
+
+    @asyncio.coroutine
+    def apply(self, count):
+        sent_at = self.loop.time()
+        yield from self.channel.set_qos(prefetch_count=count, apply_globally=True)
+        self.rtt = self.loop.time() - sent_at
+        self.applied = count
+
+    def clamp(self, count):
+        return min(self.max_count, max(self.min_count, count))
@@ -1,16 +1,24 @@
 import asyncio
 import struct
+import time
 from . import spec
 from . import frames
+from . import tracing
 from .exceptions import AMQPError, ConnectionLostError, ConnectionClosedError
 
 
 class AMQP(asyncio.Protocol):
+    tracer = None  # a Tracer, if the application has attached one; looking it up on the class is cheap
+
     def __init__(self, dispatcher, loop):
         self.dispatcher = dispatcher
+        self.loop = loop
         self.partial_frame = b''
         self.frame_reader = FrameReader()
         self.heartbeat_monitor = HeartbeatMonitor(self, loop, 0)
+        self.write_paused = None  # a future which is resolved when the transport's buffer drains
+        self.recovery = None  # set when the connection should be recovered if it's lost
+        self.metrics = None  # a Metrics collector, if the application has attached one
 
     def connection_made(self, transport):
         self.transport = transport
@@ -18,6 +26,10 @@ class AMQP(asyncio.Protocol):
     def data_received(self, data):
         while data:
             self.heartbeat_monitor.heartbeat_received()  # the spec says 'any octet may substitute for a heartbeat'
+            metrics, tracer = self.metrics, self.tracer
+            if metrics is not None or tracer is not None:
+                available = len(self.frame_reader.partial_frame) + len(data)
+                started = time.perf_counter()
 
             try:
                 result = self.frame_reader.read_frame(data)
@@ -29,6 +41,11 @@ class AMQP(asyncio.Protocol):
                 return
             frame, remainder = result
 
+            if metrics is not None:
+                metrics.frame_parsed(time.perf_counter() - started)
+                metrics.frame_received(frame.channel_id, available - len(remainder))
+            if tracer is not None:
+                tracing.trace(tracer, tracing.RECEIVED, frame, available - len(remainder))
             self.dispatcher.dispatch(frame)
             if not remainder:
                 return
@@ -39,7 +56,13 @@ class AMQP(asyncio.Protocol):
         self.send_frame(frame)
 
     def send_frame(self, frame):
-        self.transport.write(frame.serialise())
+        data = frame.serialise()
+        self.transport.write(data)
+        if self.metrics is not None:
+            self.metrics.frame_sent(frame.channel_id, len(data))
+            self.metrics.write_buffer_size(self.transport.get_write_buffer_size())
+        if self.tracer is not None:
+            tracing.trace(self.tracer, tracing.SENT, frame, len(data))
 
     def send_protocol_header(self):
         self.transport.write(b'AMQP\x00\x00\x09\x01')
@@ -47,7 +70,26 @@ class AMQP(asyncio.Protocol):
     def start_heartbeat(self, heartbeat_interval):
         self.heartbeat_monitor.start(heartbeat_interval)
 
+    def pause_writing(self):
+        if self.write_paused is None:
+            self.write_paused = asyncio.Future(loop=self.loop)
+
+    def resume_writing(self):
+        paused, self.write_paused = self.write_paused, None
+        if paused is not None and not paused.done():
+            paused.set_result(None)
+
+    @asyncio.coroutine
+    def drain(self):
+        if self.write_paused is not None:
+            yield from asyncio.shield(self.write_paused, loop=self.loop)
+
     def connection_lost(self, exc):
+        self.heartbeat_monitor.stop()
+        self.resume_writing()  # nobody should wait for a buffer which will never drain
+        if self.recovery is not None and not self.dispatcher.closing.done():
+            self.recovery.connection_lost(self)
+            return
         self._send_connection_closed_poison_pill()
         if exc is None:
             raise ConnectionClosedError('The connection was closed')
@@ -97,10 +139,12 @@ class HeartbeatMonitor(object):
         self.loop = loop
         self.heartbeat_interval = heartbeat_interval
         self.heartbeat_timeout_callback = None
+        self.last_received = None
 
     def start(self, interval):
         if interval > 0:
             self.heartbeat_interval = interval
+            self.last_received = self.loop.time()
             self.send_heartbeat()
             self.monitor_heartbeat()
 
@@ -113,8 +157,15 @@ class HeartbeatMonitor(object):
         if self.heartbeat_interval > 0:
             self.heartbeat_timeout_callback = self.loop.call_later(self.heartbeat_interval * 2, self.heartbeat_timed_out)
 
+    def stop(self):
+        self.heartbeat_interval = 0
+        if self.heartbeat_timeout_callback is not None:
+            self.heartbeat_timeout_callback.cancel()
+            self.heartbeat_timeout_callback = None
+
     def heartbeat_received(self):
         if self.heartbeat_timeout_callback is not None:
+            self.last_received = self.loop.time()
             self.heartbeat_timeout_callback.cancel()
             self.monitor_heartbeat()
 
@@ -0,0 +1,193 @@
+import asyncio
+import zlib
+
+
+HASH = 'hash'
+ROUND_ROBIN = 'round_robin'
+STRATEGIES = (HASH, ROUND_ROBIN)
+
+
+class ShardedPublisher(object):
+    """
+    Publish messages to one broker over several connections at once.
+
+    Every frame sent on a :class:`Connection` goes through one socket, and is encoded
+    one after another, which limits how fast a single connection can publish.
+    A sharded publisher opens ``shards`` connections, each with its own channel,
+    and sends each message down one of them.
+
+    With the ``'hash'`` strategy the shard is picked using a hash of the routing key
+    (or of the ``key`` passed to :meth:`publish`), so all messages with the same key
+    travel over the same channel and reach the broker in the order they were published.
+    With ``'round_robin'`` the shards take turns, which spreads the load more evenly
+    but gives no ordering guarantees.
+
+    :meth:`publish` never blocks. When the broker can't keep up, data piles up
+    in the connections' write buffers; use :meth:`drain` to wait until it has been sent,
+    and :attr:`buffered_bytes` to see how much is waiting.
+
+    Sharded publishers are created using :func:`asynqp.connect_sharded() <connect_sharded>`.
+
+    .. attribute:: shards
+
+        a list of the :class:`PublisherShard` objects
+
+    .. attribute:: strategy
+
+        the name of the strategy used to pick a shard for each message
+
+    .. attribute:: published
+
+        the number of messages published so far
+
+    .. attribute:: published_bytes
+
+        the number of bytes of message bodies published so far
+    """
+    def __init__(self, shards, *, strategy=HASH, loop=None):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown sharding strategy {!r}.".format(strategy))
+        if not shards:
+            raise ValueError("A sharded publisher needs at least one shard.")
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.shards = shards
+        self.strategy = strategy
+        self.published = 0
+        self.published_bytes = 0
+        self.started = self.loop.time()
+        self._turn = 0
+
+    def choose(self, key):
+        if self.strategy == HASH:
+            return self.shards[zlib.crc32(key.encode('utf-8')) % len(self.shards)]
+        shard = self.shards[self._turn % len(self.shards)]
+        self._turn += 1
+        return shard
+
+    def publish(self, message, routing_key, *, exchange='', key=None, mandatory=True):
+        """
+        Publish a message on one of the shards.
+
+        :param asynqp.Message message: the message to send
+        :param str routing_key: the routing key with which to publish the message
+        :keyword str exchange: the name of the exchange to publish the message to.
+            The exchange must exist on the broker.
+        :keyword str key: the key which decides the shard when using the ``'hash'`` strategy.
+            Messages with the same key are delivered in order. Defaults to the routing key.
+
+        :return: a :class:`~asyncio.Future` if the shards are in confirm mode, otherwise ``None``.
+        """
+        shard = self.choose(routing_key if key is None else key)
+        self.published += 1
+        self.published_bytes += len(message.body)
+        return shard.publish(message, routing_key, exchange, mandatory)
+
+    @property
+    def throughput(self):
+        """The average number of messages published per second since the publisher was opened."""
+        elapsed = self.loop.time() - self.started
+        return self.published / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def buffered_bytes(self):
+        """The number of bytes waiting to be written to the sockets of all of the shards."""
+        return sum(shard.buffered_bytes for shard in self.shards)
+
+    @property
+    def paused(self):
+        """``True`` if any of the shards has more data waiting to be written than its transport allows."""
+        return any(shard.paused for shard in self.shards)
+
+    @asyncio.coroutine
+    def drain(self):
+        """
+        Wait until every shard's write buffer has fallen below its high-water mark.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        for shard in self.shards:
+            yield from shard.connection.protocol.drain()
+
+    @asyncio.coroutine
+    def wait_for_confirms(self):
+        """
+        Wait until the broker has confirmed every message published so far.
+        The shards must be in confirm mode.
+
+        This method is a :ref:`coroutine <coroutine>`.
+
+        :return: ``True`` if all of the messages were acked, ``False`` if any were nacked.
+        """
+        results = []
+        for shard in self.shards:
+            results.append((yield from shard.channel.wait_for_confirms()))
+        return all(results)
+
+    @asyncio.coroutine
+    def close(self):
+        """
+        Close all of the connections.
+
+        This method is a :ref:`coroutine <coroutine>`.
+        """
+        for shard in self.shards:
+            yield from shard.connection.close()
+
+
+class PublisherShard(object):
+    """
+    One of the connections of a :class:`ShardedPublisher`.
+
+    .. attribute:: connection
+
+        the shard's :class:`Connection`
+
+    .. attribute:: channel
+
+        the :class:`Channel` which the shard's messages are published on
+
+    .. attribute:: published
+
+        the number of messages published on this shard
+    """
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+        self.exchanges = {'': channel.default_exchange}
+        self.published = 0
+
+    def publish(self, message, routing_key, exchange_name, mandatory):
+        exchange = publishing_exchange(self.channel, self.exchanges, exchange_name)
+        self.published += 1
+        return exchange.publish(message, routing_key, mandatory=mandatory)
+
+    @property
+    def buffered_bytes(self):
+        """The number of bytes waiting to be written to the shard's socket."""
+        return self.connection.transport.get_write_buffer_size()
+
+    @property
+    def paused(self):
+        """``True`` if the transport has asked us to stop writing until its buffer drains."""
+        return self.connection.protocol.write_paused is not None
+
+
+def publishing_exchange(channel, exchanges, name):
+    exchange = exchanges.get(name)
+    if exchange is None:
+        # we only publish to it, so the type and flags don't matter
+        exchange = exchanges[name] = channel.create_exchange(name, 'direct', True, False, False, None)
+    return exchange
+
+
+@asyncio.coroutine
+def open_shard(connect, confirms):
+    connection = yield from connect()
+    try:
+        channel = yield from connection.open_channel()
+        if confirms:
+            yield from channel.enable_confirms()
+    except:
+        connection.transport.close()
+        raise
+    return PublisherShard(connection, channel)
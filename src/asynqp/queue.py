@@ -1,7 +1,9 @@
 import asyncio
 import re
+import uuid
 from operator import delitem
-from . import spec, frames
+from . import callbacks
+from . import spec
 from .exceptions import Deleted
 
 
@@ -32,8 +34,12 @@ class Queue(object):
     .. attribute:: auto_delete
 
         if True, the queue will be deleted when its last consumer is removed
+
+    .. attribute:: arguments
+
+        the extra arguments the queue was declared with
     """
-    def __init__(self, reader, consumers, synchroniser, sender, name, durable, exclusive, auto_delete):
+    def __init__(self, reader, consumers, synchroniser, sender, name, durable, exclusive, auto_delete, arguments=None):
         self.reader = reader
         self.consumers = consumers
         self.synchroniser = synchroniser
@@ -43,10 +49,11 @@ class Queue(object):
         self.durable = durable
         self.exclusive = exclusive
         self.auto_delete = auto_delete
+        self.arguments = arguments or {}
         self.deleted = False
 
     @asyncio.coroutine
-    def bind(self, exchange, routing_key):
+    def bind(self, exchange, routing_key, *, arguments=None, nowait=False):
         """
         Bind a queue to an exchange, with the supplied routing key.
 
@@ -57,20 +64,29 @@ class Queue(object):
 
         :param asynqp.Exchange exchange: the :class:`Exchange` to bind to
         :param str routing_key: the routing key under which to bind
+        :keyword dict arguments: extra arguments for the binding
+            (for example, the headers to match when binding to a ``'headers'`` exchange).
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            If the binding fails, the server will close the channel.
 
         :return: The new :class:`QueueBinding` object
         """
         if self.deleted:
             raise Deleted("Queue {} was deleted".format(self.name))
 
-        self.sender.send_QueueBind(self.name, exchange.name, routing_key)
-        yield from self.synchroniser.await(spec.QueueBindOK)
-        b = QueueBinding(self.reader, self.sender, self.synchroniser, self, exchange, routing_key)
-        self.reader.ready()
+        self.sender.send_QueueBind(self.name, exchange.name, routing_key, nowait, arguments)
+        if not nowait:
+            yield from self.synchroniser.await(spec.QueueBindOK)
+        b = QueueBinding(self.reader, self.sender, self.synchroniser, self, exchange, routing_key, arguments)
+        if self.sender.topology is not None:
+            self.sender.topology.bound(b)
+        if not nowait:
+            self.reader.ready()
         return b
 
     @asyncio.coroutine
-    def consume(self, callback, *, no_local=False, no_ack=False, exclusive=False):
+    def consume(self, callback, *, no_local=False, no_ack=False, exclusive=False, nowait=False,
+                executor=None, max_concurrency=None, auto_ack=False, key=None):
         """
         Start a consumer on the queue. Messages will be delivered asynchronously to the consumer.
         The callback function will be called whenever a new message arrives on the queue.
@@ -79,23 +95,79 @@ class Queue(object):
 
         :param callable callback: a callback to be called when a message is delivered.
             The callback must accept a single argument (an instance of :class:`~asynqp.message.IncomingMessage`).
+            If the callback is a :ref:`coroutine <coroutine>` function, it is run as a task
+            for each message, with up to ``max_concurrency`` of them running at once.
         :keyword bool no_local: If true, the server will not deliver messages that were
             published by this connection.
         :keyword bool no_ack: If true, messages delivered to the consumer don't require acknowledgement.
         :keyword bool exclusive: If true, only this consumer can access the queue.
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            The consumer tag is generated by the client.
+            If the consumer can't be started, the server will close the channel.
+        :keyword executor: a :class:`concurrent.futures.Executor` in which to run the callback,
+            so that CPU-heavy work doesn't hold up the event loop. The callback is passed a
+            picklable :class:`~asynqp.message.DetachedMessage`. The message is acked when the callback
+            returns (unless the callback called :meth:`~asynqp.message.DetachedMessage.reject`
+            or :meth:`~asynqp.message.DetachedMessage.nack`), and rejected without requeueing
+            if the callback raises an exception.
+        :keyword int max_concurrency: the most messages which may be in the executor,
+            or being handled by coroutine callbacks, at once. Further messages wait their turn.
+            Defaults to the channel's prefetch count (see :meth:`Channel.set_qos() <Channel.set_qos>`),
+            or no limit if that isn't set.
+        :keyword bool auto_ack: If true, and the callback is a coroutine function,
+            each message is acked when its coroutine returns and rejected without requeueing
+            if the coroutine raises an exception (unless the coroutine has already settled the message).
+        :keyword callable key: a function which takes a message and returns a key (such as its ``correlation_id``).
+            Messages with the same key are handled one at a time in the order they were delivered,
+            while messages with different keys are handled concurrently, up to ``max_concurrency``.
+            Needs a coroutine callback or an ``executor``. Acks may then arrive out of order;
+            :meth:`Channel.set_ack_coalescing() <Channel.set_ack_coalescing>` only covers
+            a message with a ``multiple=True`` ack once every message before it has been acked.
 
         :return: The newly created :class:`Consumer` object.
         """
         if self.deleted:
             raise Deleted("Queue {} was deleted".format(self.name))
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive integer.")
+
+        runner = None
+        if executor is not None:
+            runner = callbacks.ExecutorRunner(self.consumers.loop, callback, self.concurrency_limit(max_concurrency),
+                                              no_ack, executor)
+        elif asyncio.iscoroutinefunction(callback):
+            runner = callbacks.CoroutineRunner(self.consumers.loop, callback, self.concurrency_limit(max_concurrency),
+                                               no_ack, auto_ack)
+        if key is not None:
+            if runner is None:
+                raise ValueError("Ordering messages by key needs a coroutine callback or an executor.")
+            runner = callbacks.KeyedRunner(runner, key)
+
+        if nowait:
+            # messages may arrive as soon as the server has processed the method,
+            # so the consumer has to be ready to receive them before it's sent
+            tag = 'ctag.' + uuid.uuid4().hex
+            consumer = Consumer(tag, callback, self.sender, self.synchroniser, self.reader, no_ack, runner)
+            self.consumers.add_consumer(consumer)
+            self.sender.send_BasicConsume(self.name, no_local, no_ack, exclusive, tag, nowait)
+            if self.sender.topology is not None:
+                self.sender.topology.consumer_started(consumer, self, no_local, exclusive)
+            return consumer
 
         self.sender.send_BasicConsume(self.name, no_local, no_ack, exclusive)
         tag = yield from self.synchroniser.await(spec.BasicConsumeOK)
-        consumer = Consumer(tag, callback, self.sender, self.synchroniser, self.reader)
+        consumer = Consumer(tag, callback, self.sender, self.synchroniser, self.reader, no_ack, runner)
         self.consumers.add_consumer(consumer)
+        if self.sender.topology is not None:
+            self.sender.topology.consumer_started(consumer, self, no_local, exclusive)
         self.reader.ready()
         return consumer
 
+    def concurrency_limit(self, max_concurrency):
+        if max_concurrency is not None:
+            return lambda: max_concurrency
+        return lambda: self.consumers.prefetch_count  # it may change after the consumer has started
+
     @asyncio.coroutine
     def get(self, *, no_ack=False):
         """
@@ -112,14 +184,9 @@ class Queue(object):
             raise Deleted("Queue {} was deleted".format(self.name))
 
         self.sender.send_BasicGet(self.name, no_ack)
-        has_message = yield from self.synchroniser.await(spec.BasicGetOK, spec.BasicGetEmpty)
-
-        if has_message:
-            yield from self.synchroniser.await(frames.ContentHeaderFrame)
-            consumer_tag, msg = yield from self.synchroniser.await(frames.ContentBodyFrame)
-            assert consumer_tag is None
-        else:
-            msg = None
+        msg = yield from self.synchroniser.await(spec.BasicGetOK, spec.BasicGetEmpty)
+        if msg is not None and no_ack:
+            msg.acker.settle(msg.delivery_tag)
         self.reader.ready()
         return msg
 
@@ -135,7 +202,7 @@ class Queue(object):
         self.reader.ready()
 
     @asyncio.coroutine
-    def delete(self, *, if_unused=True, if_empty=True):
+    def delete(self, *, if_unused=True, if_empty=True, nowait=False):
         """
         Delete the queue.
 
@@ -145,14 +212,20 @@ class Queue(object):
             if it has no consumers.
         :keyword bool if_empty: If true, the queue will only be deleted if
             it has no unacknowledged messages.
+        :keyword bool nowait: If true, return without waiting for the server to reply.
+            If the deletion fails, the server will close the channel.
         """
         if self.deleted:
             raise Deleted("Queue {} was already deleted".format(self.name))
 
-        self.sender.send_QueueDelete(self.name, if_unused, if_empty)
-        yield from self.synchroniser.await(spec.QueueDeleteOK)
+        self.sender.send_QueueDelete(self.name, if_unused, if_empty, nowait)
+        if not nowait:
+            yield from self.synchroniser.await(spec.QueueDeleteOK)
         self.deleted = True
-        self.reader.ready()
+        if self.sender.topology is not None:
+            self.sender.topology.queue_deleted(self.name)
+        if not nowait:
+            self.reader.ready()
 
 
 class QueueBinding(object):
@@ -177,14 +250,19 @@ class QueueBinding(object):
     .. attribute:: routing_key
 
         the routing key used for the binding
+
+    .. attribute:: arguments
+
+        the extra arguments used for the binding
     """
-    def __init__(self, reader, sender, synchroniser, queue, exchange, routing_key):
+    def __init__(self, reader, sender, synchroniser, queue, exchange, routing_key, arguments=None):
         self.reader = reader
         self.sender = sender
         self.synchroniser = synchroniser
         self.queue = queue
         self.exchange = exchange
         self.routing_key = routing_key
+        self.arguments = arguments or {}
         self.deleted = False
 
     @asyncio.coroutine
@@ -197,9 +275,11 @@ class QueueBinding(object):
         if self.deleted:
             raise Deleted("Queue {} was already unbound from exchange {}".format(self.queue.name, self.exchange.name))
 
-        self.sender.send_QueueUnbind(self.queue.name, self.exchange.name, self.routing_key)
+        self.sender.send_QueueUnbind(self.queue.name, self.exchange.name, self.routing_key, self.arguments)
         yield from self.synchroniser.await(spec.QueueUnbindOK)
         self.deleted = True
+        if self.sender.topology is not None:
+            self.sender.topology.unbound(self)
         self.reader.ready()
 
 
@@ -222,10 +302,16 @@ class Consumer(object):
     .. attribute :: cancelled
 
         Boolean. True if the consumer has been successfully cancelled.
+
+    .. attribute :: no_ack
+
+        Boolean. True if messages delivered to the consumer don't require acknowledgement.
     """
-    def __init__(self, tag, callback, sender, synchroniser, reader):
+    def __init__(self, tag, callback, sender, synchroniser, reader, no_ack=False, runner=None):
         self.tag = tag
         self.callback = callback
+        self.no_ack = no_ack
+        self.runner = runner
         self.sender = sender
         self.cancelled = False
         self.synchroniser = synchroniser
@@ -242,8 +328,11 @@ class Consumer(object):
         self.sender.send_BasicCancel(self.tag)
         yield from self.synchroniser.await(spec.BasicCancelOK)
         self.cancelled = True
+        if self.sender.topology is not None:
+            self.sender.topology.consumer_cancelled(self.tag)
         self.cancelled_future.set_result(self)
-        self.reader.ready()
+        if not self.synchroniser.connection_closed:  # otherwise there was no reply to read
+            self.reader.ready()
 
 
 class QueueFactory(object):
@@ -254,30 +343,69 @@ class QueueFactory(object):
         self.consumers = consumers
 
     @asyncio.coroutine
-    def declare(self, name, durable, exclusive, auto_delete):
-        if not VALID_QUEUE_NAME_RE.match(name):
-            raise ValueError("Not a valid queue name.\n"
-                             "Valid names consist of letters, digits, hyphen, underscore, period, or colon, "
-                             "and do not begin with 'amq.'")
-
-        self.sender.send_QueueDeclare(name, durable, exclusive, auto_delete)
-        name = yield from self.synchroniser.await(spec.QueueDeclareOK)
-        q = Queue(self.reader, self.consumers, self.synchroniser, self.sender, name, durable, exclusive, auto_delete)
-        self.reader.ready()
+    def declare(self, name, durable, exclusive, auto_delete, nowait=False, arguments=None):
+        validate_queue_name(name)
+        if nowait and not name:
+            raise ValueError("The server can't tell us the name it picked for a queue declared with nowait=True.")
+
+        self.sender.send_QueueDeclare(name, durable, exclusive, auto_delete, nowait, arguments)
+        if not nowait:
+            name = yield from self.synchroniser.await(spec.QueueDeclareOK)
+        q = self.create(name, durable, exclusive, auto_delete, arguments)
+        if not nowait:
+            self.reader.ready()
         return q
 
+    def create(self, name, durable, exclusive, auto_delete, arguments=None):
+        return Queue(self.reader, self.consumers, self.synchroniser, self.sender, name, durable, exclusive, auto_delete, arguments)
+
+
+def validate_queue_name(name):
+    if not VALID_QUEUE_NAME_RE.match(name):
+        raise ValueError("Not a valid queue name.\n"
+                         "Valid names consist of letters, digits, hyphen, underscore, period, or colon, "
+                         "and do not begin with 'amq.'")
+
 
 class Consumers(object):
     def __init__(self, loop):
         self.loop = loop
         self.consumers = {}
+        self.prefetch_count = 0  # the channel's, as set by Channel.set_qos
+        self.metrics = None  # a Metrics collector, if the application has attached one
 
     def add_consumer(self, consumer):
         self.consumers[consumer.tag] = consumer
+        if consumer.runner is not None:
+            consumer.runner.watch(self.metrics, consumer.tag)
         # so the consumer gets garbage collected when it is cancelled
         consumer.cancelled_future.add_done_callback(lambda fut: delitem(self.consumers, fut.result().tag))
 
+    def runners(self):
+        return [c.runner for c in self.consumers.values() if isinstance(c, Consumer) and c.runner is not None]
+
     def deliver(self, tag, msg):
         assert tag in self.consumers, "Message got delivered to a non existent consumer"
         consumer = self.consumers[tag]
-        self.loop.call_soon(consumer.callback, msg)
+        if consumer.no_ack:
+            msg.acker.settle(msg.delivery_tag)
+        if consumer.runner is not None:
+            consumer.runner.deliver(msg)
+        elif self.metrics is None:
+            self.loop.call_soon(consumer.callback, msg)
+        else:
+            self.loop.call_soon(self.timed, consumer, msg)
+
+    def timed(self, consumer, msg):
+        started = self.loop.time()
+        try:
+            consumer.callback(msg)
+        finally:
+            if self.metrics is not None:
+                self.metrics.callback_finished(consumer.tag, self.loop.time() - started)
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+        for consumer in self.consumers.values():
+            if consumer.runner is not None:
+                consumer.runner.watch(metrics, consumer.tag)
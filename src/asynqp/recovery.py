@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import random
+import weakref
+from . import frames
+from . import protocol as amqp
+from . import spec
+from .exceptions import ChannelClosedError
+
+
+class Topology(object):
+    """
+    Remembers what has been set up on a channel - its QoS settings, and the exchanges, queues,
+    bindings and consumers declared on it - so that it can all be set up again when the channel
+    is opened on a new connection. Anything which is deleted, unbound or cancelled is forgotten,
+    as are auto-delete queues once their last consumer is cancelled and auto-delete exchanges
+    once their last binding is removed, since the broker deletes those by itself.
+
+    Channels only keep a topology when the connection will be recovered.
+    """
+    def __init__(self):
+        self.qos = None
+        self.exchanges = collections.OrderedDict()  # name -> Exchange
+        self.queues = collections.OrderedDict()  # name -> (Queue, server_named)
+        self.bindings = collections.OrderedDict()  # binding_key -> QueueBinding
+        self.consumers = collections.OrderedDict()  # tag -> (Consumer, Queue, no_local, exclusive)
+
+    def exchange_declared(self, exchange):
+        if exchange.name:
+            self.exchanges[exchange.name] = exchange
+
+    def exchange_deleted(self, name):
+        self.exchanges.pop(name, None)
+        self.forget_bindings(lambda b: b.exchange.name == name)
+
+    def queue_declared(self, queue, server_named):
+        self.queues[queue.name] = (queue, server_named)
+
+    def queue_deleted(self, name):
+        self.queues.pop(name, None)
+        self.forget_bindings(lambda b: b.queue.name == name)
+        for tag, (_, queue, _, _) in list(self.consumers.items()):
+            if queue.name == name:
+                del self.consumers[tag]
+
+    def bound(self, binding):
+        # binding the same queue to the same exchange again replaces the old binding
+        self.bindings[binding_key(binding)] = binding
+
+    def unbound(self, binding):
+        self.bindings.pop(binding_key(binding), None)
+        exchange = binding.exchange
+        if exchange.auto_delete and not any(b.exchange.name == exchange.name for b in self.bindings.values()):
+            self.exchanges.pop(exchange.name, None)
+
+    def forget_bindings(self, matches):
+        for key, b in list(self.bindings.items()):
+            if matches(b):
+                del self.bindings[key]
+
+    def consumer_started(self, consumer, queue, no_local, exclusive):
+        self.consumers[consumer.tag] = (consumer, queue, no_local, exclusive)
+
+    def consumer_cancelled(self, tag):
+        _, queue, _, _ = self.consumers.pop(tag, (None, None, None, None))
+        if queue is not None and queue.auto_delete and not any(q is queue for _, q, _, _ in self.consumers.values()):
+            self.queue_deleted(queue.name)
+
+    @asyncio.coroutine
+    def restore(self, channel):
+        """
+        Open the channel again and replay everything that was set up on it.
+
+        The methods are all sent without waiting for the replies. Server-named queues
+        get new names from the broker, so their bindings and consumers have to wait for them.
+        """
+        sender = channel.sender
+        channel.acker.reset()
+        channel.confirms.fail(ConnectionError)  # anything published while we were disconnected went nowhere
+        channel.confirms.next_seq = 1
+
+        declarations = [(sender.send_ChannelOpen, spec.ChannelOpenOK)]
+        if self.qos is not None:
+            declarations.append((lambda: sender.send_BasicQos(*self.qos), spec.BasicQosOK))
+        if channel.confirms.enabled:
+            declarations.append((sender.send_ConfirmSelect, spec.ConfirmSelectOK))
+        for ex in self.exchanges.values():
+            declarations.append((lambda ex=ex: sender.send_ExchangeDeclare(ex.name, ex.type, ex.durable, ex.auto_delete,
+                                                                           ex.internal, False, ex.arguments),
+                                 spec.ExchangeDeclareOK))
+        server_named = [q for q, named in self.queues.values() if named]
+        for q, named in self.queues.values():
+            declarations.append((lambda q=q, name='' if named else q.name:
+                                 sender.send_QueueDeclare(name, q.durable, q.exclusive, q.auto_delete, False, q.arguments),
+                                 spec.QueueDeclareOK))
+
+        subscriptions = []
+        for b in self.bindings.values():
+            subscriptions.append((lambda b=b: sender.send_QueueBind(b.queue.name, b.exchange.name, b.routing_key, False, b.arguments),
+                                  spec.QueueBindOK))
+        for consumer, q, no_local, exclusive in self.consumers.values():
+            subscriptions.append((lambda c=consumer, q=q, no_local=no_local, exclusive=exclusive:
+                                  sender.send_BasicConsume(q.name, no_local, c.no_ack, exclusive, c.tag),
+                                  spec.BasicConsumeOK))
+
+        if not server_named:
+            yield from pipeline(channel, declarations + subscriptions)
+            return
+
+        results = yield from pipeline(channel, declarations)
+        names = results[len(declarations) - len(self.queues):]
+        queues = collections.OrderedDict()
+        for (q, named), name in zip(list(self.queues.values()), names):
+            q.name = name
+            queues[name] = (q, named)
+        self.queues = queues
+        self.bindings = collections.OrderedDict((binding_key(b), b) for b in self.bindings.values())
+        yield from pipeline(channel, subscriptions)
+
+
+@asyncio.coroutine
+def pipeline(channel, steps):
+    futures = []
+    for send, reply in steps:
+        send()
+        futures.append(channel.synchroniser.await(reply))
+
+    results = []
+    try:
+        for fut in futures:
+            results.append((yield from fut))
+            channel.reader.ready()
+    finally:
+        for fut in futures:
+            if fut.done() and not fut.cancelled():
+                fut.exception()
+    return results
+
+
+def binding_key(binding):
+    return binding.queue.name, binding.exchange.name, binding.routing_key, tuple(sorted(binding.arguments.items()))
+
+
+class Recovery(object):
+    """
+    Reconnects a :class:`Connection` to the broker when it is lost, and opens its channels again.
+
+    The first attempt is made straight away. After that the delay between attempts
+    grows exponentially up to ``max_delay`` seconds, and each delay is picked at random
+    between zero and its limit, so that clients which lost the same broker don't all
+    come back at the same moment.
+    """
+    def __init__(self, connection, reconnect, *, delay=0.1, max_delay=10, frame_max=None, channel_max=None, heartbeat=None, loop=None):
+        self.connection = connection
+        # a coroutine function which takes a protocol factory and returns a new (transport, protocol) pair
+        self.reconnect = reconnect
+        self.delay = delay
+        self.max_delay = max_delay
+        self.tuning = {'frame_max': frame_max, 'channel_max': channel_max, 'heartbeat': heartbeat}
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.lost = weakref.WeakSet()  # protocols whose connections we've given up on
+        self.task = None
+        connection.recovery = connection.protocol.recovery = self
+        connection.channel_factory.keep_topologies()
+
+    def make_protocol(self):
+        protocol = amqp.AMQP(self.connection.channel_factory.dispatcher, self.loop)
+        protocol.recovery = self
+        return protocol
+
+    def connection_lost(self, protocol):
+        if protocol in self.lost:
+            return
+        self.lost.add(protocol)
+        protocol.transport.close()  # in case the connection was abandoned because of a missed heartbeat
+        # everything already received from the old connection gets handled before the channels give up on their replies
+        self.connection.channel_factory.dispatcher.dispatch_all(frames.ConnectionSuspendedPoisonPillFrame())
+        if self.task is None or self.task.done():
+            self.task = asyncio.async(self.recover(), loop=self.loop)
+
+    @asyncio.coroutine
+    def recover(self):
+        failures = 0
+        while True:
+            protocol = None
+            try:
+                transport, protocol = yield from self.reconnect(self.make_protocol)
+                if protocol in self.lost:
+                    raise ConnectionError("The connection was lost as soon as it was made")
+                yield from self.connection.resume(transport, protocol, **self.tuning)
+                return
+            except asyncio.CancelledError:
+                self.abandon(protocol)
+                raise
+            except OSError:
+                self.abandon(protocol)
+            failures += 1
+            yield from asyncio.sleep(self.backoff(failures), loop=self.loop)
+
+    def abandon(self, protocol):
+        if protocol is not None:
+            self.lost.add(protocol)
+            protocol.transport.close()
+
+    def backoff(self, failures):
+        return random.uniform(0, min(self.max_delay, self.delay * 2 ** failures))
+
+    def cancel(self):
+        """The application has closed the connection, so stop trying to reconnect"""
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            self.connection.channel_factory.dispatcher.dispatch_all(frames.ConnectionClosedPoisonPillFrame())
+
+
+@asyncio.coroutine
+def resume_channel(channel, dispatcher, protocol):
+    frame = frames.ConnectionResumedFrame(channel.id)
+    dispatcher.dispatch(frame)
+    yield from frame.handled
+    channel.sender.protocol = protocol
+    try:
+        yield from channel.sender.topology.restore(channel)
+    except ChannelClosedError:
+        pass  # the broker wouldn't have it back; the channel has been closed
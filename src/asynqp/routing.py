@@ -1,13 +1,17 @@
 import asyncio
 import collections
+import time
 from . import frames
 from . import spec
+from . import tracing
 
 
 _TEST = False
 
 
 class Dispatcher(object):
+    tracer = None  # a Tracer, if the application has attached one
+
     def __init__(self):
         self.queue_writers = {}
         self.closing = asyncio.Future()
@@ -16,14 +20,18 @@ class Dispatcher(object):
         self.queue_writers[channel_id] = writer
 
     def remove_writer(self, channel_id):
-        del self.queue_writers[channel_id]
+        self.queue_writers.pop(channel_id, None)
 
     def dispatch(self, frame):
+        if self.tracer is not None:
+            tracing.trace(self.tracer, tracing.DISPATCHED, frame)
         if isinstance(frame, frames.HeartbeatFrame):
             return
         if self.closing.done() and not isinstance(frame.payload, (spec.ConnectionClose, spec.ConnectionCloseOK)):
             return
-        writer = self.queue_writers[frame.channel_id]
+        writer = self.queue_writers.get(frame.channel_id)
+        if writer is None:  # the channel has been closed
+            return
         writer.enqueue(frame)
 
     def dispatch_all(self, frame):
@@ -39,6 +47,9 @@ class Synchroniser(object):
     def __init__(self):
         self._futures = OrderedManyToManyMap()
         self.connection_closed = False
+        self.close_exception = ConnectionError
+        self.metrics = None  # a Metrics collector, if the application has attached one
+        self.waiting_since = {}  # future -> when we started waiting, while there's a collector
 
     def await(self, *expected_methods):
         fut = asyncio.Future()
@@ -48,19 +59,36 @@ class Synchroniser(object):
                 if method in self._blocking_methods and not fut.done():
                     fut.set_result(None)
             if not fut.done():
-                fut.set_exception(ConnectionError)
+                fut.set_exception(self.close_exception)
             return fut
 
         self._futures.add_item(expected_methods, fut)
+        if self.metrics is not None:
+            self.waiting_since[fut] = time.monotonic()
         return fut
 
     def notify(self, method, result=None):
         fut = self._futures.get_leftmost(method)
         fut.set_result(result)
         self._futures.remove_item(fut)
+        if self.waiting_since:
+            started = self.waiting_since.pop(fut, None)
+            if started is not None and self.metrics is not None:
+                self.metrics.reply_received(method, time.monotonic() - started)
+
+    def forget(self, fut):
+        # stop waiting on a future, without using up a reply
+        self._futures.remove_item(fut)
+        self.waiting_since.pop(fut, None)
+
+    def reset(self):
+        # the connection has been recovered, so there'll be replies to wait for again
+        self.connection_closed = False
+        self.close_exception = ConnectionError
 
     def killall(self, exc):
         self.connection_closed = True
+        self.close_exception = exc
         # Give a proper notification to methods which are waiting for closure
         for method in self._blocking_methods:
             while True:
@@ -73,8 +101,10 @@ class Synchroniser(object):
         for method in self._futures.keys():
             if method not in self._blocking_methods:
                 for fut in self._futures.get_all(method):
-                    fut.set_exception(exc)
+                    if not fut.done():  # the task which was waiting for it may have been cancelled
+                        fut.set_exception(exc)
                     self._futures.remove_item(fut)
+        self.waiting_since.clear()
 
 
 def create_reader_and_writer(handler):
@@ -72,6 +72,9 @@ def _read_table(stream):
         b't': _read_bool,
         b's': _read_short_string,
         b'S': _read_long_string,
+        b'I': _read_signed_long,
+        b'l': _read_signed_long_long,
+        b'd': _read_double,
         b'F': _read_table
     }
 
@@ -135,6 +138,21 @@ def _read_long_long(stream):
     return x, 8
 
 
+def _read_signed_long(stream):
+    x, = struct.unpack('!l', stream.read(4))
+    return x, 4
+
+
+def _read_signed_long_long(stream):
+    x, = struct.unpack('!q', stream.read(8))
+    return x, 8
+
+
+def _read_double(stream):
+    x, = struct.unpack('!d', stream.read(8))
+    return x, 8
+
+
 ###########################################################
 #  Serialisation
 ###########################################################
@@ -152,15 +170,29 @@ def pack_long_string(string):
 def pack_table(d):
     bytes = b''
     for key, value in d.items():
-        if not isinstance(value, str):
-            raise NotImplementedError()
         bytes += pack_short_string(key)
-        bytes += b'S'  # todo: more values
-        bytes += pack_long_string(value)
+        bytes += _pack_table_value(value)
     val = pack_long(len(bytes)) + bytes
     return val
 
 
+def _pack_table_value(value):
+    # todo: more values
+    if isinstance(value, str):
+        return b'S' + pack_long_string(value)
+    if isinstance(value, bool):  # bool is a subclass of int, so check it first
+        return b't' + pack_octet(value)
+    if isinstance(value, int):
+        if -2**31 <= value < 2**31:
+            return b'I' + struct.pack('!l', value)
+        return b'l' + struct.pack('!q', value)
+    if isinstance(value, float):
+        return b'd' + struct.pack('!d', value)
+    if isinstance(value, dict):
+        return b'F' + pack_table(value)
+    raise NotImplementedError()
+
+
 def pack_octet(number):
     return struct.pack('!B', number)
 
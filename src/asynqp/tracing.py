@@ -0,0 +1,102 @@
+import collections
+import time
+from . import frames
+from . import spec
+
+
+RECEIVED = 'received'
+DISPATCHED = 'dispatched'
+SENT = 'sent'
+
+
+class Tracer(object):
+    """
+    Told about every frame which passes through a :class:`Connection`.
+
+    Attach a tracer with :meth:`Connection.set_tracer() <Connection.set_tracer>`.
+    :meth:`trace` is called three times in the life of most frames: when a frame is read off
+    the socket (``'received'``), when it is handed to its channel (``'dispatched'``),
+    and when one is written to the socket (``'sent'``). The gaps between the timestamps show
+    where the time went.
+
+    This class does nothing with the frames it is told about; subclass it and override :meth:`trace`.
+    When no tracer is attached, the hooks are skipped altogether.
+    """
+    def trace(self, direction, channel_id, frame_type, method, size, timestamp):
+        """
+        Called for each frame.
+
+        :param str direction: ``'received'``, ``'dispatched'`` or ``'sent'``.
+        :param int channel_id: the channel the frame belongs to (0 is the connection itself).
+        :param int frame_type: the AMQP frame type, such as ``spec.FRAME_METHOD``;
+            ``None`` for the frames asynqp passes to its channels internally.
+        :param str method: the name of the method, such as ``'BasicDeliver'``, for method frames;
+            ``None`` for other frames.
+        :param int size: the size of the frame in bytes, including its header and end marker;
+            ``None`` for dispatched frames.
+        :param float timestamp: the value of :func:`time.perf_counter` when the frame was seen.
+        """
+
+
+TracedFrame = collections.namedtuple('TracedFrame', ['direction', 'channel_id', 'frame_type', 'method', 'size', 'timestamp'])
+
+
+class RingBufferTracer(Tracer):
+    """
+    A :class:`Tracer` which keeps the last ``size`` frames it is told about,
+    so that the run-up to a problem can be looked at afterwards.
+
+    :param int size: the number of frames to keep.
+    """
+    def __init__(self, size=1000):
+        if size < 1:
+            raise ValueError("size must be a positive integer.")
+        self.frames = collections.deque(maxlen=size)
+
+    def trace(self, direction, channel_id, frame_type, method, size, timestamp):
+        self.frames.append(TracedFrame(direction, channel_id, frame_type, method, size, timestamp))
+
+    def records(self):
+        """
+        The frames which have been kept, oldest first.
+
+        :return: a list of :class:`TracedFrame` named tuples with the fields
+            ``direction``, ``channel_id``, ``frame_type``, ``method``, ``size`` and ``timestamp``.
+        """
+        return list(self.frames)
+
+    def clear(self):
+        """Forget the frames which have been kept."""
+        self.frames.clear()
+
+    def format(self):
+        """
+        The frames which have been kept as a table, one frame per line,
+        with each frame's time in milliseconds since the oldest one.
+        """
+        if not self.frames:
+            return ''
+        start = self.frames[0].timestamp
+        lines = []
+        for frame in self.frames:
+            lines.append('{:>12.3f}  {:<10}  {:>5}  {:<9}  {:<24}  {}'.format(
+                (frame.timestamp - start) * 1000,
+                frame.direction,
+                frame.channel_id,
+                FRAME_TYPE_NAMES.get(frame.frame_type, '-'),
+                frame.method or '-',
+                '-' if frame.size is None else frame.size))
+        return '\n'.join(lines)
+
+
+FRAME_TYPE_NAMES = {
+    spec.FRAME_METHOD: 'method',
+    spec.FRAME_HEADER: 'header',
+    spec.FRAME_BODY: 'body',
+    spec.FRAME_HEARTBEAT: 'heartbeat',
+}
+
+
+def trace(tracer, direction, frame, size=None):
+    method = type(frame.payload).__name__ if isinstance(frame, frames.MethodFrame) else None
+    tracer.trace(direction, frame.channel_id, getattr(frame, 'frame_type', None), method, size, time.perf_counter())
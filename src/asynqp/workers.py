@@ -0,0 +1,215 @@
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+
+def run(consume, processes=None, *,
+        prefetch=None,
+        host='localhost', port=5672,
+        username='guest', password='guest',
+        virtual_host='/',
+        restart_delay=1, stats_interval=1, shutdown_timeout=10,
+        **kwargs):
+    """
+    Run a consumer in ``processes`` worker processes, and supervise them until told to stop.
+
+    Each worker has its own event loop, :class:`Connection` and :class:`Channel`.
+    Once the channel is open, the worker calls ``consume(channel)``, which should be a
+    :ref:`coroutine <coroutine>` function that declares what it needs and starts consumers
+    using :meth:`Queue.consume() <Queue.consume>`. The worker then carries on consuming
+    until it is shut down.
+
+    Workers which exit (because they crashed, or lost their connection) are restarted,
+    though not more than once every ``restart_delay`` seconds.
+
+    When the supervising process receives ``SIGINT`` or ``SIGTERM`` it shuts the workers down gracefully:
+    each one cancels its consumers, waits for the callbacks for messages which were already delivered
+    to finish, sends any acks it was holding back, and closes its channel and connection.
+    Callbacks run by :meth:`Queue.consume() <Queue.consume>` as coroutines or in an executor are waited for,
+    for up to half of ``shutdown_timeout``; tasks which a callback starts for itself are not.
+    Workers which haven't finished within ``shutdown_timeout`` seconds are killed.
+
+    This function blocks until the workers have shut down, and must be called from the main thread.
+    ``consume`` and the other arguments must be picklable on platforms which don't fork.
+
+    :param consume: a coroutine function which takes a :class:`Channel` and starts consuming on it.
+    :param int processes: the number of workers to run. Defaults to the number of CPUs.
+    :keyword int prefetch: if given, each worker's channel is given this prefetch count
+        using :meth:`Channel.set_qos() <Channel.set_qos>`.
+
+    The ``host``, ``port``, ``username``, ``password`` and ``virtual_host`` keyword arguments,
+    and any others which aren't listed here, are passed on to :func:`connect`.
+
+    :return: a dictionary of statistics for the whole run: the number of ``workers``,
+        the number of ``restarts``, and the number of messages ``delivered`` to the workers.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes < 1:
+        raise ValueError("There must be at least one worker process.")
+
+    connect_args = (host, port, username, password, virtual_host)
+    supervisor = Supervisor(work, (consume, prefetch, connect_args, kwargs, stats_interval, shutdown_timeout / 2), processes,
+                            restart_delay=restart_delay)
+
+    def request_stop(signum, frame):
+        supervisor.stopping = True
+
+    previous = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        supervisor.start()
+        while not supervisor.stopping:
+            supervisor.collect_stats(timeout=stats_interval)
+            supervisor.restart_crashed()
+    finally:
+        supervisor.stop(shutdown_timeout)
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    return supervisor.totals()
+
+
+class Supervisor(object):
+    def __init__(self, target, args, processes, *, restart_delay=1, context=multiprocessing):
+        self.target = target
+        self.args = args
+        self.restart_delay = restart_delay
+        self.context = context
+        self.workers = [None] * processes
+        self.stats = {}  # worker index -> the latest stats reported by the worker's current process
+        self.retired = {'delivered': 0}  # the final stats of processes which have exited
+        self.restarts = 0
+        self.stopping = False
+
+    def start(self):
+        for index in range(len(self.workers)):
+            self.start_worker(index)
+
+    def start_worker(self, index):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=self.target, args=(sender,) + self.args, daemon=True)
+        process.start()
+        sender.close()  # so we see EOF if the worker dies
+        self.workers[index] = WorkerProcess(process, receiver, time.monotonic())
+
+    def restart_crashed(self):
+        now = time.monotonic()
+        for index, worker in enumerate(self.workers):
+            if self.stopping or worker.process.is_alive() or now - worker.started < self.restart_delay:
+                continue
+            self.drain_stats(index)
+            worker.stats_pipe.close()
+            self.retire(index)
+            self.start_worker(index)
+            self.restarts += 1
+
+    def collect_stats(self, timeout):
+        # once a dead worker's pipe is at EOF it's always readable, so it's left out of the wait,
+        # which only lasts until the worker is due to be restarted
+        pipes = {}
+        for index, worker in enumerate(self.workers):
+            if worker.finished:
+                timeout = min(timeout, max(0, worker.started + self.restart_delay - time.monotonic()))
+            else:
+                pipes[worker.stats_pipe] = index
+        if not pipes:
+            time.sleep(timeout)
+            return
+        for pipe in multiprocessing.connection.wait(list(pipes), timeout):
+            self.drain_stats(pipes[pipe])
+
+    def drain_stats(self, index):
+        worker = self.workers[index]
+        try:
+            while worker.stats_pipe.poll():
+                self.stats[index] = worker.stats_pipe.recv()
+        except (EOFError, OSError):
+            worker.finished = True
+
+    def retire(self, index):
+        stats = self.stats.pop(index, None)
+        if stats is not None:
+            self.retired['delivered'] += stats['delivered']
+
+    def stop(self, timeout):
+        self.stopping = True
+        for worker in self.workers:
+            if worker is not None and worker.process.is_alive():
+                worker.process.terminate()  # SIGTERM asks the worker to shut down gracefully
+
+        deadline = time.monotonic() + timeout
+        for index, worker in enumerate(self.workers):
+            if worker is None:
+                continue
+            worker.process.join(max(0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGKILL)
+                worker.process.join()
+            self.drain_stats(index)
+            worker.stats_pipe.close()
+            self.retire(index)
+
+    def totals(self):
+        delivered = self.retired['delivered'] + sum(stats['delivered'] for stats in self.stats.values())
+        return {'workers': len(self.workers), 'restarts': self.restarts, 'delivered': delivered}
+
+
+class WorkerProcess(object):
+    def __init__(self, process, stats_pipe, started):
+        self.process = process
+        self.stats_pipe = stats_pipe
+        self.started = started
+        self.finished = False  # whether we've seen the end of the stats pipe
+
+
+def work(stats_pipe, consume, prefetch, connect_args, connect_kwargs, stats_interval, drain_timeout):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the supervisor decides when we stop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    stopping = asyncio.Future(loop=loop)
+    loop.add_signal_handler(signal.SIGTERM, lambda: stopping.done() or stopping.set_result(None))
+    try:
+        loop.run_until_complete(consume_until_stopped(loop, consume, prefetch, connect_args, connect_kwargs,
+                                                      stopping, stats_pipe.send, stats_interval, drain_timeout))
+    finally:
+        stats_pipe.close()
+        loop.close()
+
+
+@asyncio.coroutine
+def consume_until_stopped(loop, consume, prefetch, connect_args, connect_kwargs, stopping, report, stats_interval,
+                          drain_timeout=None):
+    from . import connect  # the package imports this module
+
+    connection = yield from connect(*connect_args, loop=loop, **connect_kwargs)
+    channel = yield from connection.open_channel()
+    if prefetch:
+        yield from channel.set_qos(prefetch_count=prefetch)
+    yield from consume(channel)
+
+    started = loop.time()
+
+    def report_stats():
+        report({'pid': os.getpid(), 'delivered': channel.acker.last_delivery_tag, 'uptime': loop.time() - started})
+
+    while not stopping.done() and not channel.closed.done():
+        yield from asyncio.wait([stopping, channel.closed], timeout=stats_interval,
+                                return_when=asyncio.FIRST_COMPLETED, loop=loop)
+        report_stats()
+
+    if not channel.closed.done():
+        # the runners are forgotten once their consumers are cancelled, so collect them first
+        runners = channel.queue_factory.consumers.runners()
+        yield from channel.cancel_consumers()
+        yield from asyncio.sleep(0, loop=loop)  # let the callbacks for messages which were already delivered run
+        try:
+            # and wait for the ones running as tasks or in an executor, so that their acks are sent
+            yield from asyncio.wait_for(asyncio.gather(*[r.drain() for r in runners], loop=loop), drain_timeout, loop=loop)
+        except asyncio.TimeoutError:
+            pass
+        yield from channel.close()
+        yield from connection.close()
+        report_stats()
@@ -0,0 +1,222 @@
+import contexts
+import asynqp
+from asynqp import spec, frames
+from asynqp import message
+from asynqp.acks import IntervalSet
+from .base_contexts import ConsumerContext
+
+
+class WhenAddingNumbersToAnIntervalSet:
+    def given_an_interval_set(self):
+        self.set = IntervalSet()
+
+    def when_I_add_some_numbers(self):
+        for n in [1, 2, 5, 4, 9, 3]:
+            self.set.add(n)
+
+    def it_should_merge_adjacent_numbers(self):
+        assert (self.set.starts, self.set.ends) == ([1, 9], [5, 9])
+
+    def it_should_contain_the_numbers(self):
+        assert 3 in self.set and 9 in self.set
+
+    def it_should_not_contain_the_gaps(self):
+        assert 6 not in self.set and 10 not in self.set
+
+
+class WhenDiscardingTheBottomOfAnIntervalSet:
+    def given_an_interval_set(self):
+        self.set = IntervalSet()
+        for n in [1, 2, 3, 5, 6, 7, 9]:
+            self.set.add(n)
+
+    def when_I_discard_some_numbers(self):
+        self.set.discard_up_to(5)
+
+    def it_should_trim_the_intervals(self):
+        assert (self.set.starts, self.set.ends) == ([6, 9], [7, 9])
+
+
+class CoalescingContext(ConsumerContext):
+    def given_ack_coalescing_is_on(self):
+        self.channel.set_ack_coalescing(max_count=3, max_delay=10)
+        self.messages = {tag: deliver(self, tag) for tag in range(1, 6)}
+        self.server.reset()
+
+
+class WhenIAckFewerMessagesThanTheLimit(CoalescingContext):
+    def when_I_ack_two_messages(self):
+        self.messages[1].ack()
+        self.messages[2].ack()
+
+    def it_should_not_send_anything_yet(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenIAckEnoughContiguousMessagesToFlush(CoalescingContext):
+    def when_I_ack_three_messages(self):
+        self.messages[2].ack()
+        self.messages[1].ack()
+        self.messages[3].ack()
+
+    def it_should_send_a_single_multiple_ack(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(3, True))
+
+    def it_should_not_send_individual_acks(self):
+        self.server.should_not_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+
+class WhenIAckMessagesOutOfOrder(CoalescingContext):
+    def when_I_skip_a_message(self):
+        self.messages[1].ack()
+        self.messages[3].ack()
+        self.messages[4].ack()
+
+    def it_should_ack_the_contiguous_run(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+    def it_should_ack_the_messages_beyond_the_gap_individually(self):
+        self.server.should_have_received_methods(self.channel.id, [spec.BasicAck(3, False), spec.BasicAck(4, False)])
+
+    def it_should_not_ack_the_message_in_the_gap(self):
+        self.server.should_not_have_received_method(self.channel.id, spec.BasicAck(4, True))
+
+
+class WhenARejectedMessageIsInTheRun(CoalescingContext):
+    def given_I_rejected_a_message(self):
+        self.messages[2].reject(requeue=False)
+
+    def when_I_ack_the_messages_on_either_side(self):
+        self.messages[1].ack()
+        self.messages[3].ack()
+        self.messages[4].ack()
+
+    def it_should_send_the_reject_straight_away(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicReject(2, False))
+
+    def it_should_cover_the_run_with_one_ack(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(4, True))
+
+
+class WhenTheFlushTimerIsScheduled(CoalescingContext):
+    def when_I_ack_a_message(self):
+        self.messages[1].ack()
+
+    def it_should_schedule_a_flush(self):
+        assert self.channel.acker.flush_handle is not None
+
+    def cleanup_the_timer(self):
+        self.channel.acker.discard()
+
+
+class WhenICloseTheChannelWithAcksPending(CoalescingContext):
+    def given_two_pending_acks(self):
+        self.messages[1].ack()
+        self.messages[2].ack()
+
+    def when_I_close_the_channel(self):
+        self.async_partial(self.channel.close())
+
+    def it_should_flush_the_acks_before_closing(self):
+        self.server.should_have_received_methods(self.channel.id, [
+            spec.BasicAck(2, True),
+            spec.ChannelClose(0, 'Channel closed by application', 0, 0)
+        ])
+
+
+class WhenTheServerClosesTheChannelWithAcksPending(CoalescingContext):
+    def given_a_pending_ack(self):
+        self.messages[1].ack()
+
+    def when_the_server_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(123, 'i am tired of you', 40, 50))
+
+    def it_should_cancel_the_flush(self):
+        assert self.channel.acker.flush_handle is None
+
+    def it_should_not_send_the_ack(self):
+        self.server.should_not_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+
+class WhenMessagesWereDeliveredBeforeCoalescingWasSwitchedOn(ConsumerContext):
+    def given_a_message_delivered_before_coalescing(self):
+        self.msg = deliver(self, 1)
+        self.channel.set_ack_coalescing(max_count=3, max_delay=10)
+
+    def when_I_acknowledge_the_message(self):
+        self.msg.ack()
+
+    def it_should_send_the_ack_straight_away(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+
+class WhenISetAnInvalidCoalescingLimit(ConsumerContext):
+    def when_I_set_max_count_to_zero(self):
+        self.exception = contexts.catch(self.channel.set_ack_coalescing, max_count=0)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+
+
+def deliver(context, delivery_tag):
+    msg = asynqp.Message('body')
+    context.server.send_method(context.channel.id, spec.BasicDeliver(context.consumer.tag, delivery_tag, False, 'my.exchange', 'routing.key'))
+    header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+    context.server.send_frame(frames.ContentHeaderFrame(context.channel.id, header))
+    body = message.get_frame_payloads(msg, 100)[0]
+    context.server.send_frame(frames.ContentBodyFrame(context.channel.id, body))
+    context.tick()
+    return context.callback.call_args[0][0]
+
+
+class WhenINackADeliveredMessage(ConsumerContext):
+    def given_I_received_a_message(self):
+        self.msg = deliver(self, 7)
+
+    def when_I_nack_the_message(self):
+        self.msg.nack(requeue=False)
+
+    def it_should_send_BasicNack(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicNack(7, False, False))
+
+
+class WhenINackAllMessagesUpToADeliveryTag(ConsumerContext):
+    def given_some_messages(self):
+        for tag in range(1, 5):
+            deliver(self, tag)
+
+    def when_I_nack_them_all(self):
+        self.channel.nack_all_up_to(4, requeue=True)
+
+    def it_should_send_a_single_multiple_BasicNack(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicNack(4, True, True))
+
+
+class WhenIAckAndNackMessagesWhileCoalescing(CoalescingContext):
+    def when_I_settle_a_run_with_mixed_outcomes(self):
+        self.messages[1].ack()
+        self.messages[2].nack(requeue=True)
+        self.messages[3].nack(requeue=True)
+
+    def it_should_settle_each_stretch_with_one_method(self):
+        self.server.should_have_received_methods(self.channel.id, [
+            spec.BasicAck(1, False),
+            spec.BasicNack(3, True, True)
+        ])
+
+
+class WhenINackAllWithAcksPending(CoalescingContext):
+    def given_a_pending_ack(self):
+        self.messages[1].ack()
+
+    def when_I_nack_the_rest(self):
+        self.channel.nack_all_up_to(5, requeue=False)
+
+    def it_should_flush_the_ack_first(self):
+        self.server.should_have_received_methods(self.channel.id, [
+            spec.BasicAck(1, False),
+            spec.BasicNack(5, True, False)
+        ])
+
+    def it_should_move_the_floor_up(self):
+        assert self.channel.acker.floor == 5
@@ -109,6 +109,26 @@ class ConsumerContext(QueueContext):
         self.consumer = task.result()
 
 
+class ManyBrokersContext(LoopContext):
+    def given_no_brokers_yet(self):
+        self.connections = {}
+        self.servers = {}
+
+    def start_broker(self, name):
+        dispatcher = asynqp.routing.Dispatcher()
+        amqp = protocol.AMQP(dispatcher, self.loop)
+        server = MockServer(amqp, self.tick)
+        amqp.connection_made(FakeTransport(server))
+
+        task = asyncio.async(open_connection(self.loop, amqp.transport, amqp, dispatcher, ConnectionInfo('guest', 'guest', '/')))
+        self.tick()
+        server.send_method(0, spec.ConnectionStart(0, 9, {}, 'PLAIN AMQPLAIN', 'en_US'))
+        server.send_method(0, spec.ConnectionTune(0, 131072, 600))
+        server.send_method(0, spec.ConnectionOpenOK(''))
+        self.connections[name] = task.result()
+        self.servers[name] = server
+
+
 class MockLoopContext(LoopContext):
     def given_an_event_loop(self):
         self.loop = mock.Mock(spec=asyncio.AbstractEventLoop)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import tempfile
+import asynqp
+from asynqp.broker import Broker, topic_matches
+from .util import testing_exception_handler
+
+
+class BrokerContext:
+    def given_a_broker_with_a_connection(self):
+        self.loop = asyncio.get_event_loop()
+        self.loop.set_exception_handler(testing_exception_handler)
+        self.broker = Broker(loop=self.loop)
+        self.start()
+        self.connection = self.run(self.broker.connect())
+        self.channel = self.run(self.connection.open_channel())
+
+    def start(self):
+        self.run(self.broker.start())
+
+    def run(self, coro, timeout=1):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout, loop=self.loop))
+
+    def cleanup_the_connection_and_the_broker(self):
+        self.run(self.connection.close())
+        self.run(self.broker.close())
+        self.run(asyncio.sleep(0, loop=self.loop))
+        self.loop.set_exception_handler(None)
+
+
+class WhenIPublishToATopicExchangeAndConsume(BrokerContext):
+    def given_a_bound_queue_and_a_consumer(self):
+        self.received = []
+        self.run(self.setup())
+
+    @asyncio.coroutine
+    def setup(self):
+        self.exchange = yield from self.channel.declare_exchange('my.exchange', 'topic')
+        self.queue = yield from self.channel.declare_queue('my.queue')
+        yield from self.queue.bind(self.exchange, 'stock.#')
+        yield from self.queue.consume(self.callback)
+
+    def callback(self, msg):
+        self.received.append(msg)
+        msg.ack()
+
+    def when_I_publish_some_messages(self):
+        self.exchange.publish(asynqp.Message({'n': 1}), 'stock.nasdaq.goog')
+        self.exchange.publish(asynqp.Message({'n': 2}), 'stock')
+        self.exchange.publish(asynqp.Message({'n': 3}), 'news.nasdaq', mandatory=False)
+        self.run(asyncio.sleep(0.05, loop=self.loop))
+
+    def it_should_deliver_the_messages_which_match(self):
+        assert [m.json() for m in self.received] == [{'n': 1}, {'n': 2}]
+
+    def it_should_number_the_deliveries(self):
+        assert [m.delivery_tag for m in self.received] == [1, 2]
+
+
+class WhenARejectedMessageIsRequeued(BrokerContext):
+    def given_a_large_message_in_a_queue(self):
+        self.body = os.urandom(300000)  # several frames
+        self.queue = self.run(self.channel.declare_queue('', exclusive=True))
+        self.channel.default_exchange.publish(asynqp.Message(self.body), self.queue.name)
+        self.first = self.run(self.queue.get())
+
+    def when_I_reject_the_message_and_get_the_next_one(self):
+        self.first.reject(requeue=True)
+        self.second = self.run(self.queue.get())
+        self.second.ack()
+        self.third = self.run(self.queue.get())
+
+    def it_should_keep_the_body_intact(self):
+        assert self.first.body == self.second.body == self.body
+
+    def it_should_leave_the_queue_empty(self):
+        assert self.third is None
+
+
+class WhenIPublishWithConfirms(BrokerContext):
+    def given_a_channel_in_confirm_mode(self):
+        self.run(self.channel.enable_confirms())
+        self.queue = self.run(self.channel.declare_queue('my.queue'))
+
+    def when_I_publish_and_wait_for_the_confirms(self):
+        self.futures = [self.channel.default_exchange.publish(asynqp.Message('hi'), 'my.queue') for _ in range(10)]
+        self.run(self.channel.wait_for_confirms())
+
+    def it_should_confirm_every_message(self):
+        assert all(f.result() for f in self.futures)
+
+
+class WhenTheChannelPrefetchCountIsReached(BrokerContext):
+    def given_a_channel_limited_to_two_unacked_messages(self):
+        self.received = []
+        self.run(self.channel.set_qos(prefetch_count=2, apply_globally=True))
+        self.queue = self.run(self.channel.declare_queue('my.queue'))
+        self.run(self.queue.consume(self.received.append))
+
+    def when_I_publish_five_messages_and_ack_the_first_two(self):
+        for i in range(5):
+            self.channel.default_exchange.publish(asynqp.Message(str(i)), 'my.queue')
+        self.run(asyncio.sleep(0.05, loop=self.loop))
+        self.delivered_before_the_acks = len(self.received)
+        for msg in list(self.received):
+            msg.ack()
+        self.run(asyncio.sleep(0.05, loop=self.loop))
+
+    def it_should_only_deliver_two_at_first(self):
+        assert self.delivered_before_the_acks == 2
+
+    def it_should_deliver_two_more_once_they_are_acked(self):
+        assert len(self.received) == 4
+
+
+class WhenIDeclareAnExchangeWithADifferentType(BrokerContext):
+    def given_an_exchange(self):
+        self.run(self.channel.declare_exchange('my.exchange', 'fanout'))
+
+    def when_I_redeclare_the_exchange_as_a_topic_exchange(self):
+        try:
+            self.run(self.channel.declare_exchange('my.exchange', 'topic'))
+        except asynqp.ChannelClosedError as e:
+            self.exception = e
+        # the channel's gone, so open another for the cleanup to close
+        self.channel = self.run(self.connection.open_channel())
+
+    def it_should_close_the_channel(self):
+        assert self.exception.args[0] == 406
+
+
+class WhenTheBrokerListensOnAUnixSocket(BrokerContext):
+    def start(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.run(self.broker.start_unix(os.path.join(self.directory.name, 'amqp.sock')))
+
+    def when_I_send_a_message_over_the_socket(self):
+        queue = self.run(self.channel.declare_queue('my.queue'))
+        self.channel.default_exchange.publish(asynqp.Message('hello'), 'my.queue')
+        self.msg = self.run(queue.get())
+
+    def it_should_arrive(self):
+        assert self.msg.body == b'hello'
+
+    def cleanup_the_socket(self):
+        self.directory.cleanup()
+
+
+class WhenMatchingTopics:
+    def when_I_match_some_patterns(self):
+        self.results = [topic_matches(pattern.split('.'), key.split('.')) for pattern, key in [
+            ('a.*.c', 'a.b.c'),
+            ('a.*.c', 'a.c'),
+            ('a.#', 'a'),
+            ('#.c', 'a.b.c'),
+            ('a.#.c', 'a.b.d'),
+        ]]
+
+    def it_should_treat_star_as_one_word_and_hash_as_any_number(self):
+        assert self.results == [True, False, True, True, False]
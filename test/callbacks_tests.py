@@ -0,0 +1,334 @@
+import asyncio
+import concurrent.futures
+import contexts
+import asynqp
+from asynqp import message
+from asynqp import frames
+from asynqp import spec
+from .base_contexts import QueueContext
+from .util import testing_exception_handler
+
+
+class DeferredExecutor(concurrent.futures.Executor):
+    """Runs nothing until the test says so"""
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, fn, *args):
+        fut = concurrent.futures.Future()
+        self.calls.append((fut, fn, args))
+        return fut
+
+    def finish(self, i=0):
+        fut, fn, args = self.calls[i]
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+
+
+class DeliveryContext(QueueContext):
+    def deliver(self, delivery_tag, body='body'):
+        msg = asynqp.Message(body)
+        self.server.send_method(self.channel.id, spec.BasicDeliver('made.up.tag', delivery_tag, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        self.server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        self.server.send_frame(frames.ContentBodyFrame(self.channel.id, message.get_frame_payloads(msg, 100)[0]))
+        self.tick()
+
+    def start_consumer(self, callback, **kwargs):
+        task = asyncio.async(self.queue.consume(callback, **kwargs), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicConsumeOK('made.up.tag'))
+        self.consumer = task.result()
+        self.server.reset()
+
+
+class ExecutorContext(DeliveryContext):
+    def given_a_consumer_with_an_executor(self):
+        self.received = []
+        self.executor = DeferredExecutor()
+        self.start_consumer(self.callback, executor=self.executor, max_concurrency=1)
+
+    def callback(self, msg):
+        self.received.append(msg)
+
+    def finish(self, i=0):
+        self.executor.finish(i)
+        self.tick()
+        self.tick()
+
+
+class WhenAMessageIsDeliveredToAnExecutorConsumer(ExecutorContext):
+    def when_a_message_arrives(self):
+        self.deliver(1)
+
+    def it_should_hand_a_detached_message_to_the_executor(self):
+        fut, fn, args = self.executor.calls[0]
+        assert isinstance(args[1], asynqp.DetachedMessage)
+        assert args[1].body == b'body'
+
+    def it_should_not_ack_the_message_yet(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenAnExecutorCallbackReturns(ExecutorContext):
+    def given_a_message_in_the_executor(self):
+        self.deliver(1)
+
+    def when_the_callback_returns(self):
+        self.finish()
+
+    def it_should_ack_the_message(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+
+class WhenAnExecutorCallbackRejectsTheMessage(ExecutorContext):
+    def given_a_message_in_the_executor(self):
+        self.deliver(1)
+
+    def callback(self, msg):
+        msg.reject(requeue=True)
+
+    def when_the_callback_returns(self):
+        self.finish()
+
+    def it_should_reject_the_message_on_the_loop(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicReject(1, True))
+
+
+class WhenAnExecutorCallbackRaises(ExecutorContext):
+    def given_a_message_in_the_executor(self):
+        self.errors = []
+        self.loop.set_exception_handler(lambda loop, context: self.errors.append(context))
+        self.deliver(1)
+
+    def callback(self, msg):
+        raise ValueError
+
+    def when_the_callback_raises(self):
+        self.finish()
+
+    def it_should_reject_the_message_without_requeueing(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicReject(1, False))
+
+    def it_should_report_the_exception(self):
+        assert isinstance(self.errors[0]['exception'], ValueError)
+
+    def cleanup_the_exception_handler(self):
+        self.loop.set_exception_handler(testing_exception_handler)
+
+
+class WhenTheExecutorIsBusy(ExecutorContext):
+    def when_two_messages_arrive(self):
+        self.deliver(1)
+        self.deliver(2)
+
+    def it_should_only_run_one_at_a_time(self):
+        assert len(self.executor.calls) == 1
+
+
+class WhenTheExecutorFinishesAMessage(ExecutorContext):
+    def given_a_message_waiting_for_the_executor(self):
+        self.deliver(1)
+        self.deliver(2)
+
+    def when_the_first_callback_returns(self):
+        self.finish()
+
+    def it_should_start_the_next_message(self):
+        assert len(self.executor.calls) == 2
+        assert self.executor.calls[1][2][1].delivery_tag == 2
+
+
+class WhenTheConcurrencyLimitFollowsThePrefetchCount(DeliveryContext):
+    def given_a_prefetch_count_and_a_consumer_with_an_executor(self):
+        task = asyncio.async(self.channel.set_qos(prefetch_count=2), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicQosOK())
+        task.result()
+        self.executor = DeferredExecutor()
+        self.start_consumer(lambda msg: None, executor=self.executor)
+
+    def when_three_messages_arrive(self):
+        for tag in (1, 2, 3):
+            self.deliver(tag)
+
+    def it_should_run_as_many_as_the_prefetch_count(self):
+        assert len(self.executor.calls) == 2
+
+
+class WhenIAskForNoConcurrency(QueueContext):
+    def when_I_start_the_consumer(self):
+        task = asyncio.async(self.queue.consume(lambda msg: None, executor=DeferredExecutor(), max_concurrency=0), loop=self.loop)
+        self.tick()
+        self.exception = contexts.catch(task.result)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+
+
+class CoroutineCallbackContext(DeliveryContext):
+    @asyncio.coroutine
+    def callback(self, msg):
+        fut = asyncio.Future(loop=self.loop)
+        self.waiting.append((msg, fut))
+        yield from fut
+
+    def finish(self, i=0, exception=None):
+        msg, fut = self.waiting[i]
+        if exception is None:
+            fut.set_result(None)
+        else:
+            fut.set_exception(exception)
+        self.tick()
+        self.tick()
+
+
+class CoroutineContext(CoroutineCallbackContext):
+    def given_a_consumer_with_a_coroutine_callback(self):
+        self.waiting = []
+        self.start_consumer(self.callback, max_concurrency=2, auto_ack=True)
+
+
+class WhenMessagesArriveForACoroutineConsumer(CoroutineContext):
+    def when_three_messages_arrive(self):
+        for tag in (1, 2, 3):
+            self.deliver(tag)
+
+    def it_should_run_the_callback_for_two_of_them(self):
+        assert [msg.delivery_tag for msg, fut in self.waiting] == [1, 2]
+
+
+class WhenACoroutineCallbackFinishes(CoroutineContext):
+    def given_a_message_waiting_its_turn(self):
+        for tag in (1, 2, 3):
+            self.deliver(tag)
+
+    def when_the_first_callback_finishes(self):
+        self.finish(0)
+
+    def it_should_ack_the_message(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(1, False))
+
+    def it_should_start_the_waiting_message(self):
+        assert self.waiting[2][0].delivery_tag == 3
+
+
+class WhenACoroutineCallbackFails(CoroutineContext):
+    def given_a_running_callback(self):
+        self.errors = []
+        self.loop.set_exception_handler(lambda loop, context: self.errors.append(context))
+        self.deliver(1)
+
+    def when_the_callback_raises(self):
+        self.finish(0, ValueError())
+
+    def it_should_reject_the_message_without_requeueing(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicReject(1, False))
+
+    def it_should_report_the_exception(self):
+        assert isinstance(self.errors[0]['exception'], ValueError)
+
+    def cleanup_the_exception_handler(self):
+        self.loop.set_exception_handler(testing_exception_handler)
+
+
+class WhenACoroutineCallbackSettlesTheMessageItself(CoroutineContext):
+    def given_a_callback_which_nacked_its_message(self):
+        self.deliver(1)
+        self.waiting[0][0].nack(requeue=True)
+        self.server.reset()
+
+    def when_the_callback_finishes(self):
+        self.finish(0)
+
+    def it_should_not_ack_the_message_as_well(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenACoroutineConsumerDoesNotAutoAck(DeliveryContext):
+    def given_a_consumer_without_auto_ack(self):
+        self.start_consumer(self.callback)
+
+    @asyncio.coroutine
+    def callback(self, msg):
+        self.received = msg
+
+    def when_a_message_arrives(self):
+        self.deliver(1)
+        self.tick()
+
+    def it_should_run_the_coroutine(self):
+        assert self.received.delivery_tag == 1
+
+    def it_should_leave_the_ack_to_the_application(self):
+        self.server.should_not_have_received_any()
+
+
+class KeyedContext(CoroutineCallbackContext):
+    def given_a_consumer_which_orders_by_key(self):
+        self.waiting = []
+        self.start_consumer(self.callback, max_concurrency=2, auto_ack=True, key=lambda msg: msg.body[:1])
+
+    def running(self):
+        return [msg.body.decode() for msg, fut in self.waiting if not fut.done()]
+
+
+class WhenMessagesWithTheSameKeyArrive(KeyedContext):
+    def when_messages_for_two_keys_arrive(self):
+        for tag, body in enumerate(('a1', 'b1', 'a2'), 1):
+            self.deliver(tag, body)
+
+    def it_should_handle_one_message_per_key_at_a_time(self):
+        assert self.running() == ['a1', 'b1']
+
+
+class WhenTheFirstMessageForAKeyFinishes(KeyedContext):
+    def given_messages_for_two_keys(self):
+        for tag, body in enumerate(('a1', 'b1', 'a2'), 1):
+            self.deliver(tag, body)
+
+    def when_the_first_message_finishes(self):
+        self.finish(0)
+
+    def it_should_start_the_next_message_for_that_key(self):
+        assert self.running() == ['b1', 'a2']
+
+
+class WhenEveryKeyIsWaitingForASlot(KeyedContext):
+    def given_the_concurrency_limit_is_reached(self):
+        for tag, body in enumerate(('a1', 'b1', 'c1', 'd1'), 1):
+            self.deliver(tag, body)
+
+    def when_a_message_finishes(self):
+        self.finish(1)
+
+    def it_should_give_the_slot_to_the_key_which_has_waited_longest(self):
+        assert self.running() == ['a1', 'c1']
+
+
+class WhenKeyedMessagesFinishOutOfOrderWithCoalescedAcks(KeyedContext):
+    def given_coalesced_acks_and_two_messages(self):
+        self.channel.set_ack_coalescing(max_count=2, max_delay=60)
+        self.deliver(1, 'a1')
+        self.deliver(2, 'b1')
+        self.server.reset()
+
+    def when_the_later_message_finishes_first(self):
+        self.finish(1)
+        self.finish(0)
+
+    def it_should_ack_both_with_one_multiple_ack(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(2, True))
+        self.server.should_not_have_received_method(self.channel.id, spec.BasicAck(2, False))
+
+
+class WhenIOrderByKeyWithAPlainCallback(QueueContext):
+    def when_I_start_the_consumer(self):
+        task = asyncio.async(self.queue.consume(lambda msg: None, key=lambda msg: msg.body), loop=self.loop)
+        self.tick()
+        self.exception = contexts.catch(task.result)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
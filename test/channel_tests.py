@@ -111,6 +111,111 @@ class WhenAnUnexpectedChannelCloseArrives(OpenChannelContext):
         assert self.task.exception() is not None
 
 
+class WhenTheServerRefusesANoWaitDeclaration(OpenChannelContext):
+    def given_I_declared_a_queue_without_waiting(self):
+        self.async_partial(self.channel.declare_queue('my.nice.queue', nowait=True))
+
+    def when_the_server_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(406, "PRECONDITION_FAILED", 50, 10))
+        self.task = asyncio.async(self.channel.declare_queue('my.other.queue'), loop=self.loop)
+        self.tick()
+
+    def it_should_throw_ChannelClosedError_from_the_next_call(self):
+        assert isinstance(self.task.exception(), asynqp.ChannelClosedError)
+
+    def it_should_carry_the_reply_code(self):
+        assert self.task.exception().args == (406, "PRECONDITION_FAILED")
+
+
+class TopologyContext(OpenChannelContext):
+    def given_a_topology(self):
+        self.topology = {
+            'exchanges': [{'name': 'my.exchange', 'type': 'topic'}],
+            'queues': [{'name': 'my.queue', 'arguments': {'x-message-ttl': 60000}},
+                       {'name': 'my.other.queue', 'durable': False}],
+            'bindings': [{'queue': 'my.queue', 'exchange': 'my.exchange', 'routing_key': 'a.#'},
+                         {'queue': 'my.other.queue', 'exchange': 'my.exchange', 'routing_key': 'b.#'}]
+        }
+
+
+class WhenApplyingATopology(TopologyContext):
+    def when_I_apply_the_topology(self):
+        self.task = asyncio.async(self.channel.apply_topology(self.topology), loop=self.loop)
+        self.tick()
+
+    def it_should_send_every_declaration_without_waiting(self):
+        self.server.should_have_received_methods(self.channel.id, [
+            spec.ExchangeDeclare(0, 'my.exchange', 'topic', False, True, False, False, False, {}),
+            spec.QueueDeclare(0, 'my.queue', False, True, False, False, False, {'x-message-ttl': 60000}),
+            spec.QueueDeclare(0, 'my.other.queue', False, False, False, False, False, {}),
+            spec.QueueBind(0, 'my.queue', 'my.exchange', 'a.#', False, {}),
+            spec.QueueBind(0, 'my.other.queue', 'my.exchange', 'b.#', False, {})
+        ])
+
+    def it_should_wait_for_the_replies(self):
+        assert not self.task.done()
+
+
+class WhenTheRepliesToATopologyArrive(TopologyContext):
+    def given_I_applied_the_topology(self):
+        self.task = asyncio.async(self.channel.apply_topology(self.topology), loop=self.loop)
+        self.tick()
+
+    def when_the_replies_arrive(self):
+        self.server.send_method(self.channel.id, spec.ExchangeDeclareOK())
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK('my.queue', 0, 0))
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK('my.other.queue', 0, 0))
+        self.server.send_method(self.channel.id, spec.QueueBindOK())
+        self.server.send_method(self.channel.id, spec.QueueBindOK())
+        self.result = self.task.result()
+
+    def it_should_return_the_exchange(self):
+        assert self.result['my.exchange'].type == 'topic'
+
+    def it_should_return_the_queues(self):
+        assert self.result['my.queue'].arguments == {'x-message-ttl': 60000}
+        assert not self.result['my.other.queue'].durable
+
+    def it_should_return_the_bindings(self):
+        binding = self.result['my.other.queue', 'my.exchange', 'b.#']
+        assert binding.queue is self.result['my.other.queue']
+        assert binding.exchange is self.result['my.exchange']
+
+    def it_should_leave_the_channel_usable(self):
+        self.async_partial(self.channel.set_qos(prefetch_count=10))
+        self.server.should_have_received_method(self.channel.id, spec.BasicQos(0, 10, False))
+
+
+class WhenATopologyBindsToAnUndeclaredExchange(TopologyContext):
+    def given_a_binding_to_a_missing_exchange(self):
+        self.topology['bindings'].append({'queue': 'my.queue', 'exchange': 'missing', 'routing_key': ''})
+        self.server.reset()
+
+    def when_I_apply_the_topology(self):
+        self.task = asyncio.async(self.channel.apply_topology(self.topology), loop=self.loop)
+        self.tick()
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.task.exception(), ValueError)
+
+    def it_should_not_send_anything(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenTheServerRefusesPartOfATopology(TopologyContext):
+    def given_I_applied_the_topology(self):
+        self.task = asyncio.async(self.channel.apply_topology(self.topology), loop=self.loop)
+        self.tick()
+
+    def when_the_server_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ExchangeDeclareOK())
+        self.server.send_method(self.channel.id, spec.ChannelClose(406, "PRECONDITION_FAILED", 50, 10))
+        self.tick()
+
+    def it_should_throw_ChannelClosedError(self):
+        assert isinstance(self.task.exception(), asynqp.ChannelClosedError)
+
+
 class WhenSettingQOS(OpenChannelContext):
     def when_we_are_setting_prefetch_count_only(self):
         self.async_partial(self.channel.set_qos(prefetch_size=1000, prefetch_count=100, apply_globally=True))
@@ -220,3 +325,202 @@ class WhenTheHandlerIsNotCallable(OpenChannelContext):
 
     def it_should_throw_a_TypeError(self):
         assert isinstance(self.exception, TypeError)
+
+
+class WhenEnablingPublisherConfirms(OpenChannelContext):
+    def when_I_enable_confirms(self):
+        self.async_partial(self.channel.enable_confirms())
+
+    def it_should_send_ConfirmSelect(self):
+        self.server.should_have_received_method(self.channel.id, spec.ConfirmSelect(False))
+
+
+class WhenConfirmSelectOKArrives(OpenChannelContext):
+    def given_I_enabled_confirms(self):
+        self.task = asyncio.async(self.channel.enable_confirms())
+        self.tick()
+
+    def when_ConfirmSelectOK_arrives(self):
+        self.server.send_method(self.channel.id, spec.ConfirmSelectOK())
+
+    def it_should_be_in_confirm_mode(self):
+        assert self.task.done() and self.channel.confirms.enabled
+
+
+class WhenIOpenAChannelAfterClosingOne(OpenChannelContext):
+    def given_I_closed_the_first_of_two_channels(self):
+        self.second = self.open_channel(2)
+        task = asyncio.async(self.channel.close(), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.ChannelCloseOK())
+        task.result()
+        self.tick()
+        self.open_ids = set(self.dispatcher.queue_writers)
+
+    def when_I_open_another_channel(self):
+        self.result = self.open_channel(1)
+
+    def it_should_reuse_the_lowest_free_id(self):
+        assert self.result.id == 1
+
+    def it_should_have_stopped_routing_frames_to_the_closed_channel(self):
+        assert self.open_ids == {0, 2}
+
+
+class WhenTheServerClosesAChannelWhichIsInUse(OpenChannelContext):
+    def given_I_am_waiting_for_a_reply(self):
+        self.task = asyncio.async(self.channel.declare_queue('my.nice.queue'), loop=self.loop)
+        self.tick()
+
+    def when_the_server_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(123, 'i am tired of you', 40, 50))
+        self.tick()
+
+    def it_should_stop_routing_frames_to_the_channel(self):
+        assert self.channel.id not in self.dispatcher.queue_writers
+
+    def it_should_be_closed(self):
+        assert self.channel.closed.done()
+
+
+class WhenIUseAChannelAfterClosingIt(OpenChannelContext):
+    def given_I_closed_the_channel(self):
+        task = asyncio.async(self.channel.close(), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.ChannelCloseOK())
+        task.result()
+
+    def when_I_try_to_declare_a_queue(self):
+        self.task = asyncio.async(self.channel.declare_queue('my.nice.queue'), loop=self.loop)
+        self.tick()
+
+    def it_should_throw_ChannelClosedError(self):
+        assert isinstance(self.task.exception(), asynqp.ChannelClosedError)
+
+
+class WhenIRunOutOfChannels(OpenConnectionContext):
+    def given_the_server_only_allows_two_channels(self):
+        self.connection.connection_info.channel_max = 2
+        self.first = self.open_channel(1)
+        self.second = self.open_channel(2)
+
+    def when_I_open_a_third_channel(self):
+        self.task = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.tick()
+
+    def it_should_throw_AMQPError(self):
+        assert isinstance(self.task.exception(), asynqp.AMQPError)
+
+    def open_channel(self, channel_id):
+        task = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.tick()
+        self.server.send_method(channel_id, spec.ChannelOpenOK(''))
+        return task.result()
+
+
+class WhenOpeningAChannelIsCancelled(OpenConnectionContext):
+    def given_I_cancelled_opening_a_channel(self):
+        self.task = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.tick()
+        self.task.cancel()
+        self.tick()
+
+    def when_the_broker_opens_the_channel_anyway(self):
+        self.server.send_method(1, spec.ChannelOpenOK(''))
+        self.tick()
+
+    def it_should_close_the_channel(self):
+        self.server.should_have_received_method(1, spec.ChannelClose(0, 'Channel closed by application', 0, 0))
+
+    def it_should_not_reuse_the_id_until_the_broker_has_closed_the_channel(self):
+        assert self.open_channel(2).id == 2
+        self.server.send_method(1, spec.ChannelCloseOK())
+        self.tick()
+        assert self.open_channel(1).id == 1
+
+    def open_channel(self, channel_id):
+        task = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.tick()
+        self.server.send_method(channel_id, spec.ChannelOpenOK(''))
+        return task.result()
+
+
+class WhenIOpenTwoChannelsConcurrently(OpenConnectionContext):
+    def when_I_open_two_channels_at_once(self):
+        self.first = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.second = asyncio.async(self.connection.open_channel(), loop=self.loop)
+        self.tick()
+        self.server.send_method(2, spec.ChannelOpenOK(''))
+        self.server.send_method(1, spec.ChannelOpenOK(''))
+
+    def it_should_give_them_different_ids(self):
+        assert {self.first.result().id, self.second.result().id} == {1, 2}
+
+
+class WhenIOpenSeveralChannelsAtOnce(OpenConnectionContext):
+    def when_I_open_three_channels(self):
+        self.task = asyncio.async(self.connection.open_channels(3), loop=self.loop)
+        self.tick()
+
+    def it_should_send_every_ChannelOpen_before_any_reply(self):
+        for channel_id in (1, 2, 3):
+            self.server.should_have_received_method(channel_id, spec.ChannelOpen(''))
+
+    def it_should_wait_for_the_replies(self):
+        assert not self.task.done()
+
+
+class WhenTheRepliesToSeveralChannelOpensArrive(OpenConnectionContext):
+    def given_I_opened_three_channels(self):
+        self.task = asyncio.async(self.connection.open_channels(3), loop=self.loop)
+        self.tick()
+
+    def when_the_replies_arrive(self):
+        for channel_id in (1, 2, 3):
+            self.server.send_method(channel_id, spec.ChannelOpenOK(''))
+        self.tick()
+
+    def it_should_return_the_channels_in_order(self):
+        assert [c.id for c in self.task.result()] == [1, 2, 3]
+
+
+class WhenOneOfSeveralChannelsFailsToOpen(OpenConnectionContext):
+    def given_I_opened_two_channels(self):
+        self.task = asyncio.async(self.connection.open_channels(2), loop=self.loop)
+        self.tick()
+
+    def when_the_server_refuses_one(self):
+        self.server.send_method(1, spec.ChannelOpenOK(''))
+        self.server.send_method(2, spec.ChannelClose(504, 'CHANNEL_ERROR', 20, 10))
+        self.tick()
+
+    def it_should_close_the_other_channel(self):
+        self.server.should_have_received_method(1, spec.ChannelClose(0, 'Channel closed by application', 0, 0))
+
+    def it_should_throw_the_error(self):
+        self.server.send_method(1, spec.ChannelCloseOK())
+        self.tick()
+        assert isinstance(self.task.exception(), asynqp.ChannelClosedError)
+
+
+class WhenIDeclareSeveralThingsConcurrently(OpenChannelContext):
+    def given_I_made_three_declarations_at_once(self):
+        self.tasks = [
+            asyncio.async(self.channel.declare_queue('my.first.queue'), loop=self.loop),
+            asyncio.async(self.channel.declare_exchange('my.exchange', 'topic'), loop=self.loop),
+            asyncio.async(self.channel.declare_queue('my.second.queue'), loop=self.loop)
+        ]
+        self.tick()
+
+    def when_the_replies_arrive(self):
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK('my.first.queue', 0, 0))
+        self.server.send_method(self.channel.id, spec.ExchangeDeclareOK())
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK('my.second.queue', 0, 0))
+        self.tick()
+
+    def it_should_complete_every_declaration(self):
+        assert [t.result().name for t in self.tasks] == ['my.first.queue', 'my.exchange', 'my.second.queue']
+
+    def it_should_leave_the_channel_usable(self):
+        self.async_partial(self.channel.set_qos(prefetch_count=10))
+        self.server.should_have_received_method(self.channel.id, spec.BasicQos(0, 10, False))
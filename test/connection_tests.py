@@ -1,10 +1,12 @@
 import asyncio
+import contexts
+import socket
 import sys
 import asynqp
 from unittest import mock
 from asynqp import spec
-from asynqp.connection import open_connection, ConnectionInfo
-from .base_contexts import LegacyOpenConnectionContext, MockServerContext, OpenConnectionContext
+from asynqp.connection import open_connection, ConnectionInfo, set_socket_options
+from .base_contexts import LegacyOpenConnectionContext, MockServerContext, OpenConnectionContext, LoopContext
 
 
 class WhenRespondingToConnectionStart(MockServerContext):
@@ -40,6 +42,70 @@ class WhenRespondingToConnectionTune(MockServerContext):
         self.server.should_have_received_methods(0, [tune_ok_method, open_method])
 
 
+class WhenIAskForSmallerLimitsThanTheServer(MockServerContext):
+    def given_a_started_connection_with_limits(self):
+        connection_info = ConnectionInfo('guest', 'guest', '/')
+        self.task = self.async_partial(open_connection(self.loop, self.transport, self.protocol, self.dispatcher, connection_info,
+                                                       frame_max=65536, channel_max=100, heartbeat=0))
+        self.server.send_method(0, spec.ConnectionStart(0, 9, {}, 'PLAIN AMQPLAIN', 'en_US'))
+
+    def when_ConnectionTune_arrives(self):
+        self.server.send_method(0, spec.ConnectionTune(0, 131072, 600))
+        self.server.send_method(0, spec.ConnectionOpenOK(''))
+
+    def it_should_agree_to_the_smaller_limits_and_no_heartbeat(self):
+        self.server.should_have_received_method(0, spec.ConnectionTuneOK(100, 65536, 0))
+
+    def it_should_use_the_agreed_limits(self):
+        assert self.task.result().connection_info.frame_max == 65536
+        assert self.task.result().connection_info.channel_max == 100
+
+    def it_should_not_start_the_heartbeat(self):
+        assert self.protocol.heartbeat_monitor.heartbeat_timeout_callback is None
+
+
+class WhenIAskForLargerLimitsThanTheServer(MockServerContext):
+    def given_a_started_connection_with_limits(self):
+        connection_info = ConnectionInfo('guest', 'guest', '/')
+        self.async_partial(open_connection(self.loop, self.transport, self.protocol, self.dispatcher, connection_info,
+                                           frame_max=0, channel_max=2048))
+        self.server.send_method(0, spec.ConnectionStart(0, 9, {}, 'PLAIN AMQPLAIN', 'en_US'))
+
+    def when_ConnectionTune_arrives(self):
+        self.server.send_method(0, spec.ConnectionTune(1024, 131072, 600))
+
+    def it_should_agree_to_the_servers_limits(self):
+        self.server.should_have_received_method(0, spec.ConnectionTuneOK(1024, 131072, 600))
+
+
+class WhenISetSocketOptions:
+    def given_a_tcp_socket(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    def when_I_set_the_options(self):
+        set_socket_options(self.sock, True, 65536, 65536)
+
+    def it_should_switch_off_nagles_algorithm(self):
+        assert self.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+    def it_should_set_the_buffer_sizes(self):
+        assert self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) >= 65536
+        assert self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 65536
+
+    def cleanup_the_socket(self):
+        self.sock.close()
+
+
+class WhenIAskForFramesBelowTheMinimumSize(LoopContext):
+    def when_I_connect(self):
+        task = asyncio.async(asynqp.connect(frame_max=1024), loop=self.loop)
+        self.tick()
+        self.exception = contexts.catch(task.result)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+
+
 class WhenRespondingToConnectionClose(OpenConnectionContext):
     def when_the_close_frame_arrives(self):
         self.server.send_method(0, spec.ConnectionClose(123, 'you muffed up', 10, 20))
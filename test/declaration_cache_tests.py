@@ -0,0 +1,138 @@
+import asyncio
+from asynqp import spec
+from .base_contexts import OpenChannelContext
+
+
+class DeclarationCacheContext(OpenChannelContext):
+    def given_the_cache_is_enabled(self):
+        self.connection.enable_declaration_cache()
+
+    def declare_queue(self, channel, name='my.queue', **kwargs):
+        task = asyncio.async(channel.declare_queue(name, **kwargs), loop=self.loop)
+        self.tick()
+        if not task.done():
+            self.server.send_method(channel.id, spec.QueueDeclareOK(name, 0, 0))
+        return task.result()
+
+    def declare_exchange(self, channel, name='my.exchange', **kwargs):
+        task = asyncio.async(channel.declare_exchange(name, 'topic', **kwargs), loop=self.loop)
+        self.tick()
+        if not task.done():
+            self.server.send_method(channel.id, spec.ExchangeDeclareOK())
+        return task.result()
+
+
+class WhenIDeclareTheSameQueueTwice(DeclarationCacheContext):
+    def given_I_declared_a_queue(self):
+        self.first = self.declare_queue(self.channel, arguments={'x-max-length': 10})
+        self.server.reset()
+
+    def when_I_declare_the_same_thing_again(self):
+        self.second = self.declare_queue(self.channel, arguments={'x-max-length': 10})
+
+    def it_should_not_ask_the_broker(self):
+        self.server.should_not_have_received_any()
+
+    def it_should_return_the_same_object(self):
+        assert self.second is self.first
+
+
+class WhenIDeclareTheSameExchangeOnAnotherChannel(DeclarationCacheContext):
+    def given_I_declared_an_exchange(self):
+        self.first = self.declare_exchange(self.channel)
+        self.other_channel = self.open_channel(2)
+        self.server.reset()
+
+    def when_I_declare_the_exchange_on_the_other_channel(self):
+        self.second = self.declare_exchange(self.other_channel)
+
+    def it_should_not_ask_the_broker(self):
+        self.server.should_not_have_received_any()
+
+    def it_should_return_an_exchange_for_the_other_channel(self):
+        assert self.second is not self.first
+        assert self.second.sender is self.other_channel.sender
+
+
+class WhenIDeclareAQueueWithDifferentArguments(DeclarationCacheContext):
+    def given_I_declared_a_queue(self):
+        self.declare_queue(self.channel, arguments={'x-max-length': 10})
+        self.server.reset()
+
+    def when_I_declare_the_queue_with_other_arguments(self):
+        self.declare_queue(self.channel, arguments={'x-max-length': 20})
+
+    def it_should_ask_the_broker(self):
+        expected_method = spec.QueueDeclare(0, 'my.queue', False, True, False, False, False, {'x-max-length': 20})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+
+class WhenIDeclareAnAutoDeleteQueueTwice(DeclarationCacheContext):
+    def given_I_declared_an_auto_delete_queue(self):
+        self.declare_queue(self.channel, auto_delete=True)
+        self.server.reset()
+
+    def when_I_declare_the_same_thing_again(self):
+        self.declare_queue(self.channel, auto_delete=True)
+
+    def it_should_ask_the_broker(self):
+        expected_method = spec.QueueDeclare(0, 'my.queue', False, True, False, True, False, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+
+class WhenIDeclareAQueueAfterDeletingIt(DeclarationCacheContext):
+    def given_I_deleted_a_declared_queue(self):
+        queue = self.declare_queue(self.channel)
+        asyncio.async(queue.delete(), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.QueueDeleteOK(0))
+        self.server.reset()
+
+    def when_I_declare_the_same_thing_again(self):
+        self.result = self.declare_queue(self.channel)
+
+    def it_should_ask_the_broker(self):
+        expected_method = spec.QueueDeclare(0, 'my.queue', False, True, False, False, False, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+    def it_should_return_a_live_queue(self):
+        assert not self.result.deleted
+
+
+class WhenTheBrokerClosesAChannel(DeclarationCacheContext):
+    def given_a_declared_queue_and_another_channel(self):
+        self.declare_queue(self.channel)
+        self.other_channel = self.open_channel(2)
+
+    def when_the_broker_closes_the_first_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(406, "PRECONDITION_FAILED", 50, 10))
+        self.server.reset()
+        self.declare_queue(self.other_channel)
+
+    def it_should_forget_what_was_declared(self):
+        expected_method = spec.QueueDeclare(0, 'my.queue', False, True, False, False, False, {})
+        self.server.should_have_received_method(self.other_channel.id, expected_method)
+
+
+class WhenTheCacheIsNotEnabled(OpenChannelContext):
+    def given_I_declared_an_exchange(self):
+        asyncio.async(self.channel.declare_exchange('my.exchange', 'topic'), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.ExchangeDeclareOK())
+        self.server.reset()
+
+    def when_I_declare_the_same_thing_again(self):
+        self.async_partial(self.channel.declare_exchange('my.exchange', 'topic'))
+
+    def it_should_ask_the_broker(self):
+        expected_method = spec.ExchangeDeclare(0, 'my.exchange', 'topic', False, True, False, False, False, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+
+class WhenIDeclareTheDefaultExchangeTwice(OpenChannelContext):
+    def when_I_declare_the_default_exchange_twice(self):
+        self.first = self.async_partial(self.channel.declare_exchange('', 'direct')).result()
+        self.second = self.async_partial(self.channel.declare_exchange('', 'direct')).result()
+
+    def it_should_return_the_same_object(self):
+        assert self.second is self.first
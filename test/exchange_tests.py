@@ -42,6 +42,19 @@ class WhenExchangeDeclareOKArrives(OpenChannelContext):
         assert not self.result.internal
 
 
+class WhenDeclaringAnExchangeWithoutWaiting(OpenChannelContext):
+    def when_I_declare_an_exchange(self):
+        self.task = asyncio.async(self.channel.declare_exchange('my.nice.exchange', 'fanout', nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_ExchangeDeclare_with_nowait(self):
+        expected_method = spec.ExchangeDeclare(0, 'my.nice.exchange', 'fanout', False, True, False, False, True, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+    def it_should_return_the_exchange_straight_away(self):
+        assert self.task.result().name == 'my.nice.exchange'
+
+
 # "The server MUST pre-declare a direct exchange with no public name
 # to act as the default exchange for content Publish methods and for default queue bindings."
 # Clients are not allowed to re-declare the default exchange, but they are allowed to publish to it
@@ -174,3 +187,114 @@ class WhenExchangeDeleteOKArrives(ExchangeContext):
 
     def it_should_not_throw(self):
         pass
+
+
+class WhenDeletingAnExchangeWithoutWaiting(ExchangeContext):
+    def when_I_delete_the_exchange(self):
+        self.task = asyncio.async(self.exchange.delete(if_unused=True, nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_ExchangeDelete_with_nowait(self):
+        self.server.should_have_received_method(self.channel.id, spec.ExchangeDelete(0, self.exchange.name, True, True))
+
+    def it_should_return_straight_away(self):
+        assert self.task.done()
+
+
+class ConfirmingExchangeContext(ExchangeContext):
+    def given_the_channel_is_in_confirm_mode(self):
+        task = asyncio.async(self.channel.enable_confirms())
+        self.tick()
+        self.server.send_method(self.channel.id, spec.ConfirmSelectOK())
+        task.result()
+
+    def publish_some_messages(self, count):
+        return [self.exchange.publish(asynqp.Message('body'), 'routing.key') for _ in range(count)]
+
+
+class WhenIPublishBeforeConfirmSelectOKArrives(ExchangeContext):
+    def given_I_am_enabling_confirms(self):
+        self.task = asyncio.async(self.channel.enable_confirms())
+        self.tick()
+
+    def when_I_publish_and_the_broker_confirms_the_message(self):
+        self.fut = self.exchange.publish(asynqp.Message('body'), 'routing.key')
+        self.server.send_method(self.channel.id, spec.ConfirmSelectOK())
+        self.server.send_method(self.channel.id, spec.BasicAck(1, False))
+
+    def it_should_return_a_future_for_the_message(self):
+        assert self.fut.done() and self.fut.result() is True
+
+    def it_should_finish_enabling_confirms(self):
+        assert self.task.done()
+
+
+class WhenPublishingWithoutConfirms(ExchangeContext):
+    def when_I_publish_a_message(self):
+        self.result = self.exchange.publish(asynqp.Message('body'), 'routing.key')
+
+    def it_should_not_return_a_future(self):
+        assert self.result is None
+
+
+class WhenPublishingInConfirmMode(ConfirmingExchangeContext):
+    def when_I_publish_a_message(self):
+        self.result = self.exchange.publish(asynqp.Message('body'), 'routing.key')
+
+    def it_should_return_an_unresolved_future(self):
+        assert isinstance(self.result, asyncio.Future) and not self.result.done()
+
+
+class WhenTheBrokerAcksSeveralMessagesAtOnce(ConfirmingExchangeContext):
+    def given_some_published_messages(self):
+        self.futures = self.publish_some_messages(3)
+
+    def when_a_multiple_ack_arrives(self):
+        self.server.send_method(self.channel.id, spec.BasicAck(2, True))
+
+    def it_should_resolve_the_covered_futures(self):
+        assert self.futures[0].result() is True
+        assert self.futures[1].result() is True
+
+    def it_should_not_resolve_the_later_future(self):
+        assert not self.futures[2].done()
+
+
+class WhenTheBrokerNacksAMessage(ConfirmingExchangeContext):
+    def given_some_published_messages(self):
+        self.futures = self.publish_some_messages(2)
+
+    def when_a_nack_arrives(self):
+        self.server.send_method(self.channel.id, spec.BasicNack(2, False, False))
+
+    def it_should_resolve_the_future_with_False(self):
+        assert self.futures[1].result() is False
+
+    def it_should_not_resolve_the_other_future(self):
+        assert not self.futures[0].done()
+
+
+class WhenWaitingForConfirms(ConfirmingExchangeContext):
+    def given_some_published_messages(self):
+        self.publish_some_messages(2)
+        self.task = asyncio.async(self.channel.wait_for_confirms())
+        self.tick()
+
+    def when_the_broker_confirms_them(self):
+        self.server.send_method(self.channel.id, spec.BasicAck(1, False))
+        self.server.send_method(self.channel.id, spec.BasicNack(2, False, True))
+        self.tick()
+
+    def it_should_report_that_a_message_was_nacked(self):
+        assert self.task.result() is False
+
+
+class WhenTheChannelIsClosedWithUnconfirmedMessages(ConfirmingExchangeContext):
+    def given_a_published_message(self):
+        [self.future] = self.publish_some_messages(1)
+
+    def when_the_server_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(123, 'i am tired of you', 40, 50))
+
+    def it_should_fail_the_future(self):
+        assert isinstance(self.future.exception(), ConnectionError)
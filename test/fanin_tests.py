@@ -0,0 +1,133 @@
+import asyncio
+import contexts
+import asynqp
+from asynqp import spec, frames
+from asynqp import message
+from .base_contexts import QueueContext
+
+
+class FanInContext(QueueContext):
+    def given_a_fan_in_over_two_queues(self):
+        self.fan_in = asynqp.FanIn(loop=self.loop)
+        self.high_queue = self.queue
+        self.low_queue = self.declare_another_queue('my.other.queue')
+
+        self.high_consumer = self.add_queue(self.high_queue, 3, 'high.tag')
+        self.low_consumer = self.add_queue(self.low_queue, 1, 'low.tag')
+
+    def declare_another_queue(self, name):
+        task = asyncio.async(self.channel.declare_queue(name), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK(name, 0, 0))
+        return task.result()
+
+    def add_queue(self, queue, weight, tag):
+        task = asyncio.async(self.fan_in.add_queue(queue, weight), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicConsumeOK(tag))
+        return task.result()
+
+    def deliver(self, consumer_tag, body, delivery_tag=1):
+        msg = asynqp.Message(body)
+        self.server.send_method(self.channel.id, spec.BasicDeliver(consumer_tag, delivery_tag, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        self.server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        body = message.get_frame_payloads(msg, 100)[0]
+        self.server.send_frame(frames.ContentBodyFrame(self.channel.id, body))
+        self.tick()
+
+    def get_all(self, count):
+        bodies = []
+        for _ in range(count):
+            task = asyncio.async(self.fan_in.get(), loop=self.loop)
+            self.tick()
+            bodies.append(task.result().body)
+        return bodies
+
+
+class WhenAddingAQueueToAFanIn(FanInContext):
+    def it_should_send_BasicConsume(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicConsume(0, self.low_queue.name, '', False, False, False, False, {}))
+
+    def it_should_keep_the_consumers(self):
+        assert self.fan_in.consumers == [self.high_consumer, self.low_consumer]
+
+
+class WhenBothQueuesHaveMessagesWaiting(FanInContext):
+    def given_a_backlog_on_both_queues(self):
+        for i in range(8):
+            self.deliver('high.tag', 'high', i)
+            self.deliver('low.tag', 'low', i)
+
+    def when_I_get_eight_messages(self):
+        self.bodies = self.get_all(8)
+
+    def it_should_share_them_out_according_to_the_weights(self):
+        assert self.bodies.count(b'high') == 6
+        assert self.bodies.count(b'low') == 2
+
+    def it_should_interleave_the_queues(self):
+        assert self.bodies[:4].count(b'low') == 1
+
+
+class WhenOnlyTheLowPriorityQueueHasMessages(FanInContext):
+    def given_a_backlog_on_the_low_queue(self):
+        for i in range(3):
+            self.deliver('low.tag', 'low', i)
+
+    def when_I_get_the_messages(self):
+        self.bodies = self.get_all(3)
+
+    def it_should_not_starve_it(self):
+        assert self.bodies == [b'low', b'low', b'low']
+
+
+class WhenAMessageArrivesWhileIAmWaiting(FanInContext):
+    def given_I_am_waiting_for_a_message(self):
+        self.task = asyncio.async(self.fan_in.get(), loop=self.loop)
+        self.tick()
+
+    def when_a_message_arrives(self):
+        self.deliver('low.tag', 'low')
+        self.tick()
+
+    def it_should_return_the_message(self):
+        assert self.task.result().body == b'low'
+
+
+class WhenTheFanInIsCancelled(FanInContext):
+    def given_a_buffered_message(self):
+        self.deliver('high.tag', 'high')
+
+    def when_I_cancel_the_fan_in(self):
+        self.task = asyncio.async(self.fan_in.cancel(), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicCancelOK('high.tag'))
+        self.server.send_method(self.channel.id, spec.BasicCancelOK('low.tag'))
+        self.get_the_remaining_messages()
+
+    def it_should_cancel_the_consumers(self):
+        assert self.high_consumer.cancelled
+        assert self.low_consumer.cancelled
+
+    def it_should_still_hand_out_the_buffered_message(self):
+        assert self.first.result().body == b'high'
+
+    def it_should_return_None_once_drained(self):
+        assert self.second.result() is None
+
+    def get_the_remaining_messages(self):
+        self.first = asyncio.async(self.fan_in.get(), loop=self.loop)
+        self.second = asyncio.async(self.fan_in.get(), loop=self.loop)
+        self.tick()
+
+
+class WhenIUseANonPositiveWeight(QueueContext):
+    def when_I_add_the_queue(self):
+        fan_in = asynqp.FanIn(loop=self.loop)
+        task = asyncio.async(fan_in.add_queue(self.queue, 0), loop=self.loop)
+        self.tick()
+        self.exception = contexts.catch(task.result)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
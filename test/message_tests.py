@@ -1,5 +1,6 @@
 import asyncio
 import json
+import pickle
 import uuid
 from datetime import datetime
 import asynqp
@@ -220,3 +221,23 @@ class WhenSettingAnAttributeThatIsNotAProperty:
 
     def it_should_not_attempt_to_cast_it(self):
         assert self.msg.foo == 123
+
+
+class WhenIPickleADetachedMessage:
+    def given_a_detached_message(self):
+        self.msg = asynqp.message.DetachedMessage('body', headers={'x': 1}, correlation_id='abc', timestamp=datetime(2014, 5, 5),
+                                                  delivery_tag=5, exchange_name='my.exchange', routing_key='routing.key')
+        self.msg.nack(requeue=False)
+
+    def when_I_pickle_and_unpickle_the_message(self):
+        self.result = pickle.loads(pickle.dumps(self.msg))
+
+    def it_should_have_the_same_body_and_properties(self):
+        assert self.result == self.msg
+
+    def it_should_remember_where_the_message_came_from(self):
+        assert self.result.delivery_tag == 5
+        assert self.result.routing_key == 'routing.key'
+
+    def it_should_remember_the_outcome(self):
+        assert self.result.outcome == ('nack', False)
@@ -0,0 +1,171 @@
+import asyncio
+import contexts
+import asynqp
+from asynqp import frames
+from asynqp import message
+from asynqp import spec
+from asynqp.metrics import Histogram, InMemoryMetrics
+from .base_contexts import OpenChannelContext, QueueContext
+
+
+class MetricsContext(OpenChannelContext):
+    def given_a_collector(self):
+        self.metrics = InMemoryMetrics()
+        self.connection.set_metrics(self.metrics)
+
+
+class DeliveryContext(QueueContext, MetricsContext):
+    def deliver(self, delivery_tag):
+        msg = asynqp.Message('body')
+        self.server.send_method(self.channel.id, spec.BasicDeliver('made.up.tag', delivery_tag, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        self.server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        self.server.send_frame(frames.ContentBodyFrame(self.channel.id, message.get_frame_payloads(msg, 100)[0]))
+        self.tick()
+
+    def start_consumer(self, callback):
+        task = asyncio.async(self.queue.consume(callback), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicConsumeOK('made.up.tag'))
+        self.consumer = task.result()
+
+
+class WhenFramesGoBackAndForth(MetricsContext):
+    def when_a_frame_is_received_and_one_is_sent(self):
+        self.received = frames.MethodFrame(self.channel.id, spec.BasicQosOK()).serialise()
+        task = asyncio.async(self.channel.set_qos(prefetch_count=10), loop=self.loop)
+        self.tick()
+        self.protocol.data_received(self.received)
+        self.tick()
+        task.result()
+        self.sent = frames.MethodFrame(self.channel.id, spec.BasicQos(0, 10, False)).serialise()
+
+    def it_should_count_the_frame_received_on_the_channel(self):
+        assert self.metrics.count('frames_in', self.channel.id) == 1
+        assert self.metrics.count('bytes_in', self.channel.id) == len(self.received)
+
+    def it_should_count_the_frame_sent_on_the_channel(self):
+        assert self.metrics.count('frames_out', self.channel.id) == 1
+        assert self.metrics.count('bytes_out', self.channel.id) == len(self.sent)
+
+    def it_should_time_the_parsing(self):
+        assert self.metrics.histogram('parse_time').count == 1
+
+    def it_should_record_the_write_buffer(self):
+        assert self.metrics.histogram('write_buffer').max == 0
+
+    def it_should_time_the_wait_for_the_reply(self):
+        assert self.metrics.histogram('reply_time', 'BasicQosOK').count == 1
+
+
+class WhenAMessageIsDeliveredAndAcked(DeliveryContext):
+    def given_a_consumer_which_acks(self):
+        self.start_consumer(lambda msg: msg.ack())
+
+    def when_a_message_arrives(self):
+        self.deliver(1)
+        self.tick()
+
+    def it_should_count_the_delivery_and_the_ack(self):
+        assert self.metrics.count('delivered', self.channel.id) == 1
+        assert self.metrics.count('acked', self.channel.id) == 1
+
+    def it_should_time_the_message_from_delivery_to_ack(self):
+        assert self.metrics.histogram('ack_latency', self.channel.id).count == 1
+
+    def it_should_time_the_callback(self):
+        assert self.metrics.histogram('callback_time', 'made.up.tag').count == 1
+
+
+class WhenACoroutineCallbackRejectsAMessage(DeliveryContext):
+    def given_a_coroutine_consumer(self):
+        @asyncio.coroutine
+        def callback(msg):
+            msg.reject()
+        self.start_consumer(callback)
+
+    def when_a_message_arrives(self):
+        self.deliver(1)
+        self.tick()
+        self.tick()
+
+    def it_should_count_the_rejection(self):
+        assert self.metrics.count('rejected', self.channel.id) == 1
+        assert self.metrics.count('acked') == 0
+
+    def it_should_time_the_callback(self):
+        assert self.metrics.histogram('callback_time', 'made.up.tag').count == 1
+
+
+class WhenAChannelIsOpenedAfterTheCollectorWasAttached(MetricsContext):
+    def when_I_open_another_channel(self):
+        self.other = self.open_channel(2)
+
+    def it_should_time_the_wait_for_it_to_open(self):
+        assert self.metrics.histogram('reply_time', 'ChannelOpenOK').count == 1
+
+    def it_should_measure_the_new_channel(self):
+        assert self.other.acker.metrics is self.metrics
+
+
+class WhenTheCollectorIsDetached(MetricsContext):
+    def given_the_collector_was_detached(self):
+        self.connection.set_metrics(None)
+
+    def when_a_method_is_sent_and_answered(self):
+        task = asyncio.async(self.channel.set_qos(prefetch_count=10), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicQosOK())
+        task.result()
+
+    def it_should_not_measure_anything(self):
+        assert not self.metrics.counters
+        assert not self.metrics.histograms
+
+
+class WhenRecordingValuesInAHistogram:
+    def given_a_histogram(self):
+        self.histogram = Histogram()
+
+    def when_I_record_some_values(self):
+        for value in range(1, 1001):
+            self.histogram.record(value / 1000)
+        self.histogram.record(0)
+
+    def it_should_keep_the_summary_statistics(self):
+        assert self.histogram.count == 1001
+        assert self.histogram.min == 0
+        assert self.histogram.max == 1
+        assert abs(self.histogram.mean - 0.5) < 1e-9
+
+    def it_should_report_percentiles_to_within_one_percent(self):
+        for percent, expected in [(50, 0.5), (99, 0.99), (99.9, 0.999)]:
+            assert abs(self.histogram.percentile(percent) - expected) <= expected / 100
+
+    def it_should_report_the_extremes_exactly(self):
+        assert self.histogram.percentile(0) == 0
+        assert self.histogram.percentile(100) == 1
+
+
+class WhenMergingHistograms:
+    def given_two_histograms(self):
+        self.histogram = Histogram()
+        self.histogram.record(1)
+        self.other = Histogram()
+        self.other.record(3, count=3)
+
+    def when_I_merge_them(self):
+        self.histogram.merge(self.other)
+
+    def it_should_combine_them(self):
+        assert self.histogram.count == 4
+        assert self.histogram.max == 3
+        assert self.histogram.mean == 2.5
+
+
+class WhenRecordingANegativeValue:
+    def when_I_record_a_negative_number(self):
+        self.exception = contexts.catch(Histogram().record, -1)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
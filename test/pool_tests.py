@@ -0,0 +1,357 @@
+import asyncio
+import contexts
+import asynqp
+from unittest import mock
+from asynqp import spec
+from .base_contexts import OpenConnectionContext, ManyBrokersContext
+from .util import publishes_received_by
+
+
+class ChannelPoolContext(OpenConnectionContext):
+    def given_a_channel_pool(self):
+        self.pool = self.connection.channel_pool(size=2)
+
+    def acquire(self, new_channel_id=None):
+        task = asyncio.async(self.pool.acquire(), loop=self.loop)
+        self.tick()
+        if new_channel_id is not None:
+            self.server.send_method(new_channel_id, spec.ChannelOpenOK(''))
+        return task
+
+
+class WhenICreateAChannelPool(ChannelPoolContext):
+    def it_should_not_open_any_channels(self):
+        self.server.should_not_have_received_method(1, spec.ChannelOpen(''))
+
+    def it_should_remember_its_size(self):
+        assert self.pool.size == 2
+
+
+class WhenIAcquireAChannelFromAnEmptyPool(ChannelPoolContext):
+    def when_I_acquire_a_channel(self):
+        self.task = self.acquire(1)
+
+    def it_should_open_a_channel(self):
+        self.server.should_have_received_method(1, spec.ChannelOpen(''))
+
+    def it_should_return_the_channel(self):
+        assert self.task.result().id == 1
+
+
+class WhenIAcquireAReleasedChannel(ChannelPoolContext):
+    def given_I_released_a_channel(self):
+        self.first = self.acquire(1).result()
+        self.pool.release(self.first)
+        self.server.reset()
+
+    def when_I_acquire_a_channel(self):
+        self.second = self.acquire().result()
+
+    def it_should_reuse_the_channel(self):
+        assert self.second is self.first
+
+    def it_should_not_open_another_channel(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenThePoolIsExhausted(ChannelPoolContext):
+    def given_every_channel_is_checked_out(self):
+        self.first = self.acquire(1).result()
+        self.second = self.acquire(2).result()
+
+    def when_another_task_asks_for_a_channel(self):
+        self.task = self.acquire()
+
+    def it_should_wait(self):
+        assert not self.task.done()
+
+
+class WhenAChannelIsReleasedWhileATaskIsWaiting(ChannelPoolContext):
+    def given_a_task_waiting_for_a_channel(self):
+        self.first = self.acquire(1).result()
+        self.second = self.acquire(2).result()
+        self.task = self.acquire()
+
+    def when_a_channel_is_released(self):
+        self.pool.release(self.second)
+        self.tick()
+
+    def it_should_give_the_channel_to_the_waiting_task(self):
+        assert self.task.result() is self.second
+
+
+class WhenAWokenTaskIsCancelledBeforeItTakesTheChannel(ChannelPoolContext):
+    def given_two_tasks_waiting_for_a_channel(self):
+        self.first = self.acquire(1).result()
+        self.second = self.acquire(2).result()
+        self.cancelled = self.acquire()
+        self.waiting = self.acquire()
+
+    def when_a_channel_is_released_and_the_woken_task_is_cancelled(self):
+        self.pool.release(self.second)
+        self.cancelled.cancel()
+        self.tick()
+        self.tick()
+
+    def it_should_give_the_channel_to_the_other_task(self):
+        assert self.waiting.result() is self.second
+
+
+class WhenTheBrokerClosesAPooledChannel(ChannelPoolContext):
+    def given_a_channel_which_the_broker_closed(self):
+        self.broken = self.acquire(1).result()
+        self.server.send_method(1, spec.ChannelClose(406, "PRECONDITION_FAILED", 50, 10))
+
+    def when_I_swap_the_broken_channel_for_another(self):
+        self.pool.release(self.broken)
+        self.task = self.acquire(1)
+
+    def it_should_open_a_new_channel(self):
+        assert self.task.result() is not self.broken
+
+    def it_should_mark_the_old_channel_closed(self):
+        assert self.broken.closed.done()
+
+
+class WhenICheckOutAChannelWithAWithStatement(ChannelPoolContext):
+    def given_a_channel_in_the_pool(self):
+        self.pool.release(self.acquire(1).result())
+
+    def when_I_use_a_with_statement(self):
+        self.task = asyncio.async(self.use_a_channel(), loop=self.loop)
+        self.tick()
+
+    def it_should_give_me_the_channel(self):
+        assert self.task.result().id == 1
+
+    def it_should_put_the_channel_back_afterwards(self):
+        assert self.acquire().result() is self.task.result()
+
+    @asyncio.coroutine
+    def use_a_channel(self):
+        with (yield from self.pool) as channel:
+            return channel
+
+
+class WhenICloseAChannelPool(ChannelPoolContext):
+    def given_an_idle_channel(self):
+        self.pool.release(self.acquire(1).result())
+        self.server.reset()
+
+    def when_I_close_the_pool(self):
+        self.async_partial(self.pool.close())
+
+    def it_should_close_the_idle_channel(self):
+        self.server.should_have_received_method(1, spec.ChannelClose(0, 'Channel closed by application', 0, 0))
+
+    def it_should_not_hand_out_any_more_channels(self):
+        assert isinstance(self.acquire().exception(), RuntimeError)
+
+
+class WhenIMakeAPoolWithNoChannels(OpenConnectionContext):
+    def when_I_make_the_pool(self):
+        self.exception = contexts.catch(asynqp.ChannelPool, self.connection, 0, loop=self.loop)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+
+
+class ConnectionPoolContext(ManyBrokersContext):
+    def given_two_brokers(self):
+        for host in ('node1', 'node2'):
+            self.start_broker(host)
+        self.patch = mock.patch('asynqp.connect', self.connect)
+        self.patch.start()
+
+    def cleanup_the_pool(self):
+        self.patch.stop()
+        if hasattr(self, 'pool'):
+            self.pool.closed = True
+
+    @asyncio.coroutine
+    def connect(self, host, port, **kwargs):
+        return self.connections[host]
+
+    def open_pool(self, **kwargs):
+        self.pool = asynqp.ConnectionPool(['node1', ('node2', 5673)], loop=self.loop, **kwargs)
+        task = asyncio.async(self.pool.open(), loop=self.loop)
+        self.tick()
+        for host in self.servers:
+            self.accept_channel(host)
+        self.tick()
+        task.result()
+
+    def accept_channel(self, host):
+        self.servers[host].send_method(1, spec.ChannelOpenOK(''))
+        self.servers[host].send_method(1, spec.ConfirmSelectOK())
+
+    def lose_connection(self, host):
+        contexts.catch(self.connections[host].protocol.connection_lost, None)
+        self.tick()
+
+    def publish(self, n=1):
+        for server in self.servers.values():
+            server.reset()
+        return [self.pool.publish(asynqp.Message('hello'), 'routing.key') for _ in range(n)]
+
+    def publishes_received_by(self, host):
+        return len(publishes_received_by(self.servers[host]))
+
+
+class WhenIPublishToAPoolRoundRobin(ConnectionPoolContext):
+    def given_an_open_pool(self):
+        self.open_pool()
+
+    def when_I_publish_four_messages(self):
+        self.futures = self.publish(4)
+
+    def it_should_send_half_of_them_to_each_node(self):
+        assert self.publishes_received_by('node1') == 2
+        assert self.publishes_received_by('node2') == 2
+
+    def it_should_return_futures_for_the_confirms(self):
+        assert all(isinstance(f, asyncio.Future) for f in self.futures)
+
+
+class WhenAPooledMessageIsConfirmed(ConnectionPoolContext):
+    def given_a_published_message(self):
+        self.open_pool()
+        self.future, = self.publish()
+
+    def when_the_broker_acks_the_message(self):
+        self.servers['node1'].send_method(1, spec.BasicAck(1, False))
+
+    def it_should_resolve_the_future(self):
+        assert self.future.result() is True
+
+    def it_should_measure_the_round_trip_time(self):
+        assert self.pool.nodes[0].rtt is not None
+
+
+class WhenIPublishToThePoolWithTheFewestUnconfirmed(ConnectionPoolContext):
+    def given_node2_has_confirmed_its_message(self):
+        self.open_pool(strategy='least_unconfirmed')
+        self.publish(2)
+        self.servers['node2'].send_method(1, spec.BasicAck(1, False))
+
+    def when_I_publish_another_message(self):
+        self.publish()
+
+    def it_should_go_to_node2(self):
+        assert self.publishes_received_by('node2') == 1
+
+
+class WhenIPublishToThePoolWithTheFewestBytesOutstanding(ConnectionPoolContext):
+    def given_node1_has_a_full_write_buffer(self):
+        self.open_pool(strategy='least_bytes')
+        self.connections['node1'].transport.buffer_size = 100
+
+    def when_I_publish_a_message(self):
+        self.publish()
+
+    def it_should_go_to_node2(self):
+        assert self.publishes_received_by('node2') == 1
+
+
+class WhenAPooledConnectionIsLost(ConnectionPoolContext):
+    def given_node1_went_away(self):
+        self.open_pool()
+        self.lose_connection('node1')
+
+    def when_I_publish_two_messages(self):
+        self.publish(2)
+
+    def it_should_send_them_both_to_node2(self):
+        assert self.publishes_received_by('node2') == 2
+
+
+class WhenALostNodeComesBack(ConnectionPoolContext):
+    def given_node1_can_be_reached_on_a_new_connection(self):
+        self.open_pool(retry_interval=0)
+        self.old_connection = self.connections['node1']
+        self.start_broker('node1')
+
+    def when_node1_goes_away(self):
+        contexts.catch(self.old_connection.protocol.connection_lost, None)
+        self.tick()
+        self.tick()
+        self.accept_channel('node1')
+
+    def it_should_reconnect(self):
+        assert self.pool.nodes[0].connection is self.connections['node1']
+
+    def it_should_put_node1_back_in_rotation(self):
+        assert self.pool.nodes[0] in self.pool.healthy_nodes()
+
+
+class WhenNoneOfThePoolsNodesCanBeReached(ManyBrokersContext):
+    def given_brokers_which_refuse_connections(self):
+        self.attempts = []
+        self.patch = mock.patch('asynqp.connect', self.connect)
+        self.patch.start()
+
+    @asyncio.coroutine
+    def connect(self, host, port, **kwargs):
+        self.attempts.append(host)
+        raise ConnectionRefusedError()
+
+    def when_I_connect_a_pool_and_wait(self):
+        task = asyncio.async(asynqp.connect_pool(['node1', 'node2'], retry_interval=0.01, loop=self.loop), loop=self.loop)
+        self.tick()
+        self.tick()
+        self.exception = task.exception()
+        self.loop.run_until_complete(asyncio.sleep(0.05, loop=self.loop))  # several retry intervals
+
+    def it_should_throw_the_error(self):
+        assert isinstance(self.exception, ConnectionRefusedError)
+
+    def it_should_not_try_to_reconnect(self):
+        assert self.attempts == ['node1', 'node2']
+
+    def cleanup_the_patch(self):
+        self.patch.stop()
+
+
+class WhenAPooledNodeIsSlow(ConnectionPoolContext):
+    def given_node1_takes_a_long_time_to_confirm(self):
+        self.open_pool(max_rtt=0.5)
+        self.pool.nodes[0].rtt = 2
+
+    def when_I_publish_two_messages(self):
+        self.publish(2)
+
+    def it_should_send_them_both_to_node2(self):
+        assert self.publishes_received_by('node2') == 2
+
+
+class WhenAPooledNodeMissesItsHeartbeats(ConnectionPoolContext):
+    def given_node1_has_been_quiet(self):
+        self.open_pool()
+        self.connections['node1'].protocol.heartbeat_monitor.last_received -= 1000
+
+    def when_I_publish_two_messages(self):
+        self.publish(2)
+
+    def it_should_send_them_both_to_node2(self):
+        assert self.publishes_received_by('node2') == 2
+
+
+class WhenNoPooledNodesAreAvailable(ConnectionPoolContext):
+    def given_both_nodes_went_away(self):
+        self.open_pool()
+        for host in self.servers:
+            self.lose_connection(host)
+
+    def when_I_publish_a_message(self):
+        self.exception = contexts.catch(self.pool.publish, asynqp.Message('hello'), 'routing.key')
+
+    def it_should_throw_ConnectionError(self):
+        assert isinstance(self.exception, ConnectionError)
+
+
+class WhenIMakeAConnectionPoolWithAnUnknownStrategy:
+    def when_I_make_the_pool(self):
+        self.exception = contexts.catch(asynqp.ConnectionPool, ['node1'], strategy='random')
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
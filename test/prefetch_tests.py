@@ -0,0 +1,115 @@
+import asyncio
+import contexts
+from unittest import mock
+from asynqp import spec
+from asynqp.prefetch import PrefetchTuner
+from .base_contexts import OpenChannelContext
+
+
+class TunerContext(OpenChannelContext):
+    def given_a_tuner(self):
+        self.tuner = PrefetchTuner(self.channel, min_count=1, max_count=100, interval=1, loop=self.loop)
+        self.channel.acker.tuner = self.tuner
+        self.tuner.prefetch_count = self.tuner.applied = 10
+        self.server.reset()
+
+    def settle_messages(self, count, latency):
+        for tag in range(1, count + 1):
+            with mock.patch.object(self.loop, 'time', return_value=0):
+                self.channel.acker.delivered(tag)
+            with mock.patch.object(self.loop, 'time', return_value=latency):
+                self.channel.acker.ack(tag)
+
+    def adjust(self):
+        task = asyncio.async(self.tuner.adjust(), loop=self.loop)
+        self.tick()
+        if not task.done():
+            self.server.send_method(self.channel.id, spec.BasicQosOK())
+        task.result()
+
+
+class WhenTheConsumersAreStarvedOfMessages(TunerContext):
+    def given_slow_messages_were_handled_as_fast_as_they_arrived(self):
+        self.settle_messages(100, 0.2)
+
+    def when_the_tuner_adjusts(self):
+        self.adjust()
+
+    def it_should_measure_the_throughput(self):
+        assert self.tuner.throughput == 100
+
+    def it_should_measure_the_latency(self):
+        assert self.tuner.latency == 0.2
+
+    def it_should_raise_the_prefetch_count_for_the_whole_channel(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicQos(0, 30, True))
+        assert self.tuner.prefetch_count == 30
+
+
+class WhenMessagesAreWaitingInTheClient(TunerContext):
+    def given_a_high_prefetch_count(self):
+        self.tuner.prefetch_count = self.tuner.applied = 50
+        self.settle_messages(10, 0.01)
+
+    def when_the_tuner_adjusts(self):
+        self.adjust()
+
+    def it_should_halve_the_prefetch_count(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicQos(0, 25, True))
+
+
+class WhenTheTargetIsAboveTheMaximum(TunerContext):
+    def given_lots_of_slow_messages(self):
+        self.settle_messages(1000, 1)
+
+    def when_the_tuner_adjusts(self):
+        self.adjust()
+
+    def it_should_stop_at_the_maximum(self):
+        assert self.tuner.prefetch_count == 100
+
+
+class WhenNothingWasSettled(TunerContext):
+    def when_the_tuner_adjusts(self):
+        self.adjust()
+
+    def it_should_leave_the_prefetch_count_alone(self):
+        self.server.should_not_have_received_any()
+
+
+class WhenIStartTuningTheChannel(OpenChannelContext):
+    def when_I_start_tuning(self):
+        self.tuner = self.channel.autotune_prefetch(min_count=5, max_count=50)
+        self.tick()
+
+    def it_should_set_the_minimum_prefetch_count(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicQos(0, 5, True))
+
+    def it_should_watch_the_channel(self):
+        assert self.channel.acker.tuner is self.tuner
+
+    def cleanup_the_tuner(self):
+        self.tuner.stop()
+
+
+class WhenATunedChannelIsClosed(OpenChannelContext):
+    def given_a_tuned_channel(self):
+        self.tuner = self.channel.autotune_prefetch()
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicQosOK())
+
+    def when_the_broker_closes_the_channel(self):
+        self.server.send_method(self.channel.id, spec.ChannelClose(406, "PRECONDITION_FAILED", 60, 10))
+        self.tick()
+
+    def it_should_stop_tuning(self):
+        assert self.tuner.task.done()
+        assert self.channel.acker.tuner is None
+
+
+class WhenTheBoundsAreInvalid(OpenChannelContext):
+    def when_I_give_a_maximum_below_the_minimum(self):
+        self.exception = contexts.catch(self.channel.autotune_prefetch, min_count=10, max_count=5)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
@@ -0,0 +1,146 @@
+import asyncio
+import contexts
+import asynqp
+from unittest import mock
+from asynqp import spec
+from .base_contexts import ManyBrokersContext
+from .util import publishes_received_by
+
+
+class ShardedPublisherContext(ManyBrokersContext):
+    def given_three_connections_to_the_broker(self):
+        for shard in range(3):
+            self.start_broker(shard)
+        self.unused = list(range(3))
+        self.patch = mock.patch('asynqp.connect', self.connect)
+        self.patch.start()
+
+    def cleanup_the_patch(self):
+        self.patch.stop()
+
+    @asyncio.coroutine
+    def connect(self, *args, **kwargs):
+        return self.connections[self.unused.pop(0)]
+
+    def open_publisher(self, **kwargs):
+        task = asyncio.async(asynqp.connect_sharded(shards=3, loop=self.loop, **kwargs), loop=self.loop)
+        self.tick()
+        for server in self.servers.values():
+            server.send_method(1, spec.ChannelOpenOK(''))
+            if kwargs.get('confirms'):
+                server.send_method(1, spec.ConfirmSelectOK())
+        self.tick()
+        self.publisher = task.result()
+        for server in self.servers.values():
+            server.reset()
+
+    def routing_keys_received_by(self, shard):
+        return [f.payload.routing_key for f in publishes_received_by(self.servers[shard])]
+
+
+class WhenIPublishWithTheSameRoutingKey(ShardedPublisherContext):
+    def given_a_sharded_publisher(self):
+        self.open_publisher()
+
+    def when_I_publish_several_messages_with_each_key(self):
+        for i in range(5):
+            for key in ('a', 'b', 'c', 'd'):
+                self.publisher.publish(asynqp.Message(str(i)), key)
+
+    def it_should_send_all_the_messages_for_a_key_down_one_connection(self):
+        for key in ('a', 'b', 'c', 'd'):
+            shards = [s for s in self.servers if key in self.routing_keys_received_by(s)]
+            assert len(shards) == 1
+            assert self.routing_keys_received_by(shards[0]).count(key) == 5
+
+    def it_should_count_the_messages(self):
+        assert self.publisher.published == 20
+        assert self.publisher.published_bytes == 20
+
+
+class WhenIPublishToAShardedPublisherRoundRobin(ShardedPublisherContext):
+    def given_a_round_robin_publisher(self):
+        self.open_publisher(strategy='round_robin')
+
+    def when_I_publish_six_messages(self):
+        for _ in range(6):
+            self.publisher.publish(asynqp.Message('hello'), 'same.key')
+
+    def it_should_send_two_down_each_connection(self):
+        for shard in self.servers:
+            assert len(self.routing_keys_received_by(shard)) == 2
+
+
+class WhenIPublishWithAnExplicitShardingKey(ShardedPublisherContext):
+    def given_a_sharded_publisher(self):
+        self.open_publisher()
+
+    def when_I_publish_with_different_routing_keys_but_one_key(self):
+        for routing_key in ('w', 'x', 'y', 'z'):
+            self.publisher.publish(asynqp.Message('hello'), routing_key, key='order-1')
+
+    def it_should_keep_them_on_one_connection(self):
+        assert sorted(len(self.routing_keys_received_by(s)) for s in self.servers) == [0, 0, 4]
+
+
+class WhenAShardedPublisherHasConfirmsEnabled(ShardedPublisherContext):
+    def given_a_publisher_with_confirms(self):
+        self.open_publisher(confirms=True, strategy='round_robin')
+
+    def when_I_publish_a_message(self):
+        self.future = self.publisher.publish(asynqp.Message('hello'), 'routing.key', exchange='my.exchange')
+
+    def it_should_return_a_future(self):
+        assert isinstance(self.future, asyncio.Future)
+
+    def it_should_publish_to_the_exchange(self):
+        assert publishes_received_by(self.servers[0])[0].payload.exchange == 'my.exchange'
+
+
+class WhenAShardsTransportIsFull(ShardedPublisherContext):
+    def given_a_shard_whose_transport_asked_us_to_stop_writing(self):
+        self.open_publisher()
+        self.connections[1].transport.buffer_size = 1000
+        self.connections[1].protocol.pause_writing()
+
+    def when_I_wait_for_the_buffers_to_drain(self):
+        self.task = asyncio.async(self.publisher.drain(), loop=self.loop)
+        self.tick()
+
+    def it_should_report_backpressure(self):
+        assert self.publisher.paused
+        assert self.publisher.buffered_bytes == 1000
+
+    def it_should_wait(self):
+        assert not self.task.done()
+
+
+class WhenAShardsTransportDrains(ShardedPublisherContext):
+    def given_someone_waiting_for_a_full_transport(self):
+        self.open_publisher()
+        self.connections[1].protocol.pause_writing()
+        self.task = asyncio.async(self.publisher.drain(), loop=self.loop)
+        self.tick()
+
+    def when_the_transport_drains(self):
+        self.connections[1].protocol.resume_writing()
+        self.tick()
+
+    def it_should_stop_waiting(self):
+        assert self.task.done()
+
+    def it_should_not_report_backpressure(self):
+        assert not self.publisher.paused
+
+
+class WhenIAskForAnUnknownShardingStrategy(ShardedPublisherContext):
+    def when_I_connect(self):
+        task = asyncio.async(asynqp.connect_sharded(strategy='random', loop=self.loop), loop=self.loop)
+        self.tick()
+        self.exception = contexts.catch(task.result)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
+
+    def it_should_not_connect(self):
+        assert len(self.unused) == 3
@@ -1,4 +1,5 @@
 import asyncio
+from unittest import mock
 from datetime import datetime
 import asynqp
 from asynqp import message
@@ -55,6 +56,37 @@ class WhenILetTheServerPickTheQueueName(OpenChannelContext):
         assert self.result.name == self.queue_name
 
 
+class WhenDeclaringAQueueWithArguments(OpenChannelContext):
+    def when_I_declare_a_queue(self):
+        self.async_partial(self.channel.declare_queue('my.nice.queue', arguments={'x-max-length': 10, 'x-dead-letter-exchange': 'dlx'}))
+
+    def it_should_send_the_arguments(self):
+        expected_method = spec.QueueDeclare(0, 'my.nice.queue', False, True, False, False, False, {'x-max-length': 10, 'x-dead-letter-exchange': 'dlx'})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+
+class WhenIDeclareAQueueWithoutWaiting(OpenChannelContext):
+    def when_I_declare_a_queue(self):
+        self.task = asyncio.async(self.channel.declare_queue('my.nice.queue', nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_QueueDeclare_with_nowait(self):
+        expected_method = spec.QueueDeclare(0, 'my.nice.queue', False, True, False, False, True, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+    def it_should_return_the_queue_straight_away(self):
+        assert self.task.result().name == 'my.nice.queue'
+
+
+class WhenIDeclareAQueueWithoutWaitingOrAName(OpenChannelContext):
+    def when_I_declare_a_queue(self):
+        self.task = asyncio.async(self.channel.declare_queue('', nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.task.exception(), ValueError)
+
+
 class WhenIUseAnIllegalNameForAQueue(OpenChannelContext):
     @classmethod
     def examples_of_bad_names(cls):
@@ -95,6 +127,19 @@ class WhenQueueBindOKArrives(QueueContext, ExchangeContext):
         assert self.binding.exchange is self.exchange
 
 
+class WhenBindingAQueueWithoutWaiting(QueueContext, ExchangeContext):
+    def when_I_bind_the_queue(self):
+        self.task = asyncio.async(self.queue.bind(self.exchange, 'routing.key', nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_QueueBind_with_nowait(self):
+        expected_method = spec.QueueBind(0, self.queue.name, self.exchange.name, 'routing.key', True, {})
+        self.server.should_have_received_method(self.channel.id, expected_method)
+
+    def it_should_return_the_binding_straight_away(self):
+        assert self.task.result().routing_key == 'routing.key'
+
+
 class WhenUnbindingAQueue(BoundQueueContext):
     def when_I_unbind_the_queue(self):
         self.async_partial(self.binding.unbind())
@@ -198,6 +243,39 @@ class WhenConsumeOKArrives(QueueContext):
         assert self.task.result().tag == 'made.up.tag'
 
 
+class WhenIStartAConsumerWithoutWaiting(QueueContext):
+    def when_I_start_a_consumer(self):
+        self.task = asyncio.async(self.queue.consume(lambda msg: None, nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_BasicConsume_with_a_tag_of_its_own(self):
+        tag = self.task.result().tag
+        self.server.should_have_received_method(self.channel.id, spec.BasicConsume(0, self.queue.name, tag, False, False, False, True, {}))
+
+    def it_should_generate_a_unique_tag(self):
+        assert self.task.result().tag.startswith('ctag.')
+
+
+class WhenAMessageArrivesForANoWaitConsumer(QueueContext):
+    def given_I_started_a_consumer_without_waiting(self):
+        self.callback = mock.Mock()
+        del self.callback._is_coroutine
+        self.task = asyncio.async(self.queue.consume(self.callback, nowait=True), loop=self.loop)
+        self.tick()
+
+    def when_a_message_arrives(self):
+        msg = asynqp.Message('body')
+        self.server.send_method(self.channel.id, spec.BasicDeliver(self.task.result().tag, 1, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        self.server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        body = message.get_frame_payloads(msg, 100)[0]
+        self.server.send_frame(frames.ContentBodyFrame(self.channel.id, body))
+        self.tick()
+
+    def it_should_send_the_message_to_the_callback(self):
+        assert self.callback.call_args[0][0].body == b'body'
+
+
 class WhenBasicDeliverArrives(ConsumerContext):
     def given_a_message(self):
         self.expected_message = asynqp.Message('body', timestamp=datetime(2014, 5, 5))
@@ -308,6 +386,18 @@ class WhenQueueDeleteOKArrives(QueueContext):
         assert self.queue.deleted
 
 
+class WhenIDeleteAQueueWithoutWaiting(QueueContext):
+    def when_I_delete_the_queue(self):
+        self.task = asyncio.async(self.queue.delete(if_unused=False, if_empty=False, nowait=True), loop=self.loop)
+        self.tick()
+
+    def it_should_send_QueueDelete_with_nowait(self):
+        self.server.should_have_received_method(self.channel.id, spec.QueueDelete(0, self.queue.name, False, False, True))
+
+    def it_should_be_deleted_straight_away(self):
+        assert self.queue.deleted
+
+
 class WhenITryToUseADeletedQueue(QueueContext):
     def given_a_deleted_queue(self):
         asyncio.async(self.queue.delete(if_unused=False, if_empty=False), loop=self.loop)
@@ -320,3 +410,64 @@ class WhenITryToUseADeletedQueue(QueueContext):
 
     def it_should_throw_Deleted(self):
         assert isinstance(self.task.exception(), asynqp.Deleted)
+
+
+def send_get_ok(context, delivery_tag, body):
+    msg = asynqp.Message(body)
+    context.server.send_method(context.channel.id, spec.BasicGetOK(delivery_tag, False, 'my.exchange', 'routing.key', 0))
+    header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+    context.server.send_frame(frames.ContentHeaderFrame(context.channel.id, header))
+    if body:
+        context.server.send_frame(frames.ContentBodyFrame(context.channel.id, message.get_frame_payloads(msg, 100)[0]))
+
+
+class WhenIGetSeveralMessagesAtOnce(QueueContext):
+    def given_I_asked_for_three_messages_concurrently(self):
+        self.tasks = [asyncio.async(self.queue.get(), loop=self.loop) for _ in range(3)]
+        self.tick()
+
+    def when_the_replies_arrive(self):
+        send_get_ok(self, 1, 'first')
+        self.server.send_method(self.channel.id, spec.BasicGetEmpty(''))
+        send_get_ok(self, 2, 'second')
+        self.tick()
+
+    def it_should_match_the_replies_to_the_requests_in_order(self):
+        results = [t.result() for t in self.tasks]
+        assert results[0].body == b'first'
+        assert results[1] is None
+        assert results[2].body == b'second'
+
+
+class WhenAMessageIsDeliveredWhileIAmGettingOne(ConsumerContext):
+    def given_I_asked_for_a_message(self):
+        self.task = asyncio.async(self.queue.get(), loop=self.loop)
+        self.tick()
+
+    def when_a_delivery_arrives_before_the_reply(self):
+        msg = asynqp.Message('delivered')
+        self.server.send_method(self.channel.id, spec.BasicDeliver('made.up.tag', 1, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        self.server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        self.server.send_frame(frames.ContentBodyFrame(self.channel.id, message.get_frame_payloads(msg, 100)[0]))
+        send_get_ok(self, 2, 'got')
+        self.tick()
+
+    def it_should_give_the_delivered_message_to_the_consumer(self):
+        assert self.callback.call_args[0][0].body == b'delivered'
+
+    def it_should_return_the_other_message_from_get(self):
+        assert self.task.result().body == b'got'
+
+
+class WhenIGetAnEmptyMessage(QueueContext):
+    def given_I_asked_for_a_message(self):
+        self.task = asyncio.async(self.queue.get(), loop=self.loop)
+        self.tick()
+
+    def when_a_message_with_no_body_arrives(self):
+        send_get_ok(self, 1, '')
+        self.tick()
+
+    def it_should_return_the_message(self):
+        assert self.task.result().body == b''
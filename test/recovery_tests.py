@@ -0,0 +1,245 @@
+import asyncio
+import asynqp
+from unittest import mock
+from asynqp import spec
+from asynqp import frames
+from asynqp import message
+from asynqp.recovery import Recovery
+from .base_contexts import OpenChannelContext
+from .util import MockServer, FakeTransport, read
+
+
+class RecoveryContext(OpenChannelContext):
+    def given_recovery_is_switched_on(self):
+        self.new_servers = []
+        self.recovery = Recovery(self.connection, self.reconnect, loop=self.loop)
+
+    @asyncio.coroutine
+    def reconnect(self, protocol_factory):
+        protocol = protocol_factory()
+        server = MockServer(protocol, self.tick)
+        protocol.connection_made(FakeTransport(server))
+        self.new_servers.append(server)
+        return protocol.transport, protocol
+
+    def lose_connection(self):
+        self.protocol.connection_lost(Exception())
+        self.tick()
+        self.tick()
+
+    def reconnect_to(self, server):
+        server.send_method(0, spec.ConnectionStart(0, 9, {}, 'PLAIN AMQPLAIN', 'en_US'))
+        server.send_method(0, spec.ConnectionTune(0, 131072, 600))
+        server.send_method(0, spec.ConnectionOpenOK(''))
+        for _ in range(4):  # the channels are resumed in tasks of their own
+            self.tick()
+
+    def declare(self, coro, reply):
+        task = asyncio.async(coro, loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, reply)
+        return task.result()
+
+    def deliver(self, server, tag, delivery_tag):
+        msg = asynqp.Message('body')
+        server.send_method(self.channel.id, spec.BasicDeliver(tag, delivery_tag, False, 'my.exchange', 'routing.key'))
+        header = message.get_header_payload(msg, spec.BasicGet.method_type[0])
+        server.send_frame(frames.ContentHeaderFrame(self.channel.id, header))
+        server.send_frame(frames.ContentBodyFrame(self.channel.id, message.get_frame_payloads(msg, 100)[0]))
+        self.tick()
+
+
+class TopologyContext(RecoveryContext):
+    def given_a_channel_with_a_topology(self):
+        self.declare(self.channel.set_qos(prefetch_count=10), spec.BasicQosOK())
+        self.exchange = self.declare(self.channel.declare_exchange('my.exchange', 'topic'), spec.ExchangeDeclareOK())
+        self.queue = self.declare(self.channel.declare_queue('my.queue'), spec.QueueDeclareOK('my.queue', 0, 0))
+        self.declare(self.queue.bind(self.exchange, 'routing.key'), spec.QueueBindOK())
+
+        self.callback = mock.Mock()
+        del self.callback._is_coroutine
+        self.consumer = self.declare(self.queue.consume(self.callback), spec.BasicConsumeOK('made.up.tag'))
+
+
+class WhenTheConnectionIsLost(TopologyContext):
+    def when_the_connection_is_lost_and_made_again(self):
+        self.lose_connection()
+        self.reconnect_to(self.new_servers[0])
+
+    def it_should_open_the_channel_and_replay_everything_without_waiting(self):
+        self.new_servers[0].should_have_received_methods(self.channel.id, [
+            spec.ChannelOpen(''),
+            spec.BasicQos(0, 10, False),
+            spec.ExchangeDeclare(0, 'my.exchange', 'topic', False, True, False, False, False, {}),
+            spec.QueueDeclare(0, 'my.queue', False, True, False, False, False, {}),
+            spec.QueueBind(0, 'my.queue', 'my.exchange', 'routing.key', False, {}),
+            spec.BasicConsume(0, 'my.queue', 'made.up.tag', False, False, False, False, {})
+        ])
+
+    def it_should_keep_the_channel_open(self):
+        assert not self.channel.closed.done()
+
+
+class WhenAMessageArrivesOnTheRecoveredConnection(TopologyContext):
+    def given_the_connection_was_recovered(self):
+        self.deliver(self.server, 'made.up.tag', 1)
+        self.old_message = self.callback.call_args[0][0]
+        self.lose_connection()
+        self.server = self.new_servers[0]
+        self.reconnect_to(self.server)
+        for reply in [spec.ChannelOpenOK(''), spec.BasicQosOK(), spec.ExchangeDeclareOK(),
+                      spec.QueueDeclareOK('my.queue', 0, 0), spec.QueueBindOK(), spec.BasicConsumeOK('made.up.tag')]:
+            self.server.send_method(self.channel.id, reply)
+        self.server.reset()
+
+    def when_a_message_arrives_and_both_messages_are_acked(self):
+        self.deliver(self.server, 'made.up.tag', 1)
+        self.new_message = self.callback.call_args[0][0]
+        self.old_message.ack()
+        self.new_message.ack()
+        self.tick()
+
+    def it_should_deliver_it_to_the_old_consumer(self):
+        assert self.callback.call_count == 2
+
+    def it_should_give_it_a_new_delivery_tag(self):
+        assert self.new_message.delivery_tag == 2
+
+    def it_should_only_ack_the_new_message(self):
+        self.server.should_have_received_method(self.channel.id, spec.BasicAck(1, False))
+        assert len(self.server.data) == 1
+
+
+class WhenAServerNamedQueueIsRecovered(RecoveryContext):
+    def given_a_server_named_queue_with_a_binding(self):
+        self.queue = self.declare(self.channel.declare_queue(exclusive=True), spec.QueueDeclareOK('amq.gen-old', 0, 0))
+        self.declare(self.queue.bind(self.channel.default_exchange, 'routing.key'), spec.QueueBindOK())
+        self.lose_connection()
+        self.server = self.new_servers[0]
+        self.reconnect_to(self.server)
+
+    def when_the_broker_names_the_queue(self):
+        self.server.send_method(self.channel.id, spec.ChannelOpenOK(''))
+        self.server.send_method(self.channel.id, spec.QueueDeclareOK('amq.gen-new', 0, 0))
+
+    def it_should_declare_it_with_no_name(self):
+        self.server.should_have_received_method(self.channel.id, spec.QueueDeclare(0, '', False, True, True, False, False, {}))
+
+    def it_should_rename_the_queue(self):
+        assert self.queue.name == 'amq.gen-new'
+
+    def it_should_bind_the_new_name(self):
+        self.server.should_have_received_method(self.channel.id, spec.QueueBind(0, 'amq.gen-new', '', 'routing.key', False, {}))
+
+
+class WhenSomethingWasDeletedBeforeTheConnectionWasLost(TopologyContext):
+    def given_the_consumer_was_cancelled_and_the_exchange_deleted(self):
+        self.declare(self.consumer.cancel(), spec.BasicCancelOK('made.up.tag'))
+        self.declare(self.exchange.delete(), spec.ExchangeDeleteOK())
+
+    def when_the_connection_is_lost_and_made_again(self):
+        self.lose_connection()
+        self.reconnect_to(self.new_servers[0])
+
+    def it_should_not_consume_again(self):
+        self.new_servers[0].should_not_have_received_method(
+            self.channel.id, spec.BasicConsume(0, 'my.queue', 'made.up.tag', False, False, False, False, {}))
+
+    def it_should_not_declare_the_exchange_or_binding_again(self):
+        methods = [spec.ExchangeDeclare(0, 'my.exchange', 'topic', False, True, False, False, False, {}),
+                   spec.QueueBind(0, 'my.queue', 'my.exchange', 'routing.key', False, {})]
+        for method in methods:
+            self.new_servers[0].should_not_have_received_method(self.channel.id, method)
+
+
+class WhenAQueueIsBoundTwice(TopologyContext):
+    def given_the_queue_was_bound_again(self):
+        self.declare(self.queue.bind(self.exchange, 'routing.key'), spec.QueueBindOK())
+
+    def when_the_connection_is_lost_and_made_again(self):
+        self.lose_connection()
+        self.reconnect_to(self.new_servers[0])
+
+    def it_should_only_bind_it_once(self):
+        bind = frames.MethodFrame(self.channel.id, spec.QueueBind(0, 'my.queue', 'my.exchange', 'routing.key', False, {}))
+        frames_sent = [read(x) for x in self.new_servers[0].data]
+        assert [f for f in frames_sent if f is not None].count(bind) == 1
+
+
+class WhenTheLastConsumerOfAnAutoDeleteQueueIsCancelled(RecoveryContext):
+    def given_an_auto_delete_queue_with_a_consumer(self):
+        self.queue = self.declare(self.channel.declare_queue('my.queue', auto_delete=True), spec.QueueDeclareOK('my.queue', 0, 0))
+        self.consumer = self.declare(self.queue.consume(lambda msg: None), spec.BasicConsumeOK('made.up.tag'))
+
+    def when_I_cancel_the_consumer(self):
+        self.declare(self.consumer.cancel(), spec.BasicCancelOK('made.up.tag'))
+
+    def it_should_forget_the_queue(self):
+        assert 'my.queue' not in self.channel.sender.topology.queues
+
+
+class WhenRecoveryIsSwitchedOff(OpenChannelContext):
+    def when_I_open_another_channel(self):
+        self.other = self.open_channel(2)
+
+    def it_should_not_remember_what_is_declared_on_the_channels(self):
+        assert self.channel.sender.topology is None
+        assert self.other.sender.topology is None
+
+
+class WhenAnOperationIsInProgressWhenTheConnectionIsLost(RecoveryContext):
+    def given_I_am_declaring_a_queue(self):
+        self.task = asyncio.async(self.channel.declare_queue('my.queue'), loop=self.loop)
+        self.tick()
+
+    def when_the_connection_is_lost(self):
+        self.lose_connection()
+
+    def it_should_fail(self):
+        assert isinstance(self.task.exception(), ConnectionError)
+
+    def it_should_keep_the_channel_open(self):
+        assert not self.channel.closed.done()
+
+
+class WhenTheApplicationClosesTheConnectionWhileReconnecting(RecoveryContext):
+    def given_the_connection_was_lost(self):
+        self.lose_connection()
+
+    def when_I_close_the_connection(self):
+        self.async_partial(self.connection.close())
+
+    def it_should_stop_reconnecting(self):
+        assert self.recovery.task.cancelled()
+
+    def it_should_close_the_channel(self):
+        assert self.channel.closed.done()
+
+
+class WhenTheRecoveredConnectionIsLost(RecoveryContext):
+    def given_the_connection_was_lost_during_the_handshake(self):
+        self.lose_connection()
+        self.first_attempt = self.new_servers[0]
+
+    def when_the_new_connection_is_lost_too(self):
+        self.first_attempt.protocol.connection_lost(Exception())
+        self.tick()
+
+    def it_should_close_it(self):
+        assert self.first_attempt.protocol.transport.closed
+
+    def it_should_try_again_later(self):
+        assert not self.recovery.task.done()
+        assert len(self.new_servers) == 1
+
+
+class WhenCalculatingTheDelayBeforeTheNextAttempt(RecoveryContext):
+    def when_there_have_been_failures(self):
+        self.recovery.max_delay = 1
+        self.delays = [self.recovery.backoff(n) for n in (1, 10)]
+
+    def it_should_grow_exponentially(self):
+        assert 0 <= self.delays[0] <= 0.2
+
+    def it_should_not_exceed_the_maximum(self):
+        assert 0 <= self.delays[1] <= 1
@@ -18,6 +18,23 @@ class WhenParsingATable:
         assert self.result == expected
 
 
+class WhenPackingAndUnpackingATable:
+    @classmethod
+    def examples_of_tables(self):
+        yield {'key': 'hello'}
+        yield {'flag': True, 'other': False}
+        yield {'x-message-ttl': 60000, 'negative': -5}
+        yield {'big': 2**40}
+        yield {'ratio': 0.5}
+        yield {'nested': {'x-max-length': 10}}
+
+    def because_we_pack_and_read_the_table(self, table):
+        self.result = serialisation.read_table(BytesIO(serialisation.pack_table(table)))
+
+    def it_should_round_trip(self, table):
+        assert self.result == table
+
+
 class WhenParsingABadTable:
     @classmethod
     def examples_of_bad_tables(self):
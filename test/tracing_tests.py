@@ -0,0 +1,63 @@
+import asyncio
+import contexts
+from asynqp import frames
+from asynqp import spec
+from asynqp.tracing import RingBufferTracer, TracedFrame
+from .base_contexts import OpenChannelContext
+from .util import any
+
+
+class TracerContext(OpenChannelContext):
+    def given_a_tracer(self):
+        self.tracer = RingBufferTracer(size=10)
+        self.connection.set_tracer(self.tracer)
+
+
+class WhenAMethodIsSentAndAnswered(TracerContext):
+    def when_I_set_the_qos(self):
+        task = asyncio.async(self.channel.set_qos(prefetch_count=10), loop=self.loop)
+        self.tick()
+        self.server.send_method(self.channel.id, spec.BasicQosOK())
+        task.result()
+
+    def it_should_trace_the_frames_in_order(self):
+        sent_size = len(frames.MethodFrame(self.channel.id, spec.BasicQos(0, 10, False)).serialise())
+        received_size = len(frames.MethodFrame(self.channel.id, spec.BasicQosOK()).serialise())
+        assert self.tracer.records() == [
+            TracedFrame('sent', self.channel.id, spec.FRAME_METHOD, 'BasicQos', sent_size, any(float)),
+            TracedFrame('received', self.channel.id, spec.FRAME_METHOD, 'BasicQosOK', received_size, any(float)),
+            TracedFrame('dispatched', self.channel.id, spec.FRAME_METHOD, 'BasicQosOK', None, any(float)),
+        ]
+
+    def it_should_format_them_as_a_table(self):
+        lines = self.tracer.format().splitlines()
+        assert len(lines) == 3
+        assert lines[0].split()[1:5] == ['sent', str(self.channel.id), 'method', 'BasicQos']
+
+
+class WhenTheRingBufferIsFull(TracerContext):
+    def when_eleven_heartbeats_arrive(self):
+        for _ in range(11):
+            self.server.send_frame(frames.HeartbeatFrame())
+
+    def it_should_keep_the_most_recent_ones(self):
+        assert len(self.tracer.records()) == 10
+
+
+class WhenTheTracerIsDetached(TracerContext):
+    def given_the_tracer_was_detached(self):
+        self.connection.set_tracer(None)
+
+    def when_a_frame_arrives(self):
+        self.server.send_frame(frames.HeartbeatFrame())
+
+    def it_should_not_trace_it(self):
+        assert self.tracer.records() == []
+
+
+class WhenTheRingBufferSizeIsInvalid:
+    def when_I_make_an_empty_one(self):
+        self.exception = contexts.catch(RingBufferTracer, 0)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)
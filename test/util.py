@@ -82,6 +82,11 @@ def read(data):
     return result[0]
 
 
+def publishes_received_by(server):
+    frames = (read(data) for data in server.data)
+    return [f for f in frames if f is not None and isinstance(f.payload, asynqp.spec.BasicPublish)]
+
+
 def windows(l, size):
     return zip(*[l[x:] for x in range(size)])
 
@@ -90,10 +95,14 @@ class FakeTransport(object):
     def __init__(self, server):
         self.server = server
         self.closed = False
+        self.buffer_size = 0
 
     def write(self, data):
         self.server.data.append(data)
 
+    def get_write_buffer_size(self):
+        return self.buffer_size
+
     def close(self):
         self.closed = True
 
@@ -0,0 +1,202 @@
+import asyncio
+import contexts
+import asynqp
+from unittest import mock
+from asynqp import spec
+from asynqp import frames
+from asynqp import message
+from asynqp import workers
+from .base_contexts import OpenConnectionContext
+
+
+class WorkerContext(OpenConnectionContext):
+    def given_a_worker_which_consumes_from_a_queue(self):
+        self.reports = []
+        self.stopping = asyncio.Future(loop=self.loop)
+        self.patch = mock.patch('asynqp.connect', self.connect)
+        self.patch.start()
+
+    def cleanup_the_patch(self):
+        self.patch.stop()
+
+    @asyncio.coroutine
+    def connect(self, *args, **kwargs):
+        return self.connection
+
+    @asyncio.coroutine
+    def consume(self, channel):
+        queue = yield from channel.declare_queue('my.queue')
+        yield from queue.consume(lambda msg: msg.ack())
+
+    def start_worker(self):
+        self.task = asyncio.async(workers.consume_until_stopped(self.loop, self.consume, 10, (), {}, self.stopping,
+                                                                self.reports.append, 60), loop=self.loop)
+        self.tick()
+        self.server.send_method(1, spec.ChannelOpenOK(''))
+        self.server.send_method(1, spec.BasicQosOK())
+        self.server.send_method(1, spec.QueueDeclareOK('my.queue', 0, 0))
+        self.server.send_method(1, spec.BasicConsumeOK('made.up.tag'))
+
+
+class WhenAWorkerStarts(WorkerContext):
+    def when_the_worker_starts(self):
+        self.start_worker()
+
+    def it_should_set_the_prefetch_count(self):
+        self.server.should_have_received_method(1, spec.BasicQos(0, 10, False))
+
+    def it_should_start_consuming(self):
+        assert not self.task.done()
+
+
+class WhenAWorkerIsStopped(WorkerContext):
+    def given_a_running_worker(self):
+        self.start_worker()
+        self.server.reset()
+
+    def when_the_worker_is_asked_to_stop(self):
+        self.stopping.set_result(None)
+        self.tick()
+        self.server.send_method(1, spec.BasicCancelOK('made.up.tag'))
+        self.tick()
+        self.server.send_method(1, spec.ChannelCloseOK())
+        self.server.send_method(0, spec.ConnectionCloseOK())
+        self.tick()
+
+    def it_should_cancel_the_consumer_before_closing(self):
+        self.server.should_have_received_methods(1, [spec.BasicCancel('made.up.tag', False),
+                                                     spec.ChannelClose(0, 'Channel closed by application', 0, 0)])
+
+    def it_should_close_the_connection(self):
+        self.server.should_have_received_method(0, spec.ConnectionClose(0, 'Connection closed by application', 0, 0))
+
+    def it_should_finish(self):
+        assert self.task.done()
+
+    def it_should_report_its_stats(self):
+        assert self.reports[-1]['delivered'] == 0
+
+
+class WhenAWorkerIsStoppedWhileACoroutineCallbackIsRunning(WorkerContext):
+    def given_a_callback_which_is_still_handling_a_message(self):
+        self.handled = asyncio.Future(loop=self.loop)
+        self.start_worker()
+        msg = asynqp.Message('body')
+        self.server.send_method(1, spec.BasicDeliver('made.up.tag', 1, False, 'my.exchange', 'routing.key'))
+        self.server.send_frame(frames.ContentHeaderFrame(1, message.get_header_payload(msg, spec.BasicGet.method_type[0])))
+        self.server.send_frame(frames.ContentBodyFrame(1, message.get_frame_payloads(msg, 100)[0]))
+        self.server.reset()
+
+    @asyncio.coroutine
+    def consume(self, channel):
+        queue = yield from channel.declare_queue('my.queue')
+        yield from queue.consume(self.handle)
+
+    @asyncio.coroutine
+    def handle(self, msg):
+        yield from self.handled
+        msg.ack()
+
+    def when_the_worker_is_asked_to_stop_before_the_callback_finishes(self):
+        self.stopping.set_result(None)
+        self.tick()
+        self.server.send_method(1, spec.BasicCancelOK('made.up.tag'))
+        self.tick()
+        self.handled.set_result(None)
+        for _ in range(5):
+            self.tick()
+
+    def it_should_ack_the_message_before_closing_the_channel(self):
+        self.server.should_have_received_methods(1, [spec.BasicCancel('made.up.tag', False),
+                                                     spec.BasicAck(1, False),
+                                                     spec.ChannelClose(0, 'Channel closed by application', 0, 0)])
+
+
+class SupervisorContext:
+    def given_a_supervisor_with_two_workers(self):
+        self.context = mock.Mock()
+        self.context.Pipe.side_effect = lambda duplex: (mock.Mock(**{'poll.return_value': False}), mock.Mock())
+        self.context.Process.side_effect = lambda **kwargs: mock.Mock(**{'is_alive.return_value': True})
+        self.supervisor = workers.Supervisor(mock.Mock(), ('consume',), 2, restart_delay=0, context=self.context)
+        self.supervisor.start()
+
+
+class WhenAWorkerCrashes(SupervisorContext):
+    def given_a_worker_which_has_reported_stats(self):
+        self.supervisor.stats[0] = {'delivered': 5}
+        self.supervisor.stats[1] = {'delivered': 3}
+        self.crashed = self.supervisor.workers[0]
+        self.crashed.process.is_alive.return_value = False
+
+    def when_the_supervisor_checks_on_the_workers(self):
+        self.supervisor.restart_crashed()
+
+    def it_should_start_a_new_process(self):
+        assert self.context.Process.call_count == 3
+        assert self.supervisor.workers[0] is not self.crashed
+        self.supervisor.workers[0].process.start.assert_called_once_with()
+
+    def it_should_count_the_restart(self):
+        assert self.supervisor.restarts == 1
+
+    def it_should_keep_the_crashed_workers_stats(self):
+        assert self.supervisor.totals() == {'workers': 2, 'restarts': 1, 'delivered': 8}
+
+
+class WhenACrashedWorkersPipeIsAtEOF(SupervisorContext):
+    def given_a_crashed_worker_whose_pipe_has_been_read_to_the_end(self):
+        self.supervisor.restart_delay = 60
+        self.crashed = self.supervisor.workers[0]
+        self.crashed.process.is_alive.return_value = False
+        self.crashed.stats_pipe.poll.return_value = True
+        self.crashed.stats_pipe.recv.side_effect = EOFError
+        self.waited_on = []
+        self.patch = mock.patch('multiprocessing.connection.wait', self.wait)
+        self.patch.start()
+
+    def wait(self, pipes, timeout):
+        self.waited_on.append(pipes)
+        return [p for p in pipes if p is self.crashed.stats_pipe]
+
+    def when_the_supervisor_collects_stats_twice(self):
+        self.supervisor.collect_stats(timeout=1)
+        self.supervisor.collect_stats(timeout=1)
+
+    def it_should_stop_waiting_on_the_pipe(self):
+        assert self.crashed.stats_pipe in self.waited_on[0]
+        assert self.waited_on[1] == [self.supervisor.workers[1].stats_pipe]
+
+    def cleanup_the_patch(self):
+        self.patch.stop()
+
+
+class WhenAWorkerCrashesWhileStopping(SupervisorContext):
+    def given_the_supervisor_is_stopping(self):
+        self.supervisor.stopping = True
+        self.supervisor.workers[0].process.is_alive.return_value = False
+
+    def when_the_supervisor_checks_on_the_workers(self):
+        self.supervisor.restart_crashed()
+
+    def it_should_not_restart_the_worker(self):
+        assert self.context.Process.call_count == 2
+
+
+class WhenTheSupervisorStops(SupervisorContext):
+    def when_I_stop_the_supervisor(self):
+        for worker in self.supervisor.workers:
+            worker.process.join.side_effect = lambda timeout, process=worker.process: setattr(process.is_alive, 'return_value', False)
+        self.supervisor.stop(10)
+
+    def it_should_ask_every_worker_to_shut_down(self):
+        for worker in self.supervisor.workers:
+            worker.process.terminate.assert_called_once_with()
+            assert worker.process.join.called
+
+
+class WhenIRunNoWorkers:
+    def when_I_run_zero_processes(self):
+        self.exception = contexts.catch(workers.run, asynqp.connect, 0)
+
+    def it_should_throw_ValueError(self):
+        assert isinstance(self.exception, ValueError)